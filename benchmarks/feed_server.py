@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Serveur HTTP local de flux synthétiques pour les benchmarks d'ingestion.
+
+    python benchmarks/feed_server.py --port 8800 --latency-ms 50 --error-ratio 0.02
+
+Chaque flux /feed/<n> est déterministe (RSS 2.0 ou Atom selon n) et
+comporte ses `entries` entrées les plus récentes. Le serveur simule :
+  - une latence (moyenne + aléa) par requête ;
+  - des GET conditionnels : une partie des flux envoie un ETag et répond
+    304 tant que rien n'a changé, les autres n'envoient aucun validateur ;
+  - des erreurs (500, 404, 429 avec Retry-After) sur une fraction des flux ;
+  - des documents volumineux (large_entries entrées) sur une autre fraction.
+
+POST /_advance publie de nouvelles entrées (new_per_advance chacun) dans
+une fraction update_ratio des flux, pour simuler le cycle suivant.
+"""
+import argparse
+import random
+import threading
+import time
+from dataclasses import dataclass, asdict
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+
+EPOCH = 1_700_000_000  # date de la première entrée (timestamp)
+ENTRY_SPACING = 3600  # une entrée par heure et par flux
+
+
+@dataclass
+class ServerConfig:
+    feeds: int = 1000
+    entries: int = 20  # entrées par document
+    large_ratio: float = 0.01  # part des flux volumineux
+    large_entries: int = 2000
+    etag_ratio: float = 0.5  # part des flux qui envoient un ETag (et des 304)
+    error_ratio: float = 0.02  # part des flux en erreur
+    latency_ms: float = 20.0
+    jitter_ms: float = 20.0
+    new_per_advance: int = 2
+    update_ratio: float = 0.2  # part des flux qui publient à chaque /_advance
+    content_bytes: int = 400  # taille du résumé de chaque entrée
+
+
+def _fraction(n: int, salt: int) -> float:
+    # Sélection stable d'une fraction des flux, indépendante d'un critère à l'autre
+    return random.Random(n * 7919 + salt).random()
+
+
+class FeedServer:
+    def __init__(self, config: ServerConfig, host: str = "127.0.0.1", port: int = 0):
+        self.config = config
+        self.generation = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                server._handle(self)
+
+            def do_POST(self):
+                if self.path == "/_advance":
+                    with server._lock:
+                        server.generation += 1
+                    self._reply(204)
+                else:
+                    self._reply(404)
+
+            def _reply(self, status, body=b"", headers=()):
+                self.send_response(status)
+                for k, v in headers:
+                    self.send_header(k, v)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def feed_url(self, n: int) -> str:
+        return f"{self.base_url}/feed/{n}"
+
+    def start(self) -> "FeedServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def advance(self) -> None:
+        with self._lock:
+            self.generation += 1
+
+    # ========= Réponses =========
+    def _handle(self, handler) -> None:
+        cfg = self.config
+        with self._lock:
+            self.requests += 1
+            generation = self.generation
+        delay = max(cfg.latency_ms + random.uniform(-cfg.jitter_ms, cfg.jitter_ms), 0) / 1000
+        if delay:
+            time.sleep(delay)
+
+        parts = handler.path.strip("/").split("/")
+        if len(parts) != 2 or parts[0] != "feed" or not parts[1].isdigit() or int(parts[1]) >= cfg.feeds:
+            handler._reply(404)
+            return
+        n = int(parts[1])
+
+        if _fraction(n, 1) < cfg.error_ratio:
+            status = (500, 404, 429)[n % 3]
+            handler._reply(status, headers=[("Retry-After", "3600")] if status == 429 else [])
+            return
+
+        generation = self.feed_generation(n, generation)
+        etag = f'"{n}-{generation}"'
+        with_etag = _fraction(n, 2) < cfg.etag_ratio
+        if with_etag and handler.headers.get("If-None-Match") == etag:
+            handler._reply(304, headers=[("ETag", etag)])
+            return
+
+        body, content_type = self.document(n, generation)
+        headers = [("Content-Type", content_type)]
+        if with_etag:
+            headers.append(("ETag", etag))
+        handler._reply(200, body, headers)
+
+    def feed_generation(self, n: int, generation: int) -> int:
+        """Nombre de publications du flux `n` après `generation` appels à /_advance"""
+        return sum(1 for g in range(1, generation + 1) if _fraction(n, 100 + g) < self.config.update_ratio)
+
+    def document(self, n: int, generation: int) -> Tuple[bytes, str]:
+        cfg = self.config
+        count = cfg.large_entries if _fraction(n, 3) < cfg.large_ratio else cfg.entries
+        newest = count + generation * cfg.new_per_advance  # index de l'entrée la plus récente
+        filler = ("Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * (cfg.content_bytes // 56 + 1))[:cfg.content_bytes]
+        atom = n % 4 == 3
+        items = []
+        for i in range(newest - 1, newest - 1 - count, -1):
+            published = EPOCH + i * ENTRY_SPACING
+            link = f"https://bench.example/{n}/{i}"
+            if atom:
+                stamp = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(published))
+                items.append(
+                    f"<entry><title>Flux {n} entrée {i}</title><link href=\"{link}\"/>"
+                    f"<id>{link}</id><updated>{stamp}</updated>"
+                    f"<summary type=\"html\">&lt;p&gt;{filler}&lt;/p&gt;</summary></entry>"
+                )
+            else:
+                items.append(
+                    f"<item><title>Flux {n} entrée {i}</title><link>{link}</link><guid>{link}</guid>"
+                    f"<pubDate>{formatdate(published, usegmt=True)}</pubDate>"
+                    f"<description>&lt;p&gt;{filler}&lt;/p&gt;</description></item>"
+                )
+        if atom:
+            doc = (
+                '<?xml version="1.0" encoding="utf-8"?><feed xmlns="http://www.w3.org/2005/Atom">'
+                f"<title>Flux {n}</title><subtitle>Flux synthétique</subtitle>{''.join(items)}</feed>"
+            )
+            return doc.encode(), "application/atom+xml; charset=utf-8"
+        doc = (
+            '<?xml version="1.0" encoding="utf-8"?><rss version="2.0"><channel>'
+            f"<title>Flux {n}</title><description>Flux synthétique</description>{''.join(items)}</channel></rss>"
+        )
+        return doc.encode(), "application/rss+xml; charset=utf-8"
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    defaults = ServerConfig()
+    for name, value in asdict(defaults).items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(value), default=value)
+
+
+def config_from_args(args: argparse.Namespace) -> ServerConfig:
+    return ServerConfig(**{name: getattr(args, name) for name in asdict(ServerConfig())})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8800)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server = FeedServer(config_from_args(args), args.host, args.port)
+    print(f"{args.feeds} flux sur {server.base_url}/feed/<0..{args.feeds - 1}> (POST /_advance : nouvelles entrées)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
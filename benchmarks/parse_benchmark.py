@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark du parsing des flux : chemin rapide (feed_parsing.parse_fast)
+contre feedparser, sur un corpus de flux réels.
+
+Usage :
+    python benchmarks/parse_benchmark.py corpus/            # fichiers .xml/.rss/.atom
+    python benchmarks/parse_benchmark.py --urls urls.txt    # une URL par ligne
+    python benchmarks/parse_benchmark.py corpus/ --repeat 20
+
+Pour chaque document, les deux chemins sont chronométrés et leurs
+entrées comparées (titre, lien, résumé, guid, date).
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from feed_parsing import parse_fast, parse_with_feedparser  # noqa: E402
+
+
+def load_corpus(paths, urls_file=None):
+    docs = []
+    for p in paths:
+        p = Path(p)
+        files = sorted(f for f in p.rglob("*") if f.is_file()) if p.is_dir() else [p]
+        docs.extend((str(f), f.read_bytes()) for f in files)
+    if urls_file:
+        import requests
+        for url in Path(urls_file).read_text().split():
+            try:
+                r = requests.get(url, timeout=20, headers={"User-Agent": "SUPRSS/1.0"})
+                r.raise_for_status()
+                docs.append((url, r.content))
+            except Exception as e:
+                print(f"  ignoré {url}: {e}")
+    return docs
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="fichiers ou dossiers de flux")
+    parser.add_argument("--urls", help="fichier contenant une URL de flux par ligne")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    docs = load_corpus(args.paths, args.urls)
+    if not docs:
+        parser.error("corpus vide")
+
+    total_fast = total_slow = 0.0
+    fallbacks = mismatches = entries = 0
+    for name, content in docs:
+        slow_time, slow = timed(lambda: parse_with_feedparser(content), args.repeat)
+        try:
+            fast_time, fast = timed(lambda: parse_fast(content), args.repeat)
+        except Exception as e:
+            # En production ce document passerait par feedparser
+            fallbacks += 1
+            fast_time = slow_time
+            print(f"{os.path.basename(name)[:40]:40} repli feedparser ({type(e).__name__}: {e})")
+        else:
+            diff = sum(1 for a, b in zip(fast.entries, slow.entries) if a != b)
+            diff += abs(len(fast.entries) - len(slow.entries))
+            mismatches += diff
+            print(
+                f"{os.path.basename(name)[:40]:40} {len(slow.entries):4d} entrées  "
+                f"feedparser {slow_time * 1000:8.2f} ms  rapide {fast_time * 1000:8.2f} ms  "
+                f"x{slow_time / fast_time:5.1f}  écarts {diff}"
+            )
+        total_slow += slow_time
+        total_fast += fast_time
+        entries += len(slow.entries)
+
+    print()
+    print(f"Documents : {len(docs)} ({fallbacks} repli(s) feedparser), entrées : {entries}")
+    print(f"feedparser : {total_slow * 1000:.1f} ms   chemin rapide (avec replis) : {total_fast * 1000:.1f} ms")
+    print(f"Accélération : x{total_slow / total_fast:.1f}   entrées divergentes : {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
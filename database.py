@@ -1,4 +1,5 @@
 import os
+from sqlalchemy import inspect, literal, text
 from sqlmodel import create_engine, SQLModel
 from models import User, Collection, Feed
 
@@ -27,6 +28,32 @@ else:
 def create_db_and_tables():
     """Créer toutes les tables de la base de données"""
     SQLModel.metadata.create_all(engine)
+    upgrade_schema()
+
+def upgrade_schema():
+    """
+    create_all ne modifie pas les tables existantes : ajoute les colonnes
+    et index déclarés dans les modèles mais absents de la base.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column.type.compile(dialect=engine.dialect)}'
+                if column.default is not None and column.default.is_scalar:
+                    value = literal(column.default.arg, column.type).compile(
+                        dialect=engine.dialect, compile_kwargs={"literal_binds": True}
+                    )
+                    ddl += f" DEFAULT {value}"
+                conn.execute(text(ddl))
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
 
 def get_database_url():
     """Retourner l'URL de la base de données actuelle"""
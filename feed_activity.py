@@ -0,0 +1,74 @@
+# feed_activity.py
+"""
+Activité des lecteurs par flux, pour ordonner les flux échus quand un
+cycle d'ingestion ne peut pas tout traiter dans son budget : les flux lus
+tous les jours passent avant ceux que personne n'ouvre plus.
+
+Le score combine les lectures et favoris sur les articles récents du flux
+(ingérés depuis moins de ACTIVITY_WINDOW_DAYS jours) et le nombre de
+membres des collections qui le suivent (source partagée, cf.
+feed_sources.py). Il est recalculé périodiquement et stocké dans
+Feed.activity_score de la source, pour que la réservation des lots reste
+une simple requête triée.
+"""
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from sqlmodel import Session, select, update, func
+
+from database import engine
+from models import Article, ArticleReadFlag, ArticleStar, CollectionMember, Feed
+from feed_sources import SOURCE_ID
+
+ACTIVITY_WINDOW_DAYS = int(os.getenv("FEED_ACTIVITY_WINDOW_DAYS", "30"))  # articles pris en compte
+ACTIVITY_INTERVAL = int(os.getenv("FEED_ACTIVITY_INTERVAL", "3600"))  # secondes entre deux recalculs
+READ_WEIGHT = 1.0
+STAR_WEIGHT = 3.0  # un favori compte plus qu'une lecture
+MEMBER_WEIGHT = 2.0  # par membre de la collection, propriétaire compris
+
+
+def _per_feed(session: Session, flag_model, cutoff: datetime) -> Dict[int, int]:
+    rows = session.exec(
+        select(Article.feed_id, func.count(flag_model.id))
+        .join(Article, Article.id == flag_model.article_id)
+        .where(Article.fetched_at >= cutoff)
+        .group_by(Article.feed_id)
+    ).all()
+    return dict(rows)
+
+
+def compute_scores(session: Session, now: Optional[datetime] = None) -> Dict[int, float]:
+    """Score d'activité de chaque source"""
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(days=ACTIVITY_WINDOW_DAYS)
+    reads = _per_feed(session, ArticleReadFlag, cutoff)
+    stars = _per_feed(session, ArticleStar, cutoff)
+    members = Counter(dict(session.exec(
+        select(CollectionMember.collection_id, func.count(CollectionMember.id)).group_by(CollectionMember.collection_id)
+    ).all()))
+    # Lecteurs potentiels d'une source : membres de toutes les collections abonnées
+    readers = Counter()
+    for source_id, collection_id in session.exec(select(SOURCE_ID, Feed.collection_id)).all():
+        readers[source_id] += 1 + members[collection_id]
+    return {
+        source_id: READ_WEIGHT * reads.get(source_id, 0) + STAR_WEIGHT * stars.get(source_id, 0) + MEMBER_WEIGHT * count
+        for source_id, count in readers.items()
+    }
+
+
+def update_activity_scores(now: Optional[datetime] = None) -> int:
+    """Recalcule Feed.activity_score ; retourne le nombre de flux dont le score a changé"""
+    with Session(engine) as session:
+        scores = compute_scores(session, now)
+        current = dict(session.exec(select(Feed.id, Feed.activity_score)).all())
+        changed = [
+            {"id": feed_id, "activity_score": score}
+            for feed_id, score in scores.items()
+            if current.get(feed_id) != score
+        ]
+        if changed:
+            session.execute(update(Feed), changed)  # UPDATE groupé par clé primaire
+            session.commit()
+        return len(changed)
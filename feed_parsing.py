@@ -0,0 +1,282 @@
+# feed_parsing.py
+"""
+Parsing des documents RSS/Atom en tuples compacts, éventuellement dans un
+pool de processus pour ne pas prendre le GIL du processus de l'API.
+
+Ce module ne doit importer ni la base ni l'application : il est rechargé
+dans chaque processus du pool.
+"""
+import io
+import os
+import calendar
+import threading
+import multiprocessing
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import feedparser
+
+# Le parseur rapide réutilise des fonctions internes de feedparser 6.0 (dates,
+# nettoyage HTML) : si une autre version ne les fournit plus, tout passe par
+# parse_with_feedparser
+try:
+    from feedparser.datetimes import _parse_date
+    from feedparser.sanitizer import _sanitize_html
+    from feedparser.urls import resolve_relative_uris
+    _FEEDPARSER_INTERNALS = True
+except ImportError:
+    _FEEDPARSER_INTERNALS = False
+
+PARSE_WORKERS = int(os.getenv("FEED_PARSE_WORKERS", "0"))  # 0 : parsing dans le processus courant
+FAST_PARSER = (  # RSS 2.0 / Atom bien formés sans feedparser
+    os.getenv("FEED_FAST_PARSER", "1") == "1" and _FEEDPARSER_INTERNALS
+)
+
+
+class ParsedEntry(NamedTuple):
+    title: str
+    link: str
+    summary: str
+    guid: Optional[str]
+    published: Optional[float]  # timestamp UTC
+
+
+class ParsedFeed(NamedTuple):
+    title: Optional[str]
+    description: Optional[str]
+    meta: Dict[str, str]  # ttl, sy_updateperiod, sy_updatefrequency, hub, self (WebSub)
+    entries: List[ParsedEntry]
+
+
+_META_KEYS = ("ttl", "sy_updateperiod", "sy_updatefrequency")
+_LINK_RELS = ("hub", "self")  # découverte WebSub
+
+
+def _timestamp(value: Optional[str]) -> Optional[float]:
+    # Même analyse des dates que feedparser (RFC 822, ISO 8601 et variantes)
+    t = _parse_date(value) if value else None
+    return float(calendar.timegm(t)) if t else None
+
+
+class InvalidFeed(ValueError):
+    """Le document n'est pas un flux (page HTML, JSON, contenu tronqué...)"""
+
+
+def parse_with_feedparser(content: bytes, headers: Optional[Dict[str, str]] = None) -> ParsedFeed:
+    """Chemin tolérant : feedparser complet (RSS 0.9x/1.0, documents mal formés...)"""
+    d = feedparser.parse(content, response_headers=headers or {})
+    if not d.get("version") and not d.entries:
+        raise InvalidFeed("Document non reconnu comme flux RSS/Atom")
+    entries = []
+    for e in d.entries:
+        t = e.get("published_parsed") or e.get("updated_parsed")
+        entries.append(ParsedEntry(
+            title=e.get("title") or "(sans titre)",
+            link=e.get("link") or "",
+            summary=e.get("summary") or e.get("description") or "",
+            guid=e.get("id"),
+            published=float(calendar.timegm(t)) if t else None,
+        ))
+    feed = d.feed
+    meta = {k: feed[k] for k in _META_KEYS if feed.get(k)}
+    for link in feed.get("links") or ():
+        if link.get("rel") in _LINK_RELS and link.get("href"):
+            meta.setdefault(link["rel"], link["href"])
+    return ParsedFeed(
+        title=feed.get("title"),
+        description=feed.get("subtitle") or feed.get("description"),
+        meta=meta,
+        entries=entries,
+    )
+
+
+# ========= Chemin rapide (RSS 2.0 / Atom) =========
+_ATOM = "{http://www.w3.org/2005/Atom}"
+_SY = "{http://purl.org/rss/1.0/modules/syndication/}"
+_CONTENT_ENCODED = "{http://purl.org/rss/1.0/modules/content/}encoded"
+
+
+class UnsupportedFeed(Exception):
+    """Le document sort du cas simple : on laisse feedparser s'en charger"""
+
+
+def _text(el) -> str:
+    return (el.text or "").strip() if el is not None else ""
+
+
+def _links(parent, meta: Dict[str, str]) -> None:
+    for link in parent.findall(f"{_ATOM}link"):
+        rel = link.get("rel")
+        if rel in _LINK_RELS and link.get("href"):
+            meta.setdefault(rel, link.get("href"))
+
+
+def _absolute(link: str) -> str:
+    if link and not link.startswith(("http://", "https://")):
+        raise UnsupportedFeed("lien relatif")
+    return link
+
+
+def _clean_html(value: str, base: str) -> str:
+    # Même traitement que feedparser : liens relatifs résolus puis HTML assaini
+    if "<" not in value and "&" not in value:
+        return value
+    return _sanitize_html(resolve_relative_uris(value, base, "utf-8", "text/html"), "utf-8", "text/html")
+
+
+def _plain(value: str) -> str:
+    if "<" in value:
+        raise UnsupportedFeed("balisage dans un titre")
+    return value
+
+
+def _rss_item(item, base: str) -> ParsedEntry:
+    guid_el = item.find("guid")
+    guid = _text(guid_el) or None
+    link = _text(item.find("link"))
+    if not link and guid and (guid_el.get("isPermaLink") or "true").lower() != "false":
+        link = guid
+    summary = _text(item.find("description")) or _text(item.find(_CONTENT_ENCODED))
+    return ParsedEntry(
+        title=_plain(_text(item.find("title"))) or "(sans titre)",
+        link=_absolute(link),
+        summary=_clean_html(summary, base),
+        guid=guid,
+        published=_timestamp(_text(item.find("pubDate"))),
+    )
+
+
+def _atom_content(el, base: str) -> str:
+    if el is None:
+        return ""
+    kind = el.get("type", "text")
+    if kind == "xhtml" or len(el):
+        raise UnsupportedFeed("contenu xhtml")
+    value = _text(el)
+    return _clean_html(value, base) if kind == "html" else value
+
+
+def _atom_entry(entry, base: str) -> ParsedEntry:
+    title_el = entry.find(f"{_ATOM}title")
+    if title_el is not None and title_el.get("type", "text") != "text":
+        raise UnsupportedFeed("titre html")
+    link = ""
+    for l in entry.findall(f"{_ATOM}link"):
+        if l.get("rel", "alternate") == "alternate":
+            link = l.get("href", "")
+            break
+    summary = _atom_content(entry.find(f"{_ATOM}summary"), base) or _atom_content(entry.find(f"{_ATOM}content"), base)
+    return ParsedEntry(
+        title=_plain(_text(title_el)) or "(sans titre)",
+        link=_absolute(link),
+        summary=summary,
+        guid=_text(entry.find(f"{_ATOM}id")) or None,
+        published=_timestamp(_text(entry.find(f"{_ATOM}published")) or _text(entry.find(f"{_ATOM}updated"))),
+    )
+
+
+def parse_fast(content: bytes, base: str = "") -> ParsedFeed:
+    """
+    Lecture en flux (iterparse) des documents RSS 2.0 et Atom 1.0 : chaque
+    entrée est convertie puis libérée dès sa balise fermante. Lève
+    UnsupportedFeed ou ET.ParseError pour tout autre document.
+    """
+    entries: List[ParsedEntry] = []
+    meta: Dict[str, str] = {}
+    root = channel = None
+    kind = None
+    for event, el in ET.iterparse(io.BytesIO(content), events=("start", "end")):
+        if root is None:
+            root = el
+            if el.tag == "rss" and el.get("version", "2.0").startswith("2."):
+                kind = "rss"
+            elif el.tag == f"{_ATOM}feed":
+                kind = "atom"
+            else:
+                raise UnsupportedFeed(el.tag)
+            continue
+        if event == "start":
+            if kind == "rss" and el.tag == "channel":
+                channel = el
+            continue
+        if kind == "rss" and el.tag == "item":
+            entries.append(_rss_item(el, base))
+            el.clear()
+        elif kind == "atom" and el.tag == f"{_ATOM}entry":
+            entries.append(_atom_entry(el, base))
+            el.clear()
+
+    if kind == "rss":
+        if channel is None:
+            raise UnsupportedFeed("pas de <channel>")
+        title, description = _text(channel.find("title")), _text(channel.find("description"))
+        for key, tag in (("ttl", "ttl"), ("sy_updateperiod", f"{_SY}updatePeriod"), ("sy_updatefrequency", f"{_SY}updateFrequency")):
+            if _text(channel.find(tag)):
+                meta[key] = _text(channel.find(tag))
+        _links(channel, meta)
+    else:
+        title, description = _text(root.find(f"{_ATOM}title")), _text(root.find(f"{_ATOM}subtitle"))
+        _links(root, meta)
+    return ParsedFeed(title=title or None, description=description or None, meta=meta, entries=entries)
+
+
+def _declares_utf8(content: bytes, headers: Dict[str, str]) -> bool:
+    # Sans déclaration XML, expat suppose UTF-8 : un autre charset HTTP passe par feedparser
+    if content.lstrip()[:5] == b"<?xml" and b"encoding" in content[:200]:
+        return True
+    charset = headers.get("content-type", "").lower().partition("charset=")[2].strip(" \"'")
+    return charset in ("", "utf-8", "utf8", "us-ascii")
+
+
+def parse_document(content: bytes, headers: Optional[Dict[str, str]] = None) -> ParsedFeed:
+    """Chemin rapide si possible, feedparser sinon"""
+    headers = headers or {}
+    if FAST_PARSER and _declares_utf8(content, headers):
+        try:
+            return parse_fast(content, headers.get("content-location", ""))
+        except Exception:
+            pass
+    return parse_with_feedparser(content, headers)
+
+
+# ========= Pool de processus =========
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> Optional[ProcessPoolExecutor]:
+    global _pool
+    if PARSE_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # "spawn" : pas de fork d'un processus qui a déjà des threads (scheduler, uvicorn)
+            _pool = ProcessPoolExecutor(
+                max_workers=PARSE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def parse_documents(documents: List[Tuple[bytes, Dict[str, str]]]) -> List[ParsedFeed]:
+    """Parse une liste de (contenu, en-têtes), en parallèle si FEED_PARSE_WORKERS > 0"""
+    pool = _get_pool()
+    if pool is None:
+        return [parse_document(content, headers) for content, headers in documents]
+    try:
+        futures = [pool.submit(parse_document, content, headers) for content, headers in documents]
+        return [f.result() for f in futures]
+    except BrokenProcessPool:
+        # Un worker est mort (mémoire, signal...) : on recrée le pool au prochain appel
+        shutdown_pool()
+        return [parse_document(content, headers) for content, headers in documents]
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
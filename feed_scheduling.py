@@ -0,0 +1,146 @@
+# feed_scheduling.py
+"""
+Planification adaptative des flux : calcul de next_fetch_at à partir du
+rythme de publication observé et des indications du serveur (<ttl>,
+sy:updatePeriod, Cache-Control, Retry-After), avec backoff exponentiel
+en cas d'erreur et un peu d'aléa pour étaler la charge.
+"""
+import os
+import re
+import random
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from statistics import median
+from typing import Dict, Optional
+
+MIN_INTERVAL = int(os.getenv("FEED_MIN_INTERVAL", "600"))  # 10 minutes
+MAX_INTERVAL = int(os.getenv("FEED_MAX_INTERVAL", "86400"))  # 24 heures
+MAX_BACKOFF = int(os.getenv("FEED_MAX_BACKOFF", "86400"))  # plafond du backoff après erreurs
+PUSH_POLL_INTERVAL = int(os.getenv("FEED_WEBSUB_POLL_INTERVAL", "86400"))  # polling de secours des flux en push
+QUARANTINE_AFTER = int(os.getenv("FEED_QUARANTINE_AFTER", "10"))  # échecs consécutifs avant quarantaine
+QUARANTINE_INTERVAL = int(os.getenv("FEED_QUARANTINE_INTERVAL", str(7 * 86400)))  # un essai par semaine
+JITTER = 0.1  # ±10 %
+
+_SY_PERIODS = {
+    "hourly": 3600,
+    "daily": 86400,
+    "weekly": 7 * 86400,
+    "monthly": 30 * 86400,
+    "yearly": 365 * 86400,
+}
+_MAX_AGE = re.compile(r"max-age\s*=\s*(\d+)", re.I)
+
+
+def _clamp(seconds: float, low: int = MIN_INTERVAL, high: int = MAX_INTERVAL) -> int:
+    return int(min(max(seconds, low), high))
+
+
+def jittered(seconds: float) -> float:
+    return seconds * random.uniform(1 - JITTER, 1 + JITTER)
+
+
+# ========= Signaux =========
+def observed_interval(entries) -> Optional[float]:
+    """Écart médian (secondes) entre les dates de publication des entrées récentes"""
+    stamps = sorted({e.published for e in entries if e.published}, reverse=True)[:20]
+    if len(stamps) < 2:
+        return None
+    return median(a - b for a, b in zip(stamps, stamps[1:]))
+
+
+def hinted_interval(feed_meta, headers: Dict[str, str]) -> Optional[int]:
+    """Intervalle minimal demandé par l'éditeur (<ttl>, sy:updatePeriod) ou le serveur (max-age)"""
+    hints = []
+    try:
+        if feed_meta.get("ttl"):
+            hints.append(int(feed_meta["ttl"]) * 60)
+    except ValueError:
+        pass
+    period = (feed_meta.get("sy_updateperiod") or "").strip().lower()
+    if period in _SY_PERIODS:
+        try:
+            frequency = max(int(feed_meta.get("sy_updatefrequency") or 1), 1)
+        except ValueError:
+            frequency = 1
+        hints.append(_SY_PERIODS[period] // frequency)
+    m = _MAX_AGE.search(headers.get("cache-control", ""))
+    if m:
+        hints.append(int(m.group(1)))
+    return max(hints) if hints else None
+
+
+def retry_after(headers: Dict[str, str], now: datetime) -> Optional[datetime]:
+    """Date indiquée par Retry-After (secondes ou date HTTP)"""
+    value = (headers.get("retry-after") or "").strip()
+    if not value:
+        return None
+    if value.isdigit():
+        return now + timedelta(seconds=int(value))
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is not None:
+        when = when.astimezone(timezone.utc).replace(tzinfo=None)
+    return when
+
+
+# ========= Planification =========
+def schedule_success(
+    previous_interval: Optional[int],
+    entries,
+    feed_meta,
+    headers: Dict[str, str],
+    now: datetime,
+    push_active: bool = False,
+) -> Dict[str, object]:
+    """
+    Après un 200/304 : environ deux passages par intervalle de publication
+    observé. Un flux reçu en push (WebSub) n'est plus interrogé que par
+    sécurité, tous les PUSH_POLL_INTERVAL.
+    """
+    interval = previous_interval or MIN_INTERVAL
+    observed = observed_interval(entries) if entries else None
+    if observed:
+        interval = observed / 2
+    hint = hinted_interval(feed_meta or {}, headers)
+    if hint:
+        interval = max(interval, hint)
+    interval = _clamp(interval)
+
+    next_fetch_at = now + timedelta(seconds=jittered(max(interval, PUSH_POLL_INTERVAL) if push_active else interval))
+    server_retry = retry_after(headers, now)
+    if server_retry and server_retry > next_fetch_at:
+        next_fetch_at = server_retry
+    return {"fetch_interval": interval, "next_fetch_at": next_fetch_at, "consecutive_failures": 0}
+
+
+def health_status(failures: int) -> str:
+    """ok, failing (erreurs récentes, backoff) ou quarantined (flux considéré comme mort)"""
+    if not failures:
+        return "ok"
+    return "quarantined" if failures >= QUARANTINE_AFTER else "failing"
+
+
+def schedule_failure(
+    previous_interval: Optional[int],
+    failures: int,
+    headers: Dict[str, str],
+    now: datetime,
+) -> Dict[str, object]:
+    """
+    Après une erreur : backoff exponentiel à partir de l'intervalle habituel,
+    puis quarantaine (un essai tous les QUARANTINE_INTERVAL) au-delà de
+    QUARANTINE_AFTER échecs consécutifs. Un succès (rafraîchissement manuel
+    compris) remet le compteur à zéro.
+    """
+    failures += 1
+    base = previous_interval or MIN_INTERVAL
+    delay = min(base * 2 ** min(failures, 16), MAX_BACKOFF)
+    if health_status(failures) == "quarantined":
+        delay = QUARANTINE_INTERVAL
+    next_fetch_at = now + timedelta(seconds=jittered(delay))
+    server_retry = retry_after(headers, now)
+    if server_retry and server_retry > next_fetch_at:
+        next_fetch_at = server_retry
+    return {"next_fetch_at": next_fetch_at, "consecutive_failures": failures}
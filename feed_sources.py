@@ -0,0 +1,285 @@
+# feed_sources.py
+"""
+Sources de flux partagées : une URL n'est téléchargée et ses articles ne
+sont stockés qu'une fois, quel que soit le nombre de collections qui la
+suivent.
+
+Un Feed reste l'abonnement d'une collection (titre, description, id
+utilisé par l'API). Le premier abonnement à une URL est aussi sa source :
+source_id vide, c'est lui que le scheduler télécharge et auquel les
+articles sont rattachés (Article.feed_id). Les abonnements suivants
+pointent vers lui (source_id) et lisent ses articles. Lu, favoris et
+archives restent propres à chaque utilisateur.
+
+Quand l'abonnement qui porte la source est supprimé, un autre abonnement
+reprend la source (articles et état de téléchargement) ; sans autre
+abonnement, la source et ses articles sont supprimés.
+"""
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import and_, case, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+from sqlmodel import Session, select, update, delete, func
+
+from database import engine
+from models import (
+    Article, ArticleArchive, ArticleReadFlag, ArticleStar, ArticleTombstone, Collection, CollectionMember,
+    CollectionMessage, Feed, MessageReadFlag,
+)
+from urls import normalize_feed_url
+import websub
+
+# Id de la source d'un flux, en SQL (cf. source_of)
+SOURCE_ID = func.coalesce(Feed.source_id, Feed.id)
+
+# État de téléchargement, transmis à l'abonnement qui reprend une source
+_SOURCE_COLUMNS = (
+    "etag", "last_modified", "last_status", "last_success_at", "content_hash",
+    "next_fetch_at", "fetch_interval", "consecutive_failures", "last_error", "last_error_at",
+    "avg_latency_ms", "activity_score", "lease_owner", "lease_expires_at",
+    "websub_hub", "websub_topic",
+)
+_MERGE_BATCH = 500
+
+
+def source_of(feed) -> int:
+    """Id du flux qui porte les articles et l'état de téléchargement"""
+    return feed.source_id or feed.id
+
+
+def load_sources(session: Session, feeds: Iterable[Feed]) -> Dict[int, Feed]:
+    """Lignes sources des flux donnés, par id (les sources parmi `feeds` comprises)"""
+    sources = {f.id: f for f in feeds if f.source_id is None}
+    missing = {f.source_id for f in feeds if f.source_id is not None} - sources.keys()
+    if missing:
+        sources.update({f.id: f for f in session.exec(select(Feed).where(Feed.id.in_(missing))).all()})
+    return sources
+
+
+# ========= Accès =========
+def readable_collections(user_id: int):
+    """Sous-requête : collections possédées par l'utilisateur ou dont il est membre"""
+    return select(Collection.id).where(
+        or_(
+            Collection.user_id == user_id,
+            Collection.id.in_(select(CollectionMember.collection_id).where(CollectionMember.user_id == user_id)),
+        )
+    )
+
+
+def readable_sources(user_id: int):
+    """Sous-requête : sources des flux que l'utilisateur peut lire"""
+    return select(SOURCE_ID).where(Feed.collection_id.in_(readable_collections(user_id)))
+
+
+def subscriptions_for(session: Session, user_id: int, source_ids: Iterable[int]) -> Dict[int, int]:
+    """Pour chaque source, l'abonnement (id de Feed) par lequel l'utilisateur la lit"""
+    source_ids = set(source_ids)
+    if not source_ids:
+        return {}
+    rows = session.exec(
+        select(SOURCE_ID, Feed.id)
+        .where(SOURCE_ID.in_(source_ids), Feed.collection_id.in_(readable_collections(user_id)))
+        .order_by(Feed.id.desc())
+    ).all()
+    return {source_id: feed_id for source_id, feed_id in rows}  # le plus ancien abonnement l'emporte
+
+
+def subscription_for(session: Session, user_id: int, source_id: int) -> Optional[Feed]:
+    """Abonnement de l'utilisateur à la source d'un article, ou None s'il ne peut pas la lire"""
+    return session.exec(
+        select(Feed)
+        .where(SOURCE_ID == source_id, Feed.collection_id.in_(readable_collections(user_id)))
+        .order_by(Feed.id)
+    ).first()
+
+
+# ========= Abonnement =========
+def find_source(session: Session, url: str) -> Optional[Feed]:
+    return session.exec(
+        select(Feed).where(Feed.source_url == normalize_feed_url(url), Feed.source_id.is_(None))
+    ).first()
+
+
+def add_feed(
+    session: Session, url: str, collection_id: int,
+    title: Optional[str] = None, description: Optional[str] = None,
+) -> Feed:
+    """
+    Abonne une collection à `url` (sans commit) : rattaché à la source
+    existante si l'URL est déjà suivie, sinon le nouveau flux devient la
+    source. Titre et description de la source servent de valeurs par défaut.
+    """
+    source = find_source(session, url)
+    feed = Feed(url=url, title=title, description=description, collection_id=collection_id)
+    if source is None:
+        feed.source_url = normalize_feed_url(url)
+    else:
+        feed.source_id = source.id
+        feed.title = title or source.title
+        feed.description = description or source.description
+    session.add(feed)
+    session.flush()
+    return feed
+
+
+def add_feed_in_savepoint(
+    session: Session, url: str, collection_id: int,
+    title: Optional[str] = None, description: Optional[str] = None,
+) -> Feed:
+    """
+    add_feed dans un savepoint, pour les ajouts en série d'une même
+    transaction (import OPML) : une source créée au même instant par une
+    autre requête n'annule pas les ajouts précédents, le flux s'y rattache
+    """
+    try:
+        with session.begin_nested():
+            return add_feed(session, url, collection_id, title, description)
+    except IntegrityError:
+        return add_feed(session, url, collection_id, title, description)
+
+
+def remove_feeds(session: Session, feeds: List[Feed]) -> None:
+    """
+    Supprime des abonnements (sans commit). Une source encore suivie par un
+    autre abonnement lui est transmise ; sinon elle est supprimée avec ses
+    articles, leurs lu/favoris/archives et les commentaires associés.
+    """
+    removed = {f.id for f in feeds}
+    if not removed:
+        return
+    for feed in feeds:
+        source_id = source_of(feed)
+        if feed.source_id is None:
+            successor = session.exec(
+                select(Feed).where(Feed.source_id == feed.id, Feed.id.not_in(removed)).order_by(Feed.id)
+            ).first()
+            if successor is None:
+                websub.unsubscribe(feed)
+                _delete_articles(session, feed.id)
+                continue
+            _promote(session, feed, successor)
+            source_id = successor.id
+        _delete_comments(session, feed.collection_id, source_id, removed)
+    session.exec(update(ArticleArchive).where(ArticleArchive.feed_id.in_(removed)).values(feed_id=None))
+    session.exec(delete(Feed).where(Feed.id.in_(removed)))
+
+
+def _promote(session: Session, old: Feed, new: Feed) -> None:
+    """`new` devient la source à la place de `old` (articles et état de téléchargement)"""
+    websub.unsubscribe(old)  # le callback WebSub porte l'id du flux : nouvel abonnement au prochain cycle
+    values = {column: getattr(old, column) for column in _SOURCE_COLUMNS}
+    source_url = old.source_url
+    session.exec(update(Feed).where(Feed.id == old.id).values(source_url=None))
+    session.exec(
+        update(Feed).where(Feed.id == new.id)
+        .values(
+            **values, source_id=None, source_url=source_url,
+            websub_state=None, websub_secret=None, websub_token=None, websub_expires_at=None,
+        )
+    )
+    session.exec(update(Feed).where(Feed.source_id == old.id, Feed.id != new.id).values(source_id=new.id))
+    session.exec(update(Article).where(Article.feed_id == old.id).values(feed_id=new.id))
+    session.exec(update(ArticleTombstone).where(ArticleTombstone.feed_id == old.id).values(feed_id=new.id))
+
+
+def _delete_articles(session: Session, source_id: int) -> None:
+    session.exec(delete(ArticleTombstone).where(ArticleTombstone.feed_id == source_id))
+    article_ids = list(session.exec(select(Article.id).where(Article.feed_id == source_id)).all())
+    if not article_ids:
+        return
+    message_ids = list(session.exec(
+        select(CollectionMessage.id).where(CollectionMessage.article_id.in_(article_ids))
+    ).all())
+    if message_ids:
+        session.exec(delete(MessageReadFlag).where(MessageReadFlag.message_id.in_(message_ids)))
+        session.exec(delete(CollectionMessage).where(CollectionMessage.id.in_(message_ids)))
+    session.exec(delete(ArticleReadFlag).where(ArticleReadFlag.article_id.in_(article_ids)))
+    session.exec(delete(ArticleStar).where(ArticleStar.article_id.in_(article_ids)))
+    session.exec(delete(ArticleArchive).where(ArticleArchive.article_id.in_(article_ids)))
+    session.exec(delete(Article).where(Article.id.in_(article_ids)))
+
+
+def _delete_comments(session: Session, collection_id: int, source_id: int, removed: set) -> None:
+    # Commentaires de la collection sur les articles d'une source qu'elle ne suit plus
+    still_followed = session.exec(
+        select(Feed.id).where(Feed.collection_id == collection_id, SOURCE_ID == source_id, Feed.id.not_in(removed))
+    ).first()
+    if still_followed is not None:
+        return
+    message_ids = list(session.exec(
+        select(CollectionMessage.id).where(
+            CollectionMessage.collection_id == collection_id,
+            CollectionMessage.article_id.in_(select(Article.id).where(Article.feed_id == source_id)),
+        )
+    ).all())
+    if message_ids:
+        session.exec(delete(MessageReadFlag).where(MessageReadFlag.message_id.in_(message_ids)))
+        session.exec(delete(CollectionMessage).where(CollectionMessage.id.in_(message_ids)))
+
+
+# ========= Reprise des flux existants =========
+def backfill_sources() -> int:
+    """
+    URL normalisée des sources antérieures au partage ; les sources de même
+    URL sont fusionnées dans la plus ancienne (articles, lu, favoris,
+    archives, commentaires). Retourne le nombre de flux rattachés.
+    """
+    merged = 0
+    with Session(engine) as session:
+        pending = session.exec(
+            select(Feed.id, Feed.url).where(Feed.source_id.is_(None), Feed.source_url.is_(None)).order_by(Feed.id)
+        ).all()
+        if not pending:
+            return 0
+        keepers = dict(session.exec(
+            select(Feed.source_url, Feed.id).where(Feed.source_id.is_(None), Feed.source_url.is_not(None))
+        ).all())
+        for feed_id, url in pending:
+            key = normalize_feed_url(url)
+            keeper = keepers.get(key)
+            if keeper is None:
+                session.exec(update(Feed).where(Feed.id == feed_id).values(source_url=key))
+                keepers[key] = feed_id
+            else:
+                _merge(session, feed_id, keeper)
+                merged += 1
+            session.commit()
+    return merged
+
+
+def _merge(session: Session, duplicate_id: int, keeper_id: int) -> None:
+    kept = aliased(Article)
+    while True:
+        # Articles présents dans les deux sources : tout est reporté sur l'exemplaire conservé
+        pairs = dict(session.exec(
+            select(Article.id, kept.id)
+            .join(kept, and_(kept.link_hash == Article.link_hash, kept.feed_id == keeper_id))
+            .where(Article.feed_id == duplicate_id)
+            .limit(_MERGE_BATCH)
+        ).all())
+        if not pairs:
+            break
+        for model in (ArticleReadFlag, ArticleStar, ArticleArchive, CollectionMessage):
+            session.exec(
+                update(model)
+                .where(model.article_id.in_(pairs))
+                .values(article_id=case(pairs, value=model.article_id))
+            )
+        session.exec(delete(Article).where(Article.id.in_(pairs)))
+    session.exec(update(Article).where(Article.feed_id == duplicate_id).values(feed_id=keeper_id))
+    kept_keys = select(ArticleTombstone.link_hash).where(ArticleTombstone.feed_id == keeper_id)
+    session.exec(
+        delete(ArticleTombstone)
+        .where(ArticleTombstone.feed_id == duplicate_id, ArticleTombstone.link_hash.in_(kept_keys))
+    )
+    session.exec(update(ArticleTombstone).where(ArticleTombstone.feed_id == duplicate_id).values(feed_id=keeper_id))
+    session.exec(update(Feed).where(Feed.source_id == duplicate_id).values(source_id=keeper_id))
+    session.exec(
+        update(Feed).where(Feed.id == duplicate_id)
+        .values(
+            source_id=keeper_id, websub_state=None, websub_secret=None, websub_token=None,
+            lease_owner=None, lease_expires_at=None,
+        )
+    )
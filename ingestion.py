@@ -0,0 +1,652 @@
+# ingestion.py
+"""
+Moteur d'ingestion des flux RSS : téléchargement concurrent (asyncio + httpx)
+puis parsing, dédoublonnage et insertion des articles.
+"""
+import os
+import re
+import time
+import asyncio
+import hashlib
+import uuid
+import threading
+from datetime import datetime, timedelta
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+from sqlalchemy import and_, case, or_, union_all
+from sqlmodel import Session, select, update, func
+
+from database import engine
+from urls import url_hash
+from models import Article, ArticleTombstone, Feed
+from feed_scheduling import schedule_success, schedule_failure
+from feed_parsing import ParsedFeed
+
+# ========= Configuration =========
+FETCH_CONCURRENCY = int(os.getenv("FEED_FETCH_CONCURRENCY", "50"))  # requêtes simultanées au total
+FETCH_PER_HOST = int(os.getenv("FEED_FETCH_PER_HOST", "4"))  # requêtes simultanées par hôte
+FETCH_TIMEOUT = float(os.getenv("FEED_FETCH_TIMEOUT", "20"))  # secondes
+FEED_MAX_BYTES = int(os.getenv("FEED_MAX_BYTES", str(10 * 1024 * 1024)))  # taille max d'un flux décompressé
+USER_AGENT = "SUPRSS/1.0"
+MIN_REFRESH_INTERVAL = int(os.getenv("FEED_MIN_REFRESH_INTERVAL", "60"))  # secondes entre deux rafraîchissements d'un flux
+MAX_DEFERRAL = int(os.getenv("FEED_MAX_DEFERRAL", "21600"))  # retard au-delà duquel un flux passe avant les plus actifs
+LATENCY_WEIGHT = 0.2  # poids de la dernière mesure dans la latence moyenne (moyenne exponentielle)
+
+
+@dataclass
+class FetchTarget:
+    feed_id: int
+    url: str
+    headers: Dict[str, str] = field(default_factory=dict)  # en-têtes conditionnels (If-None-Match...)
+
+
+@dataclass
+class FetchResult:
+    feed_id: int
+    url: str
+    status: Optional[int] = None
+    content: bytes = b""
+    headers: Dict[str, str] = field(default_factory=dict)
+    error: Optional[str] = None
+    content_hash: Optional[str] = None  # sha256 du corps, calculé pendant la lecture
+    elapsed: float = 0.0  # durée du téléchargement (secondes)
+
+    @property
+    def not_modified(self) -> bool:
+        return self.status == 304
+
+
+# Colonnes chargées par le scheduler pour les flux à rafraîchir (pas de lignes ORM complètes)
+DUE_FEED_COLUMNS = (
+    Feed.id, Feed.url, Feed.etag, Feed.last_modified,
+    Feed.fetch_interval, Feed.consecutive_failures, Feed.content_hash,
+    Feed.websub_state, Feed.websub_expires_at, Feed.avg_latency_ms,
+)
+
+
+def _is_due(now: datetime):
+    # Seules les sources sont téléchargées (cf. feed_sources.py)
+    return and_(Feed.source_id.is_(None), or_(Feed.next_fetch_at.is_(None), Feed.next_fetch_at <= now))
+
+
+def _lease_free(now: datetime):
+    return or_(Feed.lease_expires_at.is_(None), Feed.lease_expires_at < now)
+
+
+def count_due_feeds(session: Session, now: Optional[datetime] = None, feed_ids: Optional[List[int]] = None) -> int:
+    """Flux échus et non réservés (en attente d'un worker), parmi `feed_ids` s'il est donné"""
+    now = now or datetime.utcnow()
+    stmt = select(func.count(Feed.id)).where(_is_due(now), _lease_free(now))
+    if feed_ids is not None:
+        stmt = stmt.where(Feed.id.in_(feed_ids))
+    return session.exec(stmt).one()
+
+
+def _claim(session: Session, candidates, owner: str, lease_seconds: int, now: datetime) -> list:
+    """Pose un bail `owner` sur les flux libres parmi `candidates` et retourne leurs lignes compactes"""
+    token = f"{owner}:{uuid.uuid4().hex[:8]}"
+    if engine.dialect.name == "postgresql":
+        candidates = candidates.with_for_update(skip_locked=True)
+    session.exec(
+        update(Feed)
+        .where(Feed.id.in_(candidates.scalar_subquery()), _lease_free(now))
+        .values(lease_owner=token, lease_expires_at=now + timedelta(seconds=lease_seconds))
+        .execution_options(synchronize_session=False)
+    )
+    session.commit()
+    return session.exec(select(*DUE_FEED_COLUMNS).where(Feed.lease_owner == token)).all()
+
+
+def claim_due_feeds(
+    session: Session, owner: str, limit: int, lease_seconds: int, feed_ids: Optional[List[int]] = None,
+) -> list:
+    """
+    Réserve au plus `limit` flux échus et non réservés pour `owner` (parmi
+    `feed_ids` s'il est donné), et les retourne en lignes compactes. Plusieurs processus (workers uvicorn,
+    conteneurs, worker.py) se partagent ainsi des lots disjoints ; un bail
+    expiré (worker arrêté en cours de route) redevient disponible.
+    PostgreSQL : SELECT ... FOR UPDATE SKIP LOCKED ; SQLite sérialise déjà
+    les écritures.
+
+    Ordre : les flux jamais planifiés ou en retard de plus de MAX_DEFERRAL
+    (pour qu'aucun flux ne soit affamé), puis les plus lus (activity_score),
+    puis les plus anciennement échus. Quand un cycle dépasse son budget, ce
+    sont donc les flux peu lus qui attendent le cycle suivant.
+    """
+    now = datetime.utcnow()
+    overdue = case(
+        (or_(Feed.next_fetch_at.is_(None), Feed.next_fetch_at < now - timedelta(seconds=MAX_DEFERRAL)), 0),
+        else_=1,
+    )
+    candidates = (
+        select(Feed.id)
+        .where(_is_due(now), _lease_free(now))
+        .order_by(overdue, Feed.activity_score.desc(), Feed.next_fetch_at.asc().nulls_first())
+        .limit(limit)
+    )
+    if feed_ids is not None:
+        candidates = candidates.where(Feed.id.in_(feed_ids))
+    return _claim(session, candidates, owner, lease_seconds, now)
+
+
+def claim_feeds(session: Session, owner: str, feed_ids: List[int], lease_seconds: int) -> list:
+    """
+    Réserve les sources `feed_ids` demandées explicitement (rafraîchissement
+    manuel), échues ou non. Sont exclus les flux déjà réservés ailleurs et
+    ceux rafraîchis avec succès il y a moins de MIN_REFRESH_INTERVAL secondes.
+    """
+    now = datetime.utcnow()
+    recent = now - timedelta(seconds=MIN_REFRESH_INTERVAL)
+    candidates = select(Feed.id).where(
+        Feed.id.in_(feed_ids),
+        Feed.source_id.is_(None),
+        _lease_free(now),
+        or_(Feed.last_success_at.is_(None), Feed.last_success_at < recent),
+    )
+    return _claim(session, candidates, owner, lease_seconds, now)
+
+
+# ========= GET conditionnel =========
+def conditional_headers(feed) -> Dict[str, str]:
+    """En-têtes If-None-Match / If-Modified-Since à partir des validateurs stockés"""
+    headers = {}
+    if feed.etag:
+        headers["If-None-Match"] = feed.etag
+    if feed.last_modified:
+        headers["If-Modified-Since"] = feed.last_modified
+    return headers
+
+
+def unchanged_body(feed, result: FetchResult) -> bool:
+    """
+    Le serveur a renvoyé (200) exactement le même document que la dernière
+    fois : cas des serveurs qui ignorent les GET conditionnels. Le parsing et
+    le dédoublonnage peuvent alors être sautés.
+    """
+    return (
+        not result.error
+        and not result.not_modified
+        and result.content_hash is not None
+        and result.content_hash == feed.content_hash
+    )
+
+
+def push_active(feed, now: datetime) -> bool:
+    """Abonnement WebSub confirmé et non expiré : les nouveautés arrivent par push"""
+    return (
+        feed.websub_state in ("active", "renewing")
+        and feed.websub_expires_at is not None
+        and feed.websub_expires_at > now
+    )
+
+
+def _websub_links(result: FetchResult, parsed: Optional[ParsedFeed]) -> Dict[str, str]:
+    """Hub et URL canonique (topic) annoncés par le document ou l'en-tête Link"""
+    links = {}
+    for part in result.headers.get("link", "").split(","):
+        url, _, params = part.partition(";")
+        for rel in ("hub", "self"):
+            if re.search(rf'rel\s*=\s*"?[^"]*\b{rel}\b', params):
+                links.setdefault(rel, url.strip(" <>"))
+    if parsed is not None:
+        for rel in ("hub", "self"):
+            if parsed.meta.get(rel):
+                links.setdefault(rel, parsed.meta[rel])
+    return links
+
+
+def fetch_state(feed, result: FetchResult, parsed: Optional[ParsedFeed] = None) -> Dict[str, Any]:
+    """
+    Nouvelles valeurs des colonnes de suivi du flux après un téléchargement :
+    validateurs HTTP, dernier statut, date du dernier succès et planification.
+    `feed` peut être une ligne compacte (cf. DUE_FEED_COLUMNS) ou un Feed.
+    """
+    now = datetime.utcnow()
+    values: Dict[str, Any] = {"last_status": result.status}
+    if result.status is not None and result.elapsed:
+        # Temps de réponse du serveur (pas des erreurs réseau ni des timeouts)
+        latency = result.elapsed * 1000
+        previous = feed.avg_latency_ms
+        values["avg_latency_ms"] = round(latency if previous is None else previous * (1 - LATENCY_WEIGHT) + latency * LATENCY_WEIGHT, 1)
+    if result.error:
+        values["last_error"] = result.error[:500]
+        values["last_error_at"] = now
+        values.update(schedule_failure(feed.fetch_interval, feed.consecutive_failures or 0, result.headers, now))
+        return values
+
+    values["last_success_at"] = now
+    if parsed is not None:
+        # Titre et description du flux : seulement s'ils n'ont pas été saisis
+        if parsed.title:
+            values["title"] = func.coalesce(func.nullif(Feed.title, ""), parsed.title[:255])
+        if parsed.description:
+            values["description"] = func.coalesce(func.nullif(Feed.description, ""), parsed.description)
+    if result.headers.get("etag"):
+        values["etag"] = result.headers["etag"]
+    if result.headers.get("last-modified"):
+        values["last_modified"] = result.headers["last-modified"]
+    if result.content_hash:
+        values["content_hash"] = result.content_hash
+    links = _websub_links(result, parsed)
+    if links.get("hub"):
+        values["websub_hub"] = links["hub"]
+        values["websub_topic"] = links.get("self") or result.url
+    entries = parsed.entries if parsed is not None else None
+    feed_meta = parsed.meta if parsed is not None else None
+    values.update(schedule_success(
+        feed.fetch_interval, entries, feed_meta, result.headers, now, push_active=push_active(feed, now),
+    ))
+    return values
+
+
+def fill_subscriptions(session: Session, source_id: int, parsed: Optional[ParsedFeed]) -> None:
+    """
+    Titre et description du flux téléchargé reportés sur les abonnements à
+    la source qui n'en ont pas encore (abonnés avant le premier
+    téléchargement, cf. feed_sources.add_feed)
+    """
+    if parsed is None:
+        return
+    for column, value in (("title", parsed.title and parsed.title[:255]), ("description", parsed.description)):
+        if value:
+            attr = getattr(Feed, column)
+            session.exec(
+                update(Feed)
+                .where(Feed.source_id == source_id, or_(attr.is_(None), attr == ""))
+                .values({column: value})
+            )
+
+
+# ========= Téléchargement concurrent =========
+def _too_large(target: FetchTarget, status: int) -> FetchResult:
+    return FetchResult(
+        feed_id=target.feed_id, url=target.url, status=status,
+        error=f"Document trop volumineux (> {FEED_MAX_BYTES} octets)",
+    )
+
+
+async def _fetch_one(
+    client: httpx.AsyncClient,
+    target: FetchTarget,
+    host_limits: Dict[str, asyncio.Semaphore],
+) -> FetchResult:
+    host = urlsplit(target.url).hostname or ""
+    host_limit = host_limits.setdefault(host, asyncio.Semaphore(FETCH_PER_HOST))
+    async with host_limit:
+        # Chronomètre lancé une fois le créneau de l'hôte obtenu : la latence
+        # mesurée est celle de l'échange HTTP, pas l'attente derrière les
+        # autres flux du même hôte
+        started = time.perf_counter()
+        result = await _download(client, target)
+        result.elapsed = time.perf_counter() - started
+    return result
+
+
+async def _download(client: httpx.AsyncClient, target: FetchTarget) -> FetchResult:
+    try:
+        async with client.stream("GET", target.url, headers=target.headers) as r:
+            declared = r.headers.get("content-length", "")
+            if declared.isdigit() and int(declared) > FEED_MAX_BYTES:
+                return _too_large(target, r.status_code)
+            # Lecture par morceaux (décompression incrémentale) : la mémoire
+            # par téléchargement reste bornée par FEED_MAX_BYTES
+            body = bytearray()
+            digest = hashlib.sha256()
+            async for chunk in r.aiter_bytes():
+                body.extend(chunk)
+                digest.update(chunk)
+                if len(body) > FEED_MAX_BYTES:
+                    return _too_large(target, r.status_code)
+    except httpx.HTTPError as e:
+        return FetchResult(feed_id=target.feed_id, url=target.url, error=f"{type(e).__name__}: {e}")
+    except Exception as e:
+        # URL invalide, schéma non supporté...
+        return FetchResult(feed_id=target.feed_id, url=target.url, error=str(e))
+
+    result = FetchResult(
+        feed_id=target.feed_id,
+        url=str(r.url),
+        status=r.status_code,
+        content=bytes(body),
+        headers={k.lower(): v for k, v in r.headers.items()},
+        content_hash=digest.hexdigest() if r.status_code == 200 else None,
+    )
+    if r.status_code >= 400:
+        result.error = f"HTTP {r.status_code}"
+    return result
+
+
+async def _fetch_limited(
+    client: httpx.AsyncClient,
+    target: FetchTarget,
+    global_limit: asyncio.Semaphore,
+    host_limits: Dict[str, asyncio.Semaphore],
+    on_result: Optional[Callable[[FetchResult], Awaitable[None]]],
+) -> Optional[FetchResult]:
+    async with global_limit:
+        result = await _fetch_one(client, target, host_limits)
+        if on_result is None:
+            return result
+        # Le créneau reste pris tant que l'étape suivante n'a pas accepté le
+        # document : un aval lent freine le téléchargement (backpressure)
+        await on_result(result)
+        return None
+
+
+async def fetch_feeds_async(
+    targets: List[FetchTarget],
+    on_result: Optional[Callable[[FetchResult], Awaitable[None]]] = None,
+    concurrency: Optional[int] = None,
+) -> List[FetchResult]:
+    """
+    Télécharge tous les flux en parallèle (limite globale + limite par hôte).
+    Avec `on_result`, chaque résultat lui est transmis dès réception au lieu
+    d'être conservé dans la liste retournée. `concurrency` abaisse la limite
+    globale (FETCH_CONCURRENCY par défaut).
+    """
+    concurrency = min(concurrency or FETCH_CONCURRENCY, FETCH_CONCURRENCY)
+    global_limit = asyncio.Semaphore(concurrency)
+    host_limits: Dict[str, asyncio.Semaphore] = {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(
+        timeout=FETCH_TIMEOUT,
+        limits=limits,
+        follow_redirects=True,
+        headers={"User-Agent": USER_AGENT},
+    ) as client:
+        results = await asyncio.gather(
+            *(_fetch_limited(client, t, global_limit, host_limits, on_result) for t in targets)
+        )
+    return [r for r in results if r is not None]
+
+
+# ========= Parsing =========
+def document_headers(result: FetchResult) -> Dict[str, str]:
+    # Les en-têtes servent à détecter l'encodage et à résoudre les liens relatifs
+    return {**result.headers, "content-location": result.url}
+
+
+# ========= Dédoublonnage =========
+def link_hash(link: str, title: str = "") -> str:
+    """
+    Clé de dédoublonnage d'une entrée : son lien canonique (sans paramètres
+    de suivi, cf. urls.canonical_url), ou son titre si elle n'en a pas
+    """
+    if link:
+        return url_hash(link)
+    return hashlib.sha1(f"title:{title}".encode("utf-8")).hexdigest()
+
+
+def published_at(published: Optional[float], now: datetime) -> datetime:
+    """
+    Date de tri d'une entrée : sa date de publication, sinon la date
+    d'ingestion. Une date dans le futur (fuseau erroné, article programmé)
+    est ramenée à maintenant pour ne pas rester en tête de liste.
+    """
+    if published is None:
+        return now
+    try:
+        return min(datetime.utcfromtimestamp(published), now)
+    except (OverflowError, OSError, ValueError):
+        return now
+
+
+def known_link_hashes(session: Session, feed_id: int, hashes) -> set:
+    """
+    Parmi `hashes`, ceux déjà présents pour ce flux ou supprimés par la
+    rétention (une seule requête, index uniques)
+    """
+    hashes = list(hashes)
+    if not hashes:
+        return set()
+    return set(
+        session.exec(
+            union_all(
+                select(Article.link_hash).where(Article.feed_id == feed_id, Article.link_hash.in_(hashes)),
+                select(ArticleTombstone.link_hash)
+                .where(ArticleTombstone.feed_id == feed_id, ArticleTombstone.link_hash.in_(hashes)),
+            )
+        ).scalars().all()
+    )
+
+
+def new_entries(session: Session, feed_id: int, entries) -> List[Dict[str, Any]]:
+    """
+    Lignes Article à insérer pour les entrées inconnues. Toutes les entrées
+    sont examinées (clés connues chargées en une requête) : l'ordre du flux,
+    du plus récent au plus ancien ou l'inverse, n'a pas d'importance.
+    """
+    now = datetime.utcnow()
+    candidates = []
+    for e in entries:
+        key = link_hash(e.link, e.title)
+        candidates.append({
+            "title": e.title[:255], "content": e.summary, "link": e.link,
+            "feed_id": feed_id, "link_hash": key, "url_hash": key if e.link else None, "fetched_at": now,
+            "guid": e.guid, "published_at": published_at(e.published, now),
+        })
+    known = known_link_hashes(session, feed_id, {c["link_hash"] for c in candidates})
+
+    rows = []
+    for c in candidates:
+        if c["link_hash"] in known:
+            continue
+        known.add(c["link_hash"])  # doublons à l'intérieur du même document
+        rows.append(c)
+    return rows
+
+
+# ========= Insertion =========
+BULK_INSERT_PAGE_SIZE = 500  # lignes par INSERT multi-lignes
+
+
+def _insert_ignoring_duplicates():
+    """INSERT ... ON CONFLICT (feed_id, link_hash) DO NOTHING selon le dialecte"""
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(Article.__table__).on_conflict_do_nothing(index_elements=["feed_id", "link_hash"])
+
+
+def bulk_insert_articles(session: Session, rows: List[Dict[str, Any]]) -> List[int]:
+    """
+    Insère des lignes Article en masse, sans passer par l'unité de travail
+    de l'ORM, et retourne les ids réellement insérés (les conflits sur
+    (feed_id, link_hash) sont ignorés).
+
+    PostgreSQL / SQLite >= 3.35 : INSERT multi-lignes ... RETURNING id par
+    pages de BULK_INSERT_PAGE_SIZE. Sinon : executemany puis relecture des
+    ids par link_hash, pour les clés absentes avant l'insertion.
+    """
+    if not rows:
+        return []
+    table = Article.__table__
+    stmt = _insert_ignoring_duplicates()
+    if engine.dialect.insert_executemany_returning:
+        result = session.exec(
+            stmt.returning(table.c.id),
+            params=rows,
+            execution_options={"insertmanyvalues_page_size": BULK_INSERT_PAGE_SIZE},
+        )
+        return list(result.scalars().all())
+
+    by_feed: Dict[int, List[str]] = {}
+    for row in rows:
+        by_feed.setdefault(row["feed_id"], []).append(row["link_hash"])
+    # Clés déjà présentes avant l'insertion : leurs lignes ne sont pas des insertions
+    for feed_id, hashes in by_feed.items():
+        existing = set()
+        for i in range(0, len(hashes), BULK_INSERT_PAGE_SIZE):
+            existing.update(session.exec(
+                select(Article.link_hash).where(
+                    Article.feed_id == feed_id,
+                    Article.link_hash.in_(hashes[i:i + BULK_INSERT_PAGE_SIZE]),
+                )
+            ).all())
+        by_feed[feed_id] = [h for h in hashes if h not in existing]
+    session.exec(stmt, params=rows)
+    ids: List[int] = []
+    for feed_id, hashes in by_feed.items():
+        for i in range(0, len(hashes), BULK_INSERT_PAGE_SIZE):
+            ids.extend(session.exec(
+                select(Article.id).where(
+                    Article.feed_id == feed_id,
+                    Article.link_hash.in_(hashes[i:i + BULK_INSERT_PAGE_SIZE]),
+                )
+            ).all())
+    return ids
+
+
+def ingest_entries(session: Session, feed_id: int, entries) -> int:
+    """Insère les entrées qui ne sont pas déjà connues, retourne le nombre inséré"""
+    return len(bulk_insert_articles(session, new_entries(session, feed_id, entries)))
+
+
+def backfill_link_hashes(batch_size: int = 1000) -> int:
+    """Calcule link_hash pour les articles antérieurs à la colonne (par lots)"""
+    filled = 0
+    last_id = 0
+    with Session(engine) as session:
+        while True:
+            batch = session.exec(
+                select(Article.id, Article.feed_id, Article.link, Article.title)
+                .where(Article.link_hash.is_(None), Article.id > last_id)
+                .order_by(Article.id)
+                .limit(batch_size)
+            ).all()
+            if not batch:
+                break
+            last_id = batch[-1].id
+            hashes = {row.id: link_hash(row.link, row.title) for row in batch}
+            seen = set(
+                session.exec(
+                    select(Article.feed_id, Article.link_hash).where(Article.link_hash.in_(set(hashes.values())))
+                ).all()
+            )
+            for row in batch:
+                key = (row.feed_id, hashes[row.id])
+                if key in seen:
+                    continue  # doublon historique : on le laisse sans hash
+                seen.add(key)
+                session.exec(update(Article).where(Article.id == row.id).values(link_hash=key[1]))
+                filled += 1
+            session.commit()
+    return filled
+
+
+def backfill_url_hashes(batch_size: int = 1000) -> int:
+    """
+    Hash du lien canonique des articles antérieurs à la colonne (par lots),
+    et des liens à fragment hashés quand le fragment était retiré. La clé de
+    dédoublonnage passe au lien canonique quand elle est libre dans le flux ;
+    sinon l'article est une variante historique d'un autre (suivi) et garde
+    son ancienne clé.
+    """
+    filled = 0
+    last_id = 0
+    with Session(engine) as session:
+        while True:
+            batch = session.exec(
+                select(Article.id, Article.feed_id, Article.link, Article.link_hash, Article.url_hash)
+                .where(
+                    or_(Article.url_hash.is_(None), Article.link.contains("#")),
+                    Article.link != "", Article.id > last_id,
+                )
+                .order_by(Article.id)
+                .limit(batch_size)
+            ).all()
+            if not batch:
+                break
+            last_id = batch[-1].id
+            hashes = {row.id: url_hash(row.link) for row in batch}
+            batch = [row for row in batch if row.url_hash != hashes[row.id]]
+            taken = set(
+                session.exec(
+                    select(Article.feed_id, Article.link_hash).where(Article.link_hash.in_(set(hashes.values())))
+                ).all()
+            )
+            for row in batch:
+                key = (row.feed_id, hashes[row.id])
+                values = {"url_hash": key[1]}
+                if row.link_hash != key[1] and key not in taken:
+                    values["link_hash"] = key[1]
+                    taken.add(key)
+                session.exec(update(Article).where(Article.id == row.id).values(**values))
+                filled += 1
+            session.commit()
+    return filled
+
+
+def backfill_published_at(batch_size: int = 1000) -> int:
+    """Date de tri des articles antérieurs à la colonne : leur date d'ingestion (par lots)"""
+    now = datetime.utcnow()
+    filled = 0
+    with Session(engine) as session:
+        while True:
+            ids = session.exec(select(Article.id).where(Article.published_at.is_(None)).limit(batch_size)).all()
+            if not ids:
+                return filled
+            session.exec(
+                update(Article).where(Article.id.in_(list(ids)))
+                .values(published_at=func.coalesce(Article.fetched_at, now))
+            )
+            session.commit()
+            filled += len(ids)
+
+
+# ========= Rafraîchissements concurrents (singleflight) =========
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Regroupe les appels concurrents pour une même clé : le premier exécute
+    le travail, les suivants attendent et récupèrent son résultat.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Any, _Call] = {}
+
+    def claim(self, key) -> Tuple[_Call, bool]:
+        """Retourne (appel en cours, True si l'appelant doit faire le travail)"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                return call, False
+            call = self._calls[key] = _Call()
+            return call, True
+
+    def release(self, key, result: Any = None, error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            call = self._calls.pop(key, None)
+        if call is not None:
+            call.result, call.error = result, error
+            call.done.set()
+
+    def do(self, key, fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        call, leader = self.claim(key)
+        if not leader:
+            if not call.done.wait(timeout):
+                raise TimeoutError(f"Rafraîchissement de {key} toujours en cours")
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            result = fn()
+        except BaseException as e:
+            self.release(key, error=e)
+            raise
+        self.release(key, result=result)
+        return result
+
+
+feed_flights = SingleFlight()  # flux en cours de rafraîchissement dans ce processus
@@ -0,0 +1,513 @@
+# ingestion_pipeline.py
+"""
+Pipeline d'ingestion par étapes : téléchargement → parsing → dédoublonnage
+→ écriture, reliées par des files bornées. Chaque étape a son propre
+nombre de workers et ses métriques (débit, profondeur de file), ce qui
+permet de régler chaque goulot séparément sans que la mémoire explose :
+une base lente ralentit le téléchargement au lieu d'accumuler les
+documents.
+"""
+import os
+import time
+import socket
+import queue
+import asyncio
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlmodel import Session, update
+
+from database import engine
+from models import Feed
+from feed_parsing import PARSE_WORKERS as PARSE_PROCESSES, ParsedFeed, parse_documents
+from feed_scheduling import QUARANTINE_AFTER
+from ingestion import (
+    FETCH_CONCURRENCY, FetchTarget, FetchResult, fetch_feeds_async, conditional_headers,
+    fetch_state, fill_subscriptions, unchanged_body, new_entries, bulk_insert_articles, document_headers,
+    claim_due_feeds, claim_feeds, count_due_feeds, feed_flights,
+)
+
+# Un worker attend un document à la fois : avec un pool de parsing, au moins autant que de processus
+PARSE_WORKERS = max(int(os.getenv("FEED_PIPELINE_PARSE_WORKERS", "2")), PARSE_PROCESSES)
+DEDUP_WORKERS = int(os.getenv("FEED_PIPELINE_DEDUP_WORKERS", "2"))
+WRITE_WORKERS = int(os.getenv("FEED_PIPELINE_WRITE_WORKERS", "1"))
+QUEUE_SIZE = int(os.getenv("FEED_PIPELINE_QUEUE_SIZE", "50"))
+WRITE_CHUNK = int(os.getenv("FEED_PIPELINE_WRITE_CHUNK", "20"))  # flux par commit
+WRITE_CHUNK_ROWS = int(os.getenv("FEED_PIPELINE_WRITE_CHUNK_ROWS", "2000"))  # articles par commit
+CLAIM_BATCH = int(os.getenv("FEED_CLAIM_BATCH", "200"))  # flux réservés par lot
+LEASE_SECONDS = int(os.getenv("FEED_LEASE_SECONDS", "600"))  # durée du bail sur un lot
+CYCLE_BUDGET = float(os.getenv("FEED_CYCLE_BUDGET", os.getenv("FEED_SCHEDULER_TICK", "60")))  # durée max d'un cycle de fond (secondes, 0 : illimitée)
+PRIORITY_MAX_WAIT = float(os.getenv("FEED_PRIORITY_MAX_WAIT", "60"))  # pause max du cycle de fond (secondes)
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+_DONE = object()  # sentinelle de fin de file
+
+
+@dataclass
+class PipelineItem:
+    feed: Any  # ligne compacte (cf. ingestion.DUE_FEED_COLUMNS)
+    result: FetchResult
+    parsed: Optional[ParsedFeed] = None
+    rows: Optional[List[Dict[str, Any]]] = None
+    inserted: int = 0
+    unchanged: bool = False  # même document que la dernière fois : ni parsing ni dédoublonnage
+    handed_off: float = 0.0  # perf_counter à la sortie du téléchargement
+
+
+class StageMetrics:
+    """Compteurs d'une étape, mis à jour par ses workers"""
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.processed = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.max_queue_depth = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, queue_depth: int, error: bool = False) -> None:
+        with self._lock:
+            self.processed += 1
+            self.errors += int(error)
+            self.busy_seconds += seconds
+            self.max_queue_depth = max(self.max_queue_depth, queue_depth)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "processed": self.processed,
+            "errors": self.errors,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "per_second": round(self.processed / self.busy_seconds, 1) if self.busy_seconds else None,
+            "max_queue_depth": self.max_queue_depth,
+        }
+
+
+class PipelineMetrics:
+    def __init__(self):
+        self.stages: Dict[str, StageMetrics] = {}
+        self.started_at = time.time()
+        self.wall_seconds = 0.0
+        self.feeds = 0
+        self.inserted = 0
+        self.not_modified = 0  # réponses 304
+        self.unchanged = 0  # 200 identiques au dernier document (empreinte)
+        self.entries = 0  # entrées parsées
+        self.errors = 0  # flux en erreur (téléchargement, parsing ou écriture)
+        self.deferred = 0  # flux échus laissés au cycle suivant (budget dépassé)
+        self.feed_seconds: List[float] = []  # durée par flux, du téléchargement à l'écriture
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.feed_seconds:
+            return None
+        ordered = sorted(self.feed_seconds)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    def stage(self, name: str, workers: int) -> StageMetrics:
+        self.stages[name] = StageMetrics(name, workers)
+        return self.stages[name]
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "feeds": self.feeds,
+            "inserted": self.inserted,
+            "not_modified": self.not_modified,
+            "unchanged": self.unchanged,
+            "entries": self.entries,
+            "errors": self.errors,
+            "deferred": self.deferred,
+            "wall_seconds": round(self.wall_seconds, 3),
+            "feed_p50_ms": round(self.percentile(0.5) * 1000, 1) if self.feed_seconds else None,
+            "feed_p99_ms": round(self.percentile(0.99) * 1000, 1) if self.feed_seconds else None,
+            "stages": {name: m.as_dict() for name, m in self.stages.items()},
+        }
+
+
+last_run_metrics: Optional[PipelineMetrics] = None  # dernier lot du cycle de fond
+
+
+# ========= Étapes =========
+def _parse(item: PipelineItem, session: Optional[Session]) -> PipelineItem:
+    res = item.result
+    if not res.error and not res.not_modified and not item.unchanged:
+        item.parsed = parse_documents([(res.content, document_headers(res))])[0]
+        res.content = b""  # le document brut n'est plus utile
+    return item
+
+
+def _dedup(item: PipelineItem, session: Optional[Session]) -> PipelineItem:
+    if item.parsed is not None:
+        item.rows = new_entries(session, item.feed.id, item.parsed.entries)
+        session.rollback()  # lecture seule : ne pas garder de transaction (verrous SQLite)
+    return item
+
+
+def _write(item: PipelineItem, session: Session) -> PipelineItem:
+    """Écrit les articles et le nouvel état du flux (sans commit : cf. _WriteStage)"""
+    if item.rows:
+        item.inserted = len(bulk_insert_articles(session, item.rows))
+    state = fetch_state(item.feed, item.result, item.parsed)
+    session.exec(
+        update(Feed)
+        .where(Feed.id == item.feed.id)
+        .values(**state, lease_owner=None, lease_expires_at=None)
+    )
+    fill_subscriptions(session, item.feed.id, item.parsed)
+    if state.get("consecutive_failures") == QUARANTINE_AFTER:
+        print(f"[Pipeline] flux {item.feed.id} mis en quarantaine après {QUARANTINE_AFTER} échecs: {item.result.error}")
+    return item
+
+
+class _Stage:
+    def __init__(
+        self,
+        fn: Callable[[PipelineItem, Optional[Session]], PipelineItem],
+        workers: int,
+        inbox: queue.Queue,
+        outbox: Optional[queue.Queue],
+        metrics: StageMetrics,
+        uses_db: bool = False,
+        on_item: Optional[Callable[[PipelineItem, Optional[BaseException]], None]] = None,
+    ):
+        self.fn, self.inbox, self.outbox, self.metrics = fn, inbox, outbox, metrics
+        self.uses_db, self.on_item = uses_db, on_item
+        self.threads = [
+            threading.Thread(target=self._run, name=f"pipeline-{metrics.name}-{i}", daemon=True)
+            for i in range(max(workers, 1))
+        ]
+
+    def start(self) -> None:
+        for t in self.threads:
+            t.start()
+
+    def close(self) -> None:
+        """Signale la fin des entrées et attend que tous les workers aient vidé la file"""
+        for _ in self.threads:
+            self.inbox.put(_DONE)
+        for t in self.threads:
+            t.join()
+
+    def _run(self) -> None:
+        session = Session(engine) if self.uses_db else None
+        try:
+            while True:
+                item = self.inbox.get()
+                if item is _DONE:
+                    return
+                depth = self.inbox.qsize()
+                start = time.perf_counter()
+                error = None
+                try:
+                    item = self.fn(item, session)
+                except Exception as e:
+                    error = e
+                    if session is not None:
+                        session.rollback()  # transaction avortée (PostgreSQL) : inutilisable pour les flux suivants
+                    item.result.error = item.result.error or f"{type(e).__name__}: {e}"
+                    print(f"[Pipeline] {self.metrics.name}: flux {item.feed.id} en erreur: {e}")
+                self.metrics.record(time.perf_counter() - start, depth, error is not None)
+                if self.outbox is not None:
+                    self.outbox.put(item)  # bloque si l'étape suivante est saturée
+                if self.on_item is not None:
+                    self.on_item(item, error)
+        finally:
+            if session is not None:
+                session.close()
+
+
+class _WriteStage(_Stage):
+    """
+    Écriture par lots : un commit tous les WRITE_CHUNK flux (ou WRITE_CHUNK_ROWS
+    articles), dans une session neuve à chaque lot pour que la mémoire reste
+    stable quel que soit le volume du cycle. Si un flux échoue, le lot est
+    annulé et ses autres flux sont rejoués chacun dans sa propre transaction.
+    """
+
+    def _run(self) -> None:
+        pending: List[PipelineItem] = []
+        rows = 0
+        session = Session(engine)
+        try:
+            while True:
+                try:
+                    # Pas d'attente indéfinie avec un lot en cours : on le valide dès que la file se vide
+                    item = self.inbox.get(timeout=0.2 if pending else None)
+                except queue.Empty:
+                    item = None
+                if item is None or item is _DONE:
+                    session = self._flush(session, pending)
+                    rows = 0
+                    if item is _DONE:
+                        return
+                    continue
+
+                depth = self.inbox.qsize()
+                start = time.perf_counter()
+                rows += len(item.rows or ())
+                try:
+                    _write(item, session)
+                    pending.append(item)
+                except Exception as e:
+                    session.rollback()
+                    session.close()
+                    session = Session(engine)
+                    self._fail(item, e)
+                    self._replay(pending)
+                    pending.clear()
+                    rows = 0
+                    self.metrics.record(time.perf_counter() - start, depth, error=True)
+                    continue
+                self.metrics.record(time.perf_counter() - start, depth)
+                if len(pending) >= WRITE_CHUNK or rows >= WRITE_CHUNK_ROWS:
+                    session = self._flush(session, pending)
+                    rows = 0
+        finally:
+            session.close()
+
+    def _flush(self, session: Session, pending: List[PipelineItem]) -> Session:
+        if pending:
+            try:
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                print(f"[Pipeline] write: échec du commit d'un lot de {len(pending)} flux: {e}")
+                for item in pending:
+                    item.inserted = 0
+                    self._done(item, e)
+                pending.clear()
+                session.close()
+                return Session(engine)
+            for item in pending:
+                item.rows = None  # validées : plus besoin de les garder pour un rejeu
+                self._done(item, None)
+            pending.clear()
+        # Session neuve par lot : rien ne s'accumule d'un lot à l'autre
+        session.close()
+        return Session(engine)
+
+    def _replay(self, items: List[PipelineItem]) -> None:
+        for item in items:
+            with Session(engine) as session:
+                try:
+                    _write(item, session)
+                    session.commit()
+                    item.rows = None
+                    self._done(item, None)
+                except Exception as e:
+                    session.rollback()
+                    self._fail(item, e)
+
+    def _fail(self, item: PipelineItem, error: Exception) -> None:
+        item.inserted = 0
+        item.result.error = item.result.error or f"{type(error).__name__}: {error}"
+        print(f"[Pipeline] write: flux {item.feed.id} en erreur: {error}")
+        self._done(item, error)
+
+    def _done(self, item: PipelineItem, error: Optional[BaseException]) -> None:
+        if self.on_item is not None:
+            self.on_item(item, error)
+
+
+# ========= Exécution =========
+def run_pipeline(
+    feeds: List[Any],
+    on_done: Optional[Callable[[PipelineItem], None]] = None,
+    concurrency: Optional[int] = None,
+) -> PipelineMetrics:
+    """
+    Rafraîchit `feeds` (lignes compactes id/url/validateurs) à travers les
+    quatre étapes. `on_done` est appelé pour chaque flux une fois écrit ;
+    `concurrency` limite les téléchargements simultanés.
+    """
+    metrics = PipelineMetrics()
+    metrics.feeds = len(feeds)
+    by_id = {f.id: f for f in feeds}
+
+    to_parse: queue.Queue = queue.Queue(QUEUE_SIZE)
+    to_dedup: queue.Queue = queue.Queue(QUEUE_SIZE)
+    to_write: queue.Queue = queue.Queue(QUEUE_SIZE)
+    inserted_lock = threading.Lock()
+
+    def written(item: PipelineItem, error: Optional[BaseException]) -> None:
+        with inserted_lock:
+            metrics.inserted += item.inserted
+            metrics.entries += len(item.parsed.entries) if item.parsed is not None else 0
+            metrics.errors += int(bool(item.result.error))
+            metrics.feed_seconds.append(item.result.elapsed + time.perf_counter() - item.handed_off)
+        if on_done is not None:
+            on_done(item)
+
+    fetch_metrics = metrics.stage("fetch", min(concurrency or FETCH_CONCURRENCY, FETCH_CONCURRENCY))
+    stages = [
+        _Stage(_parse, PARSE_WORKERS, to_parse, to_dedup, metrics.stage("parse", PARSE_WORKERS)),
+        _Stage(_dedup, DEDUP_WORKERS, to_dedup, to_write, metrics.stage("dedup", DEDUP_WORKERS), uses_db=True),
+        _WriteStage(_write, WRITE_WORKERS, to_write, None, metrics.stage("write", WRITE_WORKERS), on_item=written),
+    ]
+    for stage in stages:
+        stage.start()
+
+    fetch_started = time.perf_counter()
+
+    async def hand_off(result: FetchResult) -> None:
+        fetch_metrics.record(0.0, to_parse.qsize(), bool(result.error))
+        item = PipelineItem(feed=by_id[result.feed_id], result=result, handed_off=time.perf_counter())
+        if result.not_modified:
+            metrics.not_modified += 1
+        elif unchanged_body(item.feed, result):
+            metrics.unchanged += 1
+            item.unchanged = True
+            result.content = b""
+        while True:
+            try:
+                to_parse.put_nowait(item)
+                return
+            except queue.Full:
+                await asyncio.sleep(0.05)
+
+    try:
+        targets = [FetchTarget(feed_id=f.id, url=f.url, headers=conditional_headers(f)) for f in feeds]
+        if targets:
+            asyncio.run(fetch_feeds_async(targets, on_result=hand_off, concurrency=concurrency))
+        # busy_seconds de l'étape de téléchargement = durée totale (étape asynchrone)
+        fetch_metrics.busy_seconds = time.perf_counter() - fetch_started
+    finally:
+        for stage in stages:
+            stage.close()
+
+    metrics.wall_seconds = time.time() - metrics.started_at
+    return metrics
+
+
+# ========= Voie prioritaire =========
+_priority_active = 0
+_priority_cond = threading.Condition()
+
+
+@contextmanager
+def priority_lane():
+    """
+    Marque un rafraîchissement demandé par un utilisateur : tant qu'il est en
+    cours, le cycle de fond ne réserve pas de nouveau lot et lui laisse le
+    réseau et la base.
+    """
+    global _priority_active
+    with _priority_cond:
+        _priority_active += 1
+    try:
+        yield
+    finally:
+        with _priority_cond:
+            _priority_active -= 1
+            _priority_cond.notify_all()
+
+
+def _yield_to_priority() -> None:
+    # Borné : un flot continu de demandes manuelles ne doit pas affamer le cycle de fond
+    with _priority_cond:
+        _priority_cond.wait_for(lambda: _priority_active == 0, timeout=PRIORITY_MAX_WAIT)
+
+
+def refresh_due_feeds(
+    max_batches: Optional[int] = None,
+    budget: Optional[float] = None,
+    concurrency: Optional[int] = None,
+    feed_ids: Optional[List[int]] = None,
+) -> PipelineMetrics:
+    """
+    Un cycle d'ingestion : réserve des lots de flux échus (baux en base,
+    parmi `feed_ids` s'il est donné) et les fait passer dans le pipeline
+    jusqu'à épuisement. Peut tourner dans n'importe quel nombre de processus
+    en parallèle. Les demandes manuelles (voie prioritaire) passent entre
+    deux lots.
+
+    Aucun lot n'est plus commencé s'il risque de finir après `budget`
+    secondes (CYCLE_BUDGET par défaut) : les flux restants, les moins lus
+    d'abord (cf. claim_due_feeds), attendent le cycle suivant.
+    """
+    return _run_batches(
+        lambda session: claim_due_feeds(session, WORKER_ID, CLAIM_BATCH, LEASE_SECONDS, feed_ids),
+        lambda session: count_due_feeds(session, feed_ids=feed_ids),
+        max_batches, CYCLE_BUDGET if budget is None else budget, concurrency,
+    )
+
+
+def refresh_feeds(feed_ids: List[int], budget: float = 0, concurrency: Optional[int] = None) -> PipelineMetrics:
+    """
+    Rafraîchit `feed_ids`, échus ou non, par lots de CLAIM_BATCH (cf.
+    claim_feeds : les flux réservés ailleurs ou rafraîchis il y a moins de
+    MIN_REFRESH_INTERVAL secondes sont sautés).
+    """
+    pending = list(dict.fromkeys(feed_ids))
+
+    def claim(session: Session) -> list:
+        while pending:
+            batch = pending[:CLAIM_BATCH]
+            del pending[:CLAIM_BATCH]
+            claimed = claim_feeds(session, WORKER_ID, batch, LEASE_SECONDS)
+            if claimed:
+                return claimed
+        return []
+
+    return _run_batches(claim, lambda session: len(pending), None, budget, concurrency)
+
+
+def _run_batches(
+    claim: Callable[[Session], list],
+    remaining: Callable[[Session], int],
+    max_batches: Optional[int],
+    budget: float,
+    concurrency: Optional[int],
+) -> PipelineMetrics:
+    global last_run_metrics
+    total = PipelineMetrics()
+    batches = 0
+    last_batch = 0.0
+    while max_batches is None or batches < max_batches:
+        # Estimation : le prochain lot durera autant que le précédent
+        if budget and time.time() - total.started_at + last_batch > budget:
+            with Session(engine) as session:
+                total.deferred = remaining(session)
+            break
+        _yield_to_priority()
+        batch_started = time.time()
+        with Session(engine) as session:
+            claimed = claim(session)
+        if not claimed:
+            break
+        batches += 1
+
+        feeds = []
+        for row in claimed:
+            # Un rafraîchissement manuel est déjà en cours dans ce processus : on le
+            # laisse faire (il replanifie le flux, le bail expirera de lui-même)
+            _, leader = feed_flights.claim(row.id)
+            if leader:
+                feeds.append(row)
+
+        def release(item: PipelineItem) -> None:
+            # Débloque les demandes manuelles qui attendaient ce flux
+            feed_flights.release(item.feed.id, result={"inserted": item.inserted})
+
+        try:
+            metrics = run_pipeline(feeds, on_done=release, concurrency=concurrency)
+            last_run_metrics = metrics
+        finally:
+            for row in feeds:
+                feed_flights.release(row.id, result={"inserted": 0})
+        total.feeds += metrics.feeds
+        total.inserted += metrics.inserted
+        total.not_modified += metrics.not_modified
+        total.unchanged += metrics.unchanged
+        total.entries += metrics.entries
+        total.errors += metrics.errors
+        total.feed_seconds.extend(metrics.feed_seconds)
+        total.stages = metrics.stages
+        last_batch = time.time() - batch_started
+
+    total.wall_seconds = time.time() - total.started_at
+    return total
+
@@ -1,12 +1,15 @@
 import os
 import re
 import sys
+import json
+import asyncio
 import secrets
-from typing import List, Optional, Dict, Any
+from typing import List, Optional
 
 from dotenv import load_dotenv
 from fastapi import FastAPI, Depends, HTTPException, status, Form, Request, Query, UploadFile, File
-from fastapi.responses import RedirectResponse, JSONResponse, Response
+from fastapi.responses import RedirectResponse, JSONResponse, Response, StreamingResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
 import xml.etree.ElementTree as ET
 from datetime import datetime, timedelta
 from fastapi.security import OAuth2PasswordRequestForm
@@ -23,7 +26,7 @@ from models import (
     User, UserCreate,
     EmailVerificationCode,
     Collection, CollectionCreate,
-    Feed, FeedCreate,
+    Feed, FeedCreate, FeedOut, FeedHealth,
     CollectionMember,
     Article, ArticleCreate,
     ArticleOut,
@@ -31,16 +34,31 @@ from models import (
     ArticleStar,
     ArticleArchive, ArchiveOut,
     CollectionMessage, MessageCreate, MessageOut, MessageReadFlag,
+    ReaderCache,
 )
 from utils import hash_password, verify_password
 from auth import create_access_token, get_current_user
 from oauth import oauth
+from feed_parsing import shutdown_pool as shutdown_parse_pool
+import ingestion_pipeline
+from ingestion_pipeline import refresh_due_feeds
+from ingestion import backfill_link_hashes, backfill_published_at, backfill_url_hashes
+from refresh_jobs import submit_refresh, fetch_new_feeds, get_job, job_state, revalidate, shutdown_jobs
+import websub
+from feed_scheduling import health_status
+from feed_activity import ACTIVITY_INTERVAL, update_activity_scores
+from retention import PRUNE_INTERVAL, READER_CACHE_TTL, backfill_fetched_at, policy_for, prune_articles
+from urls import url_hash
+from feed_sources import (
+    SOURCE_ID, add_feed, add_feed_in_savepoint, backfill_sources, load_sources, readable_collections, readable_sources,
+    remove_feeds, source_of, subscription_for, subscriptions_for,
+)
 
-import feedparser
 import requests
 from apscheduler.schedulers.background import BackgroundScheduler
 import bleach
 from sqlalchemy import or_, and_, func
+from sqlalchemy.exc import IntegrityError
 from env_loader import load_env_smart
 
 # Chargement intelligent des variables d'environnement (chiffrées ou non)
@@ -87,6 +105,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Revalidating", "X-Refresh-Job"],
 )
 
 # --- Sessions (OAuth Google/GitHub) ---
@@ -144,30 +163,68 @@ def require_strong_password(pwd: str):
 ALLOWED_TAGS = bleach.sanitizer.ALLOWED_TAGS | {"p", "img", "figure", "figcaption", "h1", "h2", "h3", "pre", "code", "blockquote"}
 ALLOWED_ATTRS = {**bleach.sanitizer.ALLOWED_ATTRIBUTES, "img": ["src", "alt", "title", "width", "height"]}
 
-def fetch_clean_html(url: str) -> str:
-    try:
-        r = requests.get(url, timeout=12, headers={"User-Agent": "SUPRSS/1.0"})
+HTML_MAX_BYTES = int(os.getenv("HTML_MAX_BYTES", str(2 * 1024 * 1024)))  # pages au-delà : tronquées
+
+def fetch_page_text(url: str) -> str:
+    """Télécharge une page en flux, tronquée à HTML_MAX_BYTES (après décompression)"""
+    with requests.get(url, timeout=12, headers={"User-Agent": "SUPRSS/1.0"}, stream=True) as r:
         r.raise_for_status()
-        
-        # Tentative d'extraction avec readability
-        try:
-            from readability import Document
-            html = Document(r.text).summary(html_partial=True)
-        except ImportError:
-            # Si readability n'est pas installé, utiliser le contenu brut
-            html = r.text
-        except Exception as e:
-            # Si readability échoue, utiliser le contenu brut
-            print(f"Readability extraction failed for {url}: {e}")
-            html = r.text
-        
-        # Nettoyage HTML avec bleach
-        clean_html = bleach.clean(html, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRS, strip=True)
+        body = bytearray()
+        for chunk in r.iter_content(chunk_size=64 * 1024):
+            body.extend(chunk)
+            if len(body) >= HTML_MAX_BYTES:
+                del body[HTML_MAX_BYTES:]
+                break
+        return body.decode(r.encoding or "utf-8", errors="replace")
+
+def extract_clean_html(url: str) -> str:
+    """Contenu lisible de la page, nettoyé (lève les erreurs de téléchargement)"""
+    text = fetch_page_text(url)
+    
+    # Tentative d'extraction avec readability
+    try:
+        from readability import Document
+        html = Document(text).summary(html_partial=True)
+    except ImportError:
+        # Si readability n'est pas installé, utiliser le contenu brut
+        html = text
+    except Exception as e:
+        # Si readability échoue, utiliser le contenu brut
+        print(f"Readability extraction failed for {url}: {e}")
+        html = text
+    
+    # Nettoyage HTML avec bleach
+    return bleach.clean(html, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRS, strip=True)
+
+def fetch_clean_html(url: str, key: Optional[str] = None) -> str:
+    """
+    Vue lecture d'un lien. Le résultat est mis en cache (READER_CACHE_TTL)
+    sous le hash du lien canonique `key` : les variantes d'un même article
+    (paramètres de suivi, autre flux) ne retéléchargent pas la page.
+    Les erreurs ne sont pas mises en cache.
+    """
+    key = key or url_hash(url)
+    with Session(engine) as session:
+        cached = session.exec(select(ReaderCache).where(ReaderCache.url_hash == key)).first()
+        if cached and cached.fetched_at >= datetime.utcnow() - timedelta(seconds=READER_CACHE_TTL):
+            return cached.html
+    try:
+        clean_html = extract_clean_html(url)
         
         # Vérifier que le contenu nettoyé n'est pas vide
         if not clean_html.strip():
             return "<p>Contenu extrait mais vide après nettoyage.</p>"
-            
+        
+        with Session(engine) as session:
+            cached = session.exec(select(ReaderCache).where(ReaderCache.url_hash == key)).first()
+            if cached:
+                cached.html, cached.fetched_at = clean_html, datetime.utcnow()
+            else:
+                session.add(ReaderCache(url_hash=key, html=clean_html))
+            try:
+                session.commit()
+            except IntegrityError:
+                session.rollback()  # mise en cache concurrente du même lien
         return clean_html
         
     except requests.exceptions.Timeout:
@@ -177,31 +234,28 @@ def fetch_clean_html(url: str) -> str:
     except Exception as e:
         return f"<p>Impossible d'extraire un contenu lisible pour cet article : {str(e)}</p>"
 
-# ========= Dédoublonnage léger =========
-def looks_duplicate(session: Session, feed_id: int, link: str, title: str) -> bool:
-    existing = session.exec(
-        select(Article).where(Article.feed_id == feed_id, Article.link == (link or ""))
-    ).first()
-    if existing:
-        return True
-    if title:
-        existing_title = session.exec(
-            select(Article).where(Article.feed_id == feed_id, Article.title == title[:255])
-        ).first()
-        if existing_title:
-            return True
-    return False
-
 # ========= App state & scheduler =========
-app.state.feed_cache: Dict[int, Dict[str, Any]] = {}
 scheduler: Optional[BackgroundScheduler] = None
 
 @app.on_event("startup")
 def on_startup():
     create_db_and_tables()
+    backfill_link_hashes()
+    backfill_url_hashes()
+    backfill_fetched_at()
+    backfill_published_at()
+    backfill_sources()
     global scheduler
+    if not SCHEDULER_ENABLED:
+        # Ingestion confiée à des processus dédiés (python worker.py)
+        return
     scheduler = BackgroundScheduler()
-    scheduler.add_job(refresh_all_feeds_job, "interval", minutes=10, max_instances=1)
+    # Le job ne traite que les flux échus (next_fetch_at), il peut donc tourner souvent
+    scheduler.add_job(refresh_all_feeds_job, "interval", seconds=SCHEDULER_TICK, max_instances=1)
+    scheduler.add_job(prune_articles_job, "interval", seconds=PRUNE_INTERVAL, max_instances=1)
+    # Priorités sous charge : calculées tout de suite, puis recalculées périodiquement
+    scheduler.add_job(update_activity_scores, "interval", seconds=ACTIVITY_INTERVAL, max_instances=1,
+                      next_run_time=datetime.now())
     scheduler.start()
 
 @app.on_event("shutdown")
@@ -209,12 +263,19 @@ def on_shutdown():
     global scheduler
     if scheduler:
         scheduler.shutdown(wait=False)
+    shutdown_jobs()
+    shutdown_parse_pool()
 
 @app.get("/")
 def read_root():
     return {"message": "Bienvenue sur SUPRSS"}
 
 # ========= AUTH =========
+class RetentionUpdate(BaseModel):
+    # None : politique de l'instance, 0 : illimité
+    retention_days: Optional[int] = None
+    retention_max_per_feed: Optional[int] = None
+
 class PasswordUpdate(BaseModel):
     new_password: str
 
@@ -472,6 +533,34 @@ def share_collection(
         session.commit()
         return {"message": f"Collection partagée avec {email} en tant que {role}"}
 
+@app.put("/collections/{collection_id}/retention")
+def update_collection_retention(
+    collection_id: int,
+    data: RetentionUpdate,
+    current_user: User = Depends(get_current_user),
+):
+    """Politique de rétention des articles de la collection (propriétaire uniquement)"""
+    with Session(engine) as session:
+        collection = session.get(Collection, collection_id)
+        if not collection:
+            raise HTTPException(status_code=404, detail="Collection introuvable")
+        if collection.user_id != current_user.id:
+            raise HTTPException(status_code=403, detail="Seul le propriétaire peut modifier la rétention")
+        if any(v is not None and v < 0 for v in (data.retention_days, data.retention_max_per_feed)):
+            raise HTTPException(status_code=400, detail="Les valeurs de rétention doivent être positives")
+
+        collection.retention_days = data.retention_days
+        collection.retention_max_per_feed = data.retention_max_per_feed
+        session.add(collection)
+        session.commit()
+        policy = policy_for(collection)
+        return {
+            "collection_id": collection.id,
+            "retention_days": collection.retention_days,
+            "retention_max_per_feed": collection.retention_max_per_feed,
+            "effective": {"max_age_days": policy.max_age_days, "max_per_feed": policy.max_per_feed},
+        }
+
 @app.delete("/collections/{collection_id}")
 def delete_collection(collection_id: int, current_user: User = Depends(get_current_user)):
     """Supprime une collection (seul le propriétaire peut supprimer)"""
@@ -484,28 +573,10 @@ def delete_collection(collection_id: int, current_user: User = Depends(get_curre
         if collection.user_id != current_user.id:
             raise HTTPException(status_code=403, detail="Seul le propriétaire peut supprimer cette collection")
         
-        # Récupérer tous les feeds de la collection pour avoir leurs IDs
+        # Supprimer les flux de la collection : leurs sources encore suivies par
+        # d'autres collections sont conservées (cf. feed_sources.py)
         feeds = session.exec(select(Feed).where(Feed.collection_id == collection_id)).all()
-        feed_ids = [feed.id for feed in feeds]
-        
-        # Récupérer tous les articles des feeds pour avoir leurs IDs
-        article_ids = []
-        if feed_ids:
-            articles = session.exec(select(Article).where(Article.feed_id.in_(feed_ids))).all()
-            article_ids = [article.id for article in articles]
-        
-        # Supprimer en lot tous les flags et étoiles des articles
-        if article_ids:
-            session.exec(delete(ArticleReadFlag).where(ArticleReadFlag.article_id.in_(article_ids)))
-            session.exec(delete(ArticleStar).where(ArticleStar.article_id.in_(article_ids)))
-            session.exec(delete(ArticleArchive).where(ArticleArchive.article_id.in_(article_ids)))
-        
-        # Supprimer tous les articles des feeds
-        if feed_ids:
-            session.exec(delete(Article).where(Article.feed_id.in_(feed_ids)))
-        
-        # Supprimer tous les feeds de la collection
-        session.exec(delete(Feed).where(Feed.collection_id == collection_id))
+        remove_feeds(session, list(feeds))
         
         # Récupérer les messages de la collection pour avoir leurs IDs
         messages = session.exec(select(CollectionMessage).where(CollectionMessage.collection_id == collection_id)).all()
@@ -529,7 +600,8 @@ def delete_collection(collection_id: int, current_user: User = Depends(get_curre
 
 # ========= FEEDS =========
 @app.post("/feeds/")
-def create_feed(feed: FeedCreate, current_user: User = Depends(get_current_user)):
+def create_feed(feed: FeedCreate, response: Response, current_user: User = Depends(get_current_user)):
+    """Ajoute un flux et lance son premier téléchargement en tâche de fond (en-tête X-Refresh-Job)"""
     with Session(engine) as session:
         collection = session.get(Collection, feed.collection_id)
         
@@ -551,18 +623,45 @@ def create_feed(feed: FeedCreate, current_user: User = Depends(get_current_user)
         if not collection or not is_authorized:
             raise HTTPException(status_code=403, detail="Accès interdit : seuls les propriétaires, administrateurs et éditeurs peuvent ajouter des flux")
 
-        new_feed = Feed(
-            url=feed.url,
-            title=feed.title,
-            description=feed.description,
-            collection_id=feed.collection_id,
-        )
-        session.add(new_feed)
-        session.commit()
+        # URL déjà suivie par une autre collection : on s'abonne à sa source (articles déjà là)
+        try:
+            new_feed = add_feed(session, feed.url, feed.collection_id, feed.title, feed.description)
+            session.commit()
+        except IntegrityError:
+            # Source créée au même instant par une autre requête : on s'y rattache
+            session.rollback()
+            new_feed = add_feed(session, feed.url, feed.collection_id, feed.title, feed.description)
+            session.commit()
         session.refresh(new_feed)
-        return new_feed
+        source = session.get(Feed, source_of(new_feed))
+        if new_feed.source_id is None:
+            response.headers["X-Refresh-Job"] = fetch_new_feeds(current_user.id, [new_feed.id])
+        return feed_out(new_feed, source)
+
+def feed_out(feed: Feed, source: Optional[Feed] = None) -> FeedOut:
+    """
+    Flux tel qu'exposé par l'API : sans les colonnes internes (validateurs,
+    baux, secret WebSub). La santé est celle de la source (cf. feed_sources.py).
+    """
+    source = source or feed
+    return FeedOut(
+        id=feed.id,
+        url=feed.url,
+        title=feed.title,
+        description=feed.description,
+        collection_id=feed.collection_id,
+        health=FeedHealth(
+            status=health_status(source.consecutive_failures or 0),
+            consecutive_failures=source.consecutive_failures or 0,
+            last_error=source.last_error,
+            last_error_at=source.last_error_at,
+            last_success_at=source.last_success_at,
+            avg_latency_ms=source.avg_latency_ms,
+            next_fetch_at=source.next_fetch_at,
+        ),
+    )
 
-@app.get("/feeds/")
+@app.get("/feeds/", response_model=List[FeedOut])
 def get_feeds(collection_id: int, current_user: User = Depends(get_current_user)):
     with Session(engine) as session:
         collection = session.get(Collection, collection_id)
@@ -575,7 +674,9 @@ def get_feeds(collection_id: int, current_user: User = Depends(get_current_user)
         if not collection or (collection.user_id != current_user.id and not is_member):
             raise HTTPException(status_code=403, detail="Accès interdit")
 
-        return session.exec(select(Feed).where(Feed.collection_id == collection_id)).all()
+        feeds = session.exec(select(Feed).where(Feed.collection_id == collection_id)).all()
+        sources = load_sources(session, feeds)
+        return [feed_out(f, sources[source_of(f)]) for f in feeds]
 
 @app.get("/feeds/summary")
 def feeds_summary(collection_id: int, current_user: User = Depends(get_current_user)):
@@ -591,10 +692,11 @@ def feeds_summary(collection_id: int, current_user: User = Depends(get_current_u
             raise HTTPException(status_code=403, detail="Accès interdit")
 
         feeds = session.exec(select(Feed).where(Feed.collection_id == collection_id)).all()
+        sources = load_sources(session, feeds)
         result = []
         for f in feeds:
             article_ids: list[int] = session.exec(
-                select(Article.id).where(Article.feed_id == f.id)
+                select(Article.id).where(Article.feed_id == source_of(f))
             ).all()
             if not article_ids:
                 unread = 0
@@ -613,11 +715,12 @@ def feeds_summary(collection_id: int, current_user: User = Depends(get_current_u
                 "title": f.title,
                 "description": f.description,
                 "url": f.url,
-                "unread": unread
+                "unread": unread,
+                "health": health_status(sources[source_of(f)].consecutive_failures or 0),
             })
         return result
 
-@app.get("/feeds/{feed_id}")
+@app.get("/feeds/{feed_id}", response_model=FeedOut)
 def get_feed(feed_id: int, current_user: User = Depends(get_current_user)):
     """Récupère les informations d'un feed"""
     with Session(engine) as session:
@@ -635,15 +738,9 @@ def get_feed(feed_id: int, current_user: User = Depends(get_current_user)):
         if collection.user_id != current_user.id and not is_member:
             raise HTTPException(status_code=403, detail="Non autorisé")
 
-        return {
-            "id": feed.id,
-            "title": feed.title,
-            "url": feed.url,
-            "description": feed.description,
-            "collection_id": feed.collection_id
-        }
+        return feed_out(feed, session.get(Feed, source_of(feed)))
 
-@app.post("/feeds/{feed_id}/refresh")
+@app.post("/feeds/{feed_id}/refresh", status_code=202)
 def refresh_feed(feed_id: int, current_user: User = Depends(get_current_user)):
     with Session(engine) as session:
         feed = session.get(Feed, feed_id)
@@ -660,44 +757,10 @@ def refresh_feed(feed_id: int, current_user: User = Depends(get_current_user)):
         if collection.user_id != current_user.id and not is_member:
             raise HTTPException(status_code=403, detail="Non autorisé")
 
-        # ETag/Modified en mémoire
-        headers = {}
-        cache = app.state.feed_cache.get(feed_id, {})
-        if cache.get("etag"):
-            headers["If-None-Match"] = cache["etag"]
-        if cache.get("modified"):
-            headers["If-Modified-Since"] = cache["modified"]
+    # Rafraîchissement en tâche de fond (voie prioritaire) : suivi via /refresh-jobs/{job_id}
+    return job_state(submit_refresh(current_user.id, [feed_id]))
 
-        parsed = feedparser.parse(feed.url, request_headers=headers)
-
-        if parsed.get("etag"):
-            cache["etag"] = parsed.etag
-        if parsed.get("modified"):
-            try:
-                import email.utils as eut
-                cache["modified"] = eut.formatdate(feedparser.mktime_tz(parsed.modified))
-            except Exception:
-                pass
-        app.state.feed_cache[feed_id] = cache
-
-        if getattr(parsed, "status", None) == 304:
-            return {"inserted": 0}
-
-        created = 0
-        for e in parsed.entries:
-            link = getattr(e, "link", "") or ""
-            title = getattr(e, "title", "") or "(sans titre)"
-            summary = getattr(e, "summary", None) or getattr(e, "description", "") or ""
-            if looks_duplicate(session, feed_id, link, title):
-                continue
-            a = Article(title=title[:255], content=summary, link=link, feed_id=feed_id)
-            session.add(a)
-            created += 1
-
-        session.commit()
-        return {"inserted": created}
-
-@app.post("/collections/{collection_id}/refresh-all")
+@app.post("/collections/{collection_id}/refresh-all", status_code=202)
 def refresh_all(collection_id: int, current_user: User = Depends(get_current_user)):
     with Session(engine) as session:
         collection = session.get(Collection, collection_id)
@@ -713,27 +776,80 @@ def refresh_all(collection_id: int, current_user: User = Depends(get_current_use
         if collection.user_id != current_user.id and not is_member:
             raise HTTPException(status_code=403, detail="Non autorisé")
 
-        feeds = session.exec(select(Feed).where(Feed.collection_id == collection_id)).all()
-        total_inserted = 0
-        for f in feeds:
-            parsed = feedparser.parse(f.url)
-            for e in parsed.entries:
-                link = getattr(e, "link", "") or ""
-                title = getattr(e, "title", "") or "(sans titre)"
-                summary = getattr(e, "summary", None) or getattr(e, "description", "") or ""
-
-                exists = session.exec(
-                    select(Article).where(Article.feed_id == f.id, Article.link == link)
-                ).first()
-                if exists:
-                    continue
-
-                a = Article(title=title[:255], content=summary, link=link, feed_id=f.id)
-                session.add(a)
-                total_inserted += 1
+        feed_ids = session.exec(select(Feed.id).where(Feed.collection_id == collection_id)).all()
+
+    return job_state(submit_refresh(current_user.id, list(feed_ids)))
+
+@app.get("/refresh-jobs/{job_id}")
+def refresh_job_status(job_id: str, current_user: User = Depends(get_current_user)):
+    """Avancement d'un rafraîchissement, flux par flux"""
+    job = get_job(job_id, current_user.id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Rafraîchissement introuvable")
+    return job_state(job_id)
+
+@app.get("/refresh-jobs/{job_id}/events")
+async def refresh_job_events(job_id: str, current_user: User = Depends(get_current_user)):
+    """Même avancement en Server-Sent Events : un événement à chaque changement, jusqu'à la fin du job"""
+    job = get_job(job_id, current_user.id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Rafraîchissement introuvable")
+
+    async def events():
+        # L'état est en base : le job peut tourner dans un autre processus
+        last = None
+        while True:
+            state = await run_in_threadpool(job_state, job_id)
+            if state != last:
+                last = state
+                yield f"data: {json.dumps(state)}\n\n"
+                if state["status"] == "done":
+                    return
+            await asyncio.sleep(0.5)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.post("/feeds/{feed_id}/websub/subscribe")
+def websub_subscribe(feed_id: int, current_user: User = Depends(get_current_user)):
+    """Abonnement push (WebSub) au hub annoncé par le flux"""
+    with Session(engine) as session:
+        feed = session.get(Feed, feed_id)
+        if not feed:
+            raise HTTPException(status_code=404, detail="Flux introuvable")
 
-        session.commit()
-        return {"inserted": total_inserted}
+        collection = feed.collection
+        is_member = session.exec(
+            select(CollectionMember).where(
+                CollectionMember.collection_id == collection.id,
+                CollectionMember.user_id == current_user.id,
+            )
+        ).first()
+        if collection.user_id != current_user.id and not is_member:
+            raise HTTPException(status_code=403, detail="Non autorisé")
+        if not websub.enabled():
+            raise HTTPException(status_code=400, detail="Push WebSub non configuré sur ce serveur")
+        # L'abonnement push est porté par la source, partagée entre collections
+        source = session.get(Feed, source_of(feed))
+        if not source.websub_hub:
+            raise HTTPException(status_code=400, detail="Ce flux n'annonce pas de hub WebSub")
+
+        return {"feed_id": feed.id, "hub": source.websub_hub, "state": websub.subscribe(session, source)}
+
+@app.get("/websub/callback/{feed_id}/{token}")
+def websub_verify(feed_id: int, token: str, request: Request):
+    """Vérification d'intention du hub : on renvoie hub.challenge si l'abonnement est attendu"""
+    challenge = websub.verify_intent(feed_id, token, dict(request.query_params))
+    if challenge is None:
+        raise HTTPException(status_code=404, detail="Abonnement inconnu")
+    return PlainTextResponse(challenge)
+
+@app.post("/websub/callback/{feed_id}/{token}", status_code=202)
+async def websub_receive(feed_id: int, token: str, request: Request):
+    """Nouveautés poussées par le hub (appelé par le hub, sans authentification : jeton et signature HMAC)"""
+    body = await request.body()
+    headers = {k.lower(): v for k, v in request.headers.items()}
+    await run_in_threadpool(websub.receive, feed_id, token, body, headers)
+    return Response(status_code=202)
 
 @app.delete("/feeds/{feed_id}")
 def delete_feed(feed_id: int, current_user: User = Depends(get_current_user)):
@@ -762,33 +878,9 @@ def delete_feed(feed_id: int, current_user: User = Depends(get_current_user)):
         
         if not has_permission:
             raise HTTPException(status_code=403, detail="Permissions insuffisantes pour supprimer ce flux")
-        
-        # Supprimer tous les articles du flux EN LOT (optimisé)
-        article_ids = session.exec(select(Article.id).where(Article.feed_id == feed_id)).all()
-        
-        if article_ids:
-            article_ids = list(article_ids)
-            
-            # Supprimer les messages liés aux articles
-            message_ids = session.exec(
-                select(CollectionMessage.id).where(CollectionMessage.article_id.in_(article_ids))
-            ).all()
-            
-            if message_ids:
-                message_ids = list(message_ids)
-                session.exec(delete(MessageReadFlag).where(MessageReadFlag.message_id.in_(message_ids)))
-                session.exec(delete(CollectionMessage).where(CollectionMessage.id.in_(message_ids)))
-            
-            # Supprimer les flags et étoiles des articles en lot
-            session.exec(delete(ArticleReadFlag).where(ArticleReadFlag.article_id.in_(article_ids)))
-            session.exec(delete(ArticleStar).where(ArticleStar.article_id.in_(article_ids)))
-            session.exec(delete(ArticleArchive).where(ArticleArchive.article_id.in_(article_ids)))
-            
-            # Supprimer les articles en lot
-            session.exec(delete(Article).where(Article.id.in_(article_ids)))
-        
-        # Supprimer le flux
-        session.delete(feed)
+
+        # Supprimer le flux ; ses articles ne partent qu'avec le dernier abonnement à la source
+        remove_feeds(session, [feed])
         session.commit()
         
         return {"ok": True, "message": "Flux supprimé avec succès"}
@@ -797,13 +889,24 @@ def delete_feed(feed_id: int, current_user: User = Depends(get_current_user)):
 @app.get("/articles/", response_model=List[ArticleOut])
 def list_articles(
     feed_id: int,
+    response: Response,
     q: Optional[str] = Query(None, description="Recherche plein texte (titre + contenu)"),
     read: Optional[str] = Query(None, regex="^(true|false)$", description="Filtre lu/non-lu"),
     starred: Optional[str] = Query(None, regex="^(true|false)$", description="Filtre favoris"),
     limit: int = Query(20, ge=1, le=100),
     offset: int = Query(0, ge=0),
+    since: Optional[datetime] = Query(None, description="Publiés à partir de cette date (UTC)"),
+    until: Optional[datetime] = Query(None, description="Publiés avant cette date (UTC)"),
+    revalidate_stale: bool = Query(True, alias="revalidate", description="Rafraîchir en tâche de fond un flux ancien"),
     current_user: User = Depends(get_current_user)
 ):
+    """
+    Articles du flux, du plus récent au plus ancien (date de publication,
+    index feed_id/published_at/id). Si les données sont anciennes,
+    un rafraîchissement conditionnel part en tâche de fond et les en-têtes
+    X-Revalidating / X-Refresh-Job indiquent le job à suivre
+    (GET /refresh-jobs/{job_id}) pour récupérer les nouveautés.
+    """
     with Session(engine) as session:
         feed = session.get(Feed, feed_id)
         if not feed:
@@ -819,7 +922,22 @@ def list_articles(
         if collection.user_id != current_user.id and not is_member:
             raise HTTPException(status_code=403, detail="Non autorisé")
 
-        stmt = select(Article).where(Article.feed_id == feed_id).order_by(Article.id.desc())
+        # Stale-while-revalidate : à l'ouverture du flux (première page) seulement
+        source = session.get(Feed, source_of(feed))
+        job_id = revalidate(current_user.id, feed, source) if revalidate_stale and offset == 0 else None
+        if job_id is not None:
+            response.headers["X-Revalidating"] = "true"
+            response.headers["X-Refresh-Job"] = job_id
+
+        stmt = (
+            select(Article)
+            .where(Article.feed_id == source.id)
+            .order_by(Article.published_at.desc(), Article.id.desc())
+        )
+        if since:
+            stmt = stmt.where(Article.published_at >= since)
+        if until:
+            stmt = stmt.where(Article.published_at < until)
         if q:
             like = f"%{q.strip()}%"
             stmt = stmt.where(or_(Article.title.ilike(like), Article.content.ilike(like)))
@@ -861,8 +979,8 @@ def list_articles(
             if starred == "false" and is_star:
                 continue
             out.append(ArticleOut(
-                id=a.id, title=a.title, content=a.content, link=a.link, feed_id=a.feed_id,
-                read=is_read, starred=is_star
+                id=a.id, title=a.title, content=a.content, link=a.link, feed_id=feed_id,
+                read=is_read, starred=is_star, published_at=a.published_at
             ))
         return out
 
@@ -873,15 +991,9 @@ def get_article(article_id: int, current_user: User = Depends(get_current_user))
         if not a:
             raise HTTPException(status_code=404, detail="Article introuvable")
 
-        feed = session.get(Feed, a.feed_id)
-        collection = feed.collection
-        is_member = session.exec(
-            select(CollectionMember).where(
-                CollectionMember.collection_id == collection.id,
-                CollectionMember.user_id == current_user.id,
-            )
-        ).first()
-        if collection.user_id != current_user.id and not is_member:
+        # Article d'une source partagée : lu via l'abonnement de l'une des collections de l'utilisateur
+        feed = subscription_for(session, current_user.id, a.feed_id)
+        if not feed:
             raise HTTPException(status_code=403, detail="Non autorisé")
 
         was_read = session.exec(
@@ -899,8 +1011,8 @@ def get_article(article_id: int, current_user: User = Depends(get_current_user))
         ).first() is not None
 
         return ArticleOut(
-            id=a.id, title=a.title, content=a.content, link=a.link, feed_id=a.feed_id,
-            read=was_read, starred=is_star
+            id=a.id, title=a.title, content=a.content, link=a.link, feed_id=feed.id,
+            read=was_read, starred=is_star, published_at=a.published_at
         )
 
 # Reader view (HTML nettoyé)
@@ -910,20 +1022,12 @@ def reader_view(article_id: int, current_user: User = Depends(get_current_user))
         a = session.get(Article, article_id)
         if not a:
             raise HTTPException(status_code=404, detail="Article introuvable")
-        feed = session.get(Feed, a.feed_id)
-        collection = feed.collection
-        is_member = session.exec(
-            select(CollectionMember).where(
-                CollectionMember.collection_id == collection.id,
-                CollectionMember.user_id == current_user.id,
-            )
-        ).first()
-        if collection.user_id != current_user.id and not is_member:
+        if not subscription_for(session, current_user.id, a.feed_id):
             raise HTTPException(status_code=403, detail="Non autorisé")
 
         if not a.link:
             return JSONResponse({"html": "<p>Aucun lien source.</p>"})
-        clean_html = fetch_clean_html(a.link)
+        clean_html = fetch_clean_html(a.link, a.url_hash)
         return JSONResponse({"html": clean_html})
 
 # ---- Lu / Non lu ----
@@ -974,7 +1078,7 @@ def mark_all_read(feed_id: int, current_user: User = Depends(get_current_user)):
             raise HTTPException(status_code=403, detail="Non autorisé")
 
         article_ids: list[int] = session.exec(
-            select(Article.id).where(Article.feed_id == feed_id)
+            select(Article.id).where(Article.feed_id == source_of(feed))
         ).all()
         if not article_ids:
             return {"marked": 0}
@@ -1017,7 +1121,7 @@ def mark_all_unread(feed_id: int, current_user: User = Depends(get_current_user)
             raise HTTPException(status_code=403, detail="Non autorisé")
 
         article_ids: list[int] = session.exec(
-            select(Article.id).where(Article.feed_id == feed_id)
+            select(Article.id).where(Article.feed_id == source_of(feed))
         ).all()
         if not article_ids:
             return {"unmarked": 0}
@@ -1051,21 +1155,11 @@ def list_favorites(
             return []
         
         # Récupérer les articles correspondants avec accès utilisateur vérifié
+        # (sources suivies par ses collections, possédées ou partagées)
         stmt = (
             select(Article)
-            .join(Feed)
-            .join(Collection)
             .where(Article.id.in_(starred_article_ids))
-            .where(
-                or_(
-                    Collection.user_id == current_user.id,  # Collections possédées
-                    Collection.id.in_(  # Collections partagées
-                        select(CollectionMember.collection_id).where(
-                            CollectionMember.user_id == current_user.id
-                        )
-                    )
-                )
-            )
+            .where(Article.feed_id.in_(readable_sources(current_user.id)))
             .order_by(Article.id.desc())
         )
         
@@ -1091,13 +1185,14 @@ def list_favorites(
             ).all()
         )
         
-        # Construire la réponse
+        # Construire la réponse (flux : l'abonnement de l'utilisateur à la source)
+        subscriptions = subscriptions_for(session, current_user.id, {a.feed_id for a in articles})
         out = []
         for a in articles:
             is_read = (a.id in read_ids)
             out.append(ArticleOut(
-                id=a.id, title=a.title, content=a.content, link=a.link, feed_id=a.feed_id,
-                read=is_read, starred=True  # Tous favoris par définition
+                id=a.id, title=a.title, content=a.content, link=a.link, feed_id=subscriptions[a.feed_id],
+                read=is_read, starred=True, published_at=a.published_at  # Tous favoris par définition
             ))
         
         return out
@@ -1108,14 +1203,7 @@ def star_article(article_id: int, current_user: User = Depends(get_current_user)
         art = session.get(Article, article_id)
         if not art:
             raise HTTPException(status_code=404, detail="Article introuvable")
-
-        feed = session.get(Feed, art.feed_id)
-        collection = feed.collection
-        is_member = session.exec(select(CollectionMember).where(
-            CollectionMember.collection_id == collection.id,
-            CollectionMember.user_id == current_user.id,
-        )).first()
-        if collection.user_id != current_user.id and not is_member:
+        if not subscription_for(session, current_user.id, art.feed_id):
             raise HTTPException(status_code=403, detail="Non autorisé")
 
         exists = session.exec(select(ArticleStar).where(
@@ -1159,12 +1247,15 @@ def list_stars(
         stmt = select(Article).where(Article.id.in_(star_article_ids))
 
         if feed_id:
-            stmt = stmt.where(Article.feed_id == feed_id)
+            feed = session.get(Feed, feed_id)
+            if not feed:
+                return []
+            stmt = stmt.where(Article.feed_id == source_of(feed))
         if collection_id:
-            feed_ids = [fid for (fid,) in session.exec(select(Feed.id).where(Feed.collection_id == collection_id)).all()]
-            if not feed_ids:
+            source_ids = list(session.exec(select(SOURCE_ID).where(Feed.collection_id == collection_id)).all())
+            if not source_ids:
                 return []
-            stmt = stmt.where(Article.feed_id.in_(feed_ids))
+            stmt = stmt.where(Article.feed_id.in_(source_ids))
 
         if q:
             like = f"%{q.strip()}%"
@@ -1183,11 +1274,13 @@ def list_stars(
             )
         ).all()])
 
+        subscriptions = subscriptions_for(session, current_user.id, {a.feed_id for a in arts})
         out: List[ArticleOut] = []
         for a in arts:
             out.append(ArticleOut(
-                id=a.id, title=a.title, content=a.content, link=a.link, feed_id=a.feed_id,
-                read=(a.id in read_ids), starred=True
+                id=a.id, title=a.title, content=a.content, link=a.link,
+                feed_id=feed_id or subscriptions.get(a.feed_id, a.feed_id),
+                read=(a.id in read_ids), starred=True, published_at=a.published_at
             ))
         return out
 
@@ -1201,17 +1294,11 @@ def archive_article(article_id: int, current_user: User = Depends(get_current_us
         art = session.get(Article, article_id)
         if not art:
             raise HTTPException(status_code=404, detail="Article introuvable")
-
-        feed = session.get(Feed, art.feed_id)
-        collection = feed.collection
-        is_member = session.exec(select(CollectionMember).where(
-            CollectionMember.collection_id == collection.id,
-            CollectionMember.user_id == current_user.id,
-        )).first()
-        if collection.user_id != current_user.id and not is_member:
+        feed = subscription_for(session, current_user.id, art.feed_id)
+        if not feed:
             raise HTTPException(status_code=403, detail="Non autorisé")
 
-        clean_html = fetch_clean_html(art.link) if art.link else bleach.clean(art.content or "", tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRS, strip=True)
+        clean_html = fetch_clean_html(art.link, art.url_hash) if art.link else bleach.clean(art.content or "", tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRS, strip=True)
 
         # éviter les doublons exacts (même user + même article_id)
         exists = session.exec(select(ArticleArchive).where(
@@ -1224,7 +1311,7 @@ def archive_article(article_id: int, current_user: User = Depends(get_current_us
         snap = ArticleArchive(
             user_id=current_user.id,
             article_id=article_id,
-            feed_id=art.feed_id,
+            feed_id=feed.id,  # abonnement de l'utilisateur : l'archive reste classée dans sa collection
             title=art.title[:255] if art.title else "(sans titre)",
             content_html=clean_html,
             link=art.link or "",
@@ -1246,8 +1333,9 @@ def repair_archives(current_user: User = Depends(get_current_user)):
             if archive.feed_id is None and archive.article_id:
                 # Essayer de récupérer le feed_id depuis l'article original
                 article = session.get(Article, archive.article_id)
-                if article and article.feed_id:
-                    archive.feed_id = article.feed_id
+                feed = subscription_for(session, current_user.id, article.feed_id) if article else None
+                if feed:
+                    archive.feed_id = feed.id
                     repaired_count += 1
         
         if repaired_count > 0:
@@ -1330,6 +1418,7 @@ async def import_opml(file: UploadFile = File(...), current_user: User = Depends
         created_collections = 0
         created_feeds = 0
         skipped_feeds = 0
+        new_feeds = []
         
         with Session(engine) as session:
             # Parcourir la structure OPML
@@ -1367,7 +1456,7 @@ async def import_opml(file: UploadFile = File(...), current_user: User = Depends
                     for feed_outline in sub_outlines:
                         if feed_outline.get("type") == "rss" and feed_outline.get("xmlUrl"):
                             feed_url = feed_outline.get("xmlUrl")
-                            feed_title = feed_outline.get("title") or feed_outline.get("text") or "Flux importé"
+                            feed_title = feed_outline.get("title") or feed_outline.get("text")  # sinon : celui du flux
                             feed_description = feed_outline.get("description") or ""
                             
                             # Vérifier si le flux existe déjà dans cette collection
@@ -1379,13 +1468,9 @@ async def import_opml(file: UploadFile = File(...), current_user: User = Depends
                             ).first()
                             
                             if not existing_feed:
-                                new_feed = Feed(
-                                    url=feed_url,
-                                    title=feed_title,
-                                    description=feed_description,
-                                    collection_id=collection_id
-                                )
-                                session.add(new_feed)
+                                new_feed = add_feed_in_savepoint(session, feed_url, collection_id, feed_title, feed_description)
+                                if new_feed.source_id is None:  # URL déjà suivie : rien à télécharger
+                                    new_feeds.append(new_feed)
                                 created_feeds += 1
                             else:
                                 skipped_feeds += 1
@@ -1413,7 +1498,7 @@ async def import_opml(file: UploadFile = File(...), current_user: User = Depends
                         
                         # Ajouter le flux
                         feed_url = outline.get("xmlUrl")
-                        feed_title = outline.get("title") or outline.get("text") or "Flux importé"
+                        feed_title = outline.get("title") or outline.get("text")  # sinon : celui du flux
                         feed_description = outline.get("description") or ""
                         
                         existing_feed = session.exec(
@@ -1424,20 +1509,19 @@ async def import_opml(file: UploadFile = File(...), current_user: User = Depends
                         ).first()
                         
                         if not existing_feed:
-                            new_feed = Feed(
-                                url=feed_url,
-                                title=feed_title,
-                                description=feed_description,
-                                collection_id=collection_id
-                            )
-                            session.add(new_feed)
+                            new_feed = add_feed_in_savepoint(session, feed_url, collection_id, feed_title, feed_description)
+                            if new_feed.source_id is None:
+                                new_feeds.append(new_feed)
                             created_feeds += 1
                         else:
                             skipped_feeds += 1
             
             # Sauvegarder toutes les modifications
             session.commit()
-        
+            new_feed_ids = [f.id for f in new_feeds]
+
+        # Premiers téléchargements en parallèle (nombre limité), en tâche de fond
+        job_id = fetch_new_feeds(current_user.id, new_feed_ids) if new_feed_ids else None
         return {
             "success": True,
             "message": "Import OPML terminé avec succès",
@@ -1445,7 +1529,8 @@ async def import_opml(file: UploadFile = File(...), current_user: User = Depends
                 "collections_created": created_collections,
                 "feeds_created": created_feeds,
                 "feeds_skipped": skipped_feeds
-            }
+            },
+            "refresh_job_id": job_id,
         }
         
     except ET.ParseError:
@@ -1954,40 +2039,28 @@ async def github_callback(request: Request):
         return RedirectResponse(f"http://localhost:3000/dashboard.html?token={jwt_token}")
 
 # ========= Scheduler job =========
+SCHEDULER_TICK = int(os.getenv("FEED_SCHEDULER_TICK", "60"))  # secondes entre deux recherches de flux échus
+SCHEDULER_ENABLED = os.getenv("FEED_SCHEDULER_ENABLED", "1") == "1"  # 0 : pas d'ingestion dans les processus de l'API
+
 def refresh_all_feeds_job():
-    with Session(engine) as session:
-        feeds = session.exec(select(Feed)).all()
-        total = 0
-        for f in feeds:
-            headers = {}
-            cache = app.state.feed_cache.get(f.id, {})
-            if cache.get("etag"):
-                headers["If-None-Match"] = cache["etag"]
-            if cache.get("modified"):
-                headers["If-Modified-Since"] = cache["modified"]
-            parsed = feedparser.parse(f.url, request_headers=headers)
-            if parsed.get("etag"):
-                cache["etag"] = parsed.etag
-            if parsed.get("modified"):
-                try:
-                    import email.utils as eut
-                    cache["modified"] = eut.formatdate(feedparser.mktime_tz(parsed.modified))
-                except Exception:
-                    pass
-            app.state.feed_cache[f.id] = cache
-            if getattr(parsed, "status", None) == 304:
-                continue
-            for e in parsed.entries:
-                link = getattr(e, "link", "") or ""
-                title = getattr(e, "title", "") or "(sans titre)"
-                summary = getattr(e, "summary", None) or getattr(e, "description", "") or ""
-                if looks_duplicate(session, f.id, link, title):
-                    continue
-                a = Article(title=title[:255], content=summary, link=link, feed_id=f.id)
-                session.add(a)
-                total += 1
-        session.commit()
-        print(f"[Scheduler] Articles insérés: {total}")
+    # Lots de flux échus réservés en base : plusieurs processus peuvent tourner en parallèle
+    metrics = refresh_due_feeds()
+    websub.renew_subscriptions()
+    print(f"[Scheduler] Flux traités: {metrics.feeds} (304: {metrics.not_modified}, inchangés: {metrics.unchanged}), "
+          f"articles insérés: {metrics.inserted}, durée: {metrics.wall_seconds:.1f}s")
+    if metrics.deferred:
+        print(f"[Scheduler] Budget du cycle dépassé : {metrics.deferred} flux reportés au cycle suivant")
+
+def prune_articles_job():
+    deleted = prune_articles()
+    if deleted:
+        print(f"[Scheduler] Rétention : {deleted} articles supprimés")
+
+@app.get("/ingestion/metrics")
+def ingestion_metrics(current_user: User = Depends(get_current_user)):
+    """Métriques par étape du dernier cycle d'ingestion (débit, profondeur des files)"""
+    last = ingestion_pipeline.last_run_metrics
+    return last.as_dict() if last else {}
 
 # ========= MESSAGERIE INSTANTANÉE =========
 
@@ -2091,9 +2164,11 @@ def send_message(
             if not article:
                 raise HTTPException(status_code=404, detail="Article introuvable")
             
-            # Vérifier que l'article appartient à un flux de cette collection
-            feed = session.get(Feed, article.feed_id)
-            if not feed or feed.collection_id != collection_id:
+            # Vérifier que l'article appartient à un flux de cette collection (source partagée comprise)
+            feed = session.exec(
+                select(Feed.id).where(Feed.collection_id == collection_id, SOURCE_ID == article.feed_id)
+            ).first()
+            if feed is None:
                 raise HTTPException(status_code=400, detail="L'article n'appartient pas à cette collection")
         
         # Créer le message
@@ -2144,34 +2219,19 @@ def get_article_comments(
         if not article:
             raise HTTPException(status_code=404, detail="Article introuvable")
         
-        feed = session.get(Feed, article.feed_id)
-        if not feed:
-            raise HTTPException(status_code=404, detail="Flux introuvable")
-        
-        collection = session.get(Collection, feed.collection_id)
-        if not collection:
-            raise HTTPException(status_code=404, detail="Collection introuvable")
-        
-        # Vérifier les permissions
-        is_owner = collection.user_id == current_user.id
-        is_member = session.exec(
-            select(CollectionMember).where(
-                CollectionMember.collection_id == collection.id,
-                CollectionMember.user_id == current_user.id
-            )
-        ).first() is not None
-        
-        if not (is_owner or is_member):
+        # Vérifier les permissions (via l'une des collections qui suivent la source)
+        if not subscription_for(session, current_user.id, article.feed_id):
             raise HTTPException(status_code=403, detail="Accès refusé")
         
-        # Récupérer les commentaires
+        # Récupérer les commentaires (source partagée : ceux des collections de l'utilisateur seulement)
         stmt = select(
             CollectionMessage, User.username
         ).join(
             User, CollectionMessage.user_id == User.id
         ).where(
             CollectionMessage.article_id == article_id,
-            CollectionMessage.message_type == "comment"
+            CollectionMessage.message_type == "comment",
+            CollectionMessage.collection_id.in_(readable_collections(current_user.id)),
         ).order_by(
             CollectionMessage.created_at.asc()
         )
@@ -2405,18 +2465,9 @@ def delete_current_user(current_user: User = Depends(get_current_user)):
                 session.exec(delete(CollectionMessage).where(CollectionMessage.collection_id.in_(collection_ids)))
                 session.exec(delete(CollectionMember).where(CollectionMember.collection_id.in_(collection_ids)))
                 
-                # Supprimer les feeds et articles
-                feed_ids = session.exec(select(Feed.id).where(Feed.collection_id.in_(collection_ids))).all()
-                if feed_ids:
-                    feed_ids = list(feed_ids)
-                    article_ids = session.exec(select(Article.id).where(Article.feed_id.in_(feed_ids))).all()
-                    if article_ids:
-                        article_ids = list(article_ids)
-                        session.exec(delete(ArticleReadFlag).where(ArticleReadFlag.article_id.in_(article_ids)))
-                        session.exec(delete(ArticleStar).where(ArticleStar.article_id.in_(article_ids)))
-                        session.exec(delete(ArticleArchive).where(ArticleArchive.article_id.in_(article_ids)))
-                        session.exec(delete(Article).where(Article.id.in_(article_ids)))
-                    session.exec(delete(Feed).where(Feed.id.in_(feed_ids)))
+                # Supprimer les feeds, et les articles des sources que personne d'autre ne suit
+                feeds = session.exec(select(Feed).where(Feed.collection_id.in_(collection_ids))).all()
+                remove_feeds(session, list(feeds))
                 
                 session.exec(delete(Collection).where(Collection.id.in_(collection_ids)))
             
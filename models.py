@@ -1,6 +1,7 @@
 # models.py
 from typing import Optional
 from datetime import datetime
+from sqlalchemy import Index, text
 from sqlmodel import SQLModel, Field, Relationship
 
 # -------- USERS --------
@@ -36,6 +37,9 @@ class Collection(SQLModel, table=True):
     user_id: int = Field(foreign_key="user.id")
     user: Optional["User"] = Relationship()
     feeds: list["Feed"] = Relationship(back_populates="collection")
+    # Rétention des articles (cf. retention.py) : None = politique de l'instance, 0 = illimité
+    retention_days: Optional[int] = None
+    retention_max_per_feed: Optional[int] = None
 
 class CollectionCreate(SQLModel):
     name: str
@@ -54,20 +58,62 @@ class Feed(SQLModel, table=True):
     description: Optional[str] = None
     collection_id: int = Field(foreign_key="collection.id")
     collection: Optional[Collection] = Relationship(back_populates="feeds")
+    # Source partagée (cf. feed_sources.py) : vide, ce flux est lui-même la source
+    # (téléchargé, porte les articles) ; sinon, il lit les articles de source_id
+    source_id: Optional[int] = Field(default=None, foreign_key="feed.id", index=True)
+    source_url: Optional[str] = Field(default=None, index=True, unique=True)  # URL normalisée (sources uniquement)
+    # Validateurs HTTP pour les GET conditionnels (partagés entre workers et redémarrages)
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    last_status: Optional[int] = None
+    last_success_at: Optional[datetime] = None  # dernier téléchargement réussi (200 ou 304)
+    content_hash: Optional[str] = None  # empreinte du dernier document reçu (serveurs sans ETag/Last-Modified)
+    # Planification adaptative (cf. feed_scheduling.py)
+    next_fetch_at: Optional[datetime] = Field(default=None, index=True)
+    fetch_interval: Optional[int] = None  # secondes
+    consecutive_failures: int = Field(default=0)
+    # Santé du flux (cf. feed_scheduling.health_status)
+    last_error: Optional[str] = None
+    last_error_at: Optional[datetime] = None
+    avg_latency_ms: Optional[float] = None  # moyenne glissante des temps de réponse
+    # Priorité sous charge : activité des lecteurs (cf. feed_activity.py)
+    activity_score: float = Field(default=0)
+    # Bail de rafraîchissement : un seul worker/processus traite le flux à la fois
+    lease_owner: Optional[str] = None
+    lease_expires_at: Optional[datetime] = None
+    # WebSub (push) : hub annoncé par le flux et abonnement en cours (cf. websub.py)
+    websub_hub: Optional[str] = None
+    websub_topic: Optional[str] = None
+    websub_secret: Optional[str] = None
+    websub_token: Optional[str] = None  # partie secrète de l'URL de callback (cf. websub.callback_url)
+    websub_state: Optional[str] = None  # pending, active, denied
+    websub_expires_at: Optional[datetime] = None
 
 class FeedCreate(SQLModel):
     url: str
-    title: str
+    title: Optional[str] = None  # par défaut : celui du flux, au premier téléchargement
     description: Optional[str] = None
     collection_id: int
 
 # -------- ARTICLES --------
 class Article(SQLModel, table=True):
+    __table_args__ = (
+        # Dédoublonnage : une seule fois chaque lien par flux (INSERT ... ON CONFLICT DO NOTHING)
+        Index("ix_article_feed_id_link_hash", "feed_id", "link_hash", unique=True),
+        # Listes par date (ORDER BY published_at DESC, id DESC, filtres since/until) : parcours d'index
+        Index("ix_article_feed_id_published_at_id", "feed_id", text("published_at DESC"), text("id DESC")),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     title: str
     content: str
     link: str
-    feed_id: int = Field(foreign_key="feed.id")
+    feed_id: int = Field(foreign_key="feed.id", index=True)
+    link_hash: Optional[str] = None  # clé de dédoublonnage (cf. ingestion.link_hash)
+    url_hash: Optional[str] = Field(default=None, index=True)  # sha1 du lien canonique (cf. urls.canonical_url)
+    fetched_at: Optional[datetime] = Field(default=None, index=True)  # date d'ingestion (rétention)
+    guid: Optional[str] = None  # identifiant de l'entrée (<guid> RSS, <id> Atom)
+    published_at: Optional[datetime] = None  # date de publication, sinon d'ingestion (tri des listes)
 
 class ArticleCreate(SQLModel):
     title: str
@@ -98,7 +144,65 @@ class ArticleArchive(SQLModel, table=True):
     link: str
     archived_at: datetime = Field(default_factory=datetime.utcnow)
 
+# Articles supprimés par la rétention : leur clé reste connue pour qu'ils ne
+# reviennent pas, comme nouveaux et non lus, tant qu'ils sont dans le flux
+class ArticleTombstone(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_articletombstone_feed_id_link_hash", "feed_id", "link_hash", unique=True),
+    )
+    id: Optional[int] = Field(default=None, primary_key=True)
+    feed_id: int = Field(foreign_key="feed.id")
+    link_hash: str
+    pruned_at: datetime = Field(default_factory=datetime.utcnow)
+
+# Vue lecture : HTML nettoyé, partagé par les articles de même lien canonique
+class ReaderCache(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    url_hash: str = Field(index=True, unique=True)
+    html: str
+    fetched_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+
+# Rafraîchissements demandés par les utilisateurs (cf. refresh_jobs.py) : en base,
+# pour être suivis depuis n'importe quel processus de l'API
+class RefreshJob(SQLModel, table=True):
+    id: str = Field(primary_key=True)  # uuid hex
+    user_id: int = Field(index=True)  # sans clé étrangère : purgé avec les jobs expirés
+    status: str = "queued"  # queued, running, done
+    version: int = 0  # incrémenté à chaque changement (flux SSE)
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    finished_at: Optional[datetime] = None
+
+class RefreshJobFeed(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_refreshjobfeed_job_id_feed_id", "job_id", "feed_id", unique=True),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    job_id: str = Field(foreign_key="refreshjob.id")
+    feed_id: int  # sans clé étrangère : le flux peut être supprimé pendant le job
+    status: str = "pending"
+    inserted: int = 0
+    error: Optional[str] = None
+
 # -------- DTOs --------
+class FeedHealth(SQLModel):
+    status: str  # ok, failing, quarantined
+    consecutive_failures: int = 0
+    last_error: Optional[str] = None
+    last_error_at: Optional[datetime] = None
+    last_success_at: Optional[datetime] = None
+    avg_latency_ms: Optional[float] = None
+    next_fetch_at: Optional[datetime] = None
+
+class FeedOut(SQLModel):
+    id: int
+    url: str
+    title: Optional[str] = None
+    description: Optional[str] = None
+    collection_id: int
+    health: FeedHealth
+
 class ArticleOut(SQLModel):
     id: int
     title: str
@@ -107,6 +211,7 @@ class ArticleOut(SQLModel):
     feed_id: int
     read: bool = False
     starred: bool = False
+    published_at: Optional[datetime] = None
 
 class ArchiveOut(SQLModel):
     id: int
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Rafraîchissement ponctuel des flux SUPRSS, hors de l'API : pour un cron,
+un conteneur dédié ou un rattrapage à la main. Même moteur que le
+scheduler (pipeline et baux en base), donc sans risque en parallèle de
+l'API ou de worker.py.
+
+    python refresh.py                          # flux échus
+    python refresh.py --collection 3 --force   # toute une collection, échue ou non
+    python refresh.py --feed 12 --feed 15 --concurrency 10 --budget 300
+
+Se termine par un résumé (--json pour une sortie exploitable par un
+script). Code de retour, pour l'alerte d'un cron :
+    0  tous les flux traités sans erreur
+    1  rafraîchissement interrompu ou en échec (base, exception...)
+    2  au moins un flux en erreur (HTTP, réseau, document invalide)
+"""
+import argparse
+import contextlib
+import json
+import sys
+import time
+
+from env_loader import load_env_smart
+
+try:
+    load_env_smart()
+except Exception as e:
+    print(f"Avertissement: Impossible de charger l'environnement: {e}")
+
+from sqlalchemy import or_
+from sqlmodel import Session, select
+
+import database
+from database import create_db_and_tables, engine
+from models import Feed
+from ingestion import backfill_link_hashes, backfill_published_at, backfill_url_hashes
+from feed_sources import SOURCE_ID, backfill_sources
+from retention import backfill_fetched_at
+from ingestion_pipeline import refresh_due_feeds, refresh_feeds
+from feed_parsing import shutdown_pool
+
+
+def _selected_feeds(feed_ids, collection_ids) -> list:
+    """Sources des flux choisis : seules elles sont téléchargées (cf. feed_sources.py)"""
+    with Session(engine) as session:
+        stmt = select(SOURCE_ID).distinct()
+        if feed_ids and collection_ids:
+            stmt = stmt.where(or_(Feed.id.in_(feed_ids), Feed.collection_id.in_(collection_ids)))
+        elif feed_ids:
+            stmt = stmt.where(Feed.id.in_(feed_ids))
+        else:
+            stmt = stmt.where(Feed.collection_id.in_(collection_ids))
+        return list(session.exec(stmt.order_by(SOURCE_ID)).all())
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--feed", type=int, action="append", default=[], help="id d'un flux (répétable)")
+    parser.add_argument("--collection", type=int, action="append", default=[], help="id d'une collection (répétable)")
+    parser.add_argument("--force", action="store_true", help="rafraîchir les flux choisis même s'ils ne sont pas échus")
+    parser.add_argument("--concurrency", type=int, help="téléchargements simultanés (défaut : FEED_FETCH_CONCURRENCY)")
+    parser.add_argument("--budget", type=float, default=0, help="durée max en secondes (défaut : illimitée)")
+    parser.add_argument("--json", action="store_true", help="résumé au format JSON")
+    parser.add_argument("--quiet", action="store_true", help="sans le journal SQL")
+    args = parser.parse_args()
+    if args.force and not (args.feed or args.collection):
+        parser.error("--force s'utilise avec --feed ou --collection")
+    if args.concurrency is not None and args.concurrency < 1:
+        parser.error("--concurrency doit être au moins 1")
+
+    if args.quiet or args.json:
+        database.engine.echo = False
+    create_db_and_tables()
+    backfill_link_hashes()
+    backfill_url_hashes()
+    backfill_fetched_at()
+    backfill_published_at()
+    backfill_sources()
+
+    started = time.time()
+    # Avec --json, la sortie standard ne contient que le résumé
+    log = contextlib.redirect_stdout(sys.stderr) if args.json else contextlib.nullcontext()
+    try:
+        with log:
+            feed_ids = _selected_feeds(args.feed, args.collection) if args.feed or args.collection else None
+            if feed_ids is not None and not feed_ids:
+                metrics = None
+            elif args.force:
+                metrics = refresh_feeds(feed_ids, budget=args.budget, concurrency=args.concurrency)
+            else:
+                metrics = refresh_due_feeds(budget=args.budget, concurrency=args.concurrency, feed_ids=feed_ids)
+    except KeyboardInterrupt:
+        print("Interrompu", file=sys.stderr)
+        return 1
+    except Exception as e:
+        print(f"Erreur pendant le rafraîchissement: {e}", file=sys.stderr)
+        return 1
+    finally:
+        shutdown_pool()
+
+    summary = metrics.as_dict() if metrics else {"feeds": 0, "inserted": 0, "errors": 0, "deferred": 0}
+    summary.pop("stages", None)
+    summary["selected"] = len(feed_ids) if feed_ids is not None else None
+    summary["wall_seconds"] = round(time.time() - started, 3)
+    if args.json:
+        print(json.dumps(summary))
+    else:
+        print(f"Flux traités: {summary['feeds']}"
+              + (f" sur {summary['selected']} choisis" if feed_ids is not None else "")
+              + f" (304: {summary.get('not_modified', 0)}, inchangés: {summary.get('unchanged', 0)}, "
+              f"erreurs: {summary['errors']}), articles insérés: {summary['inserted']}, "
+              f"durée: {summary['wall_seconds']:.1f}s")
+        if summary["deferred"]:
+            print(f"Budget dépassé : {summary['deferred']} flux non traités")
+    return 2 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
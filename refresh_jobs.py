@@ -0,0 +1,312 @@
+# refresh_jobs.py
+"""
+Rafraîchissements demandés par les utilisateurs, exécutés en tâche de fond :
+la requête HTTP crée un job et rend immédiatement son identifiant, puis le
+client suit l'avancement flux par flux (GET ou flux SSE).
+
+Les jobs passent par une voie prioritaire : des threads qui leur sont
+réservés, et le cycle de fond qui s'interrompt entre deux lots tant qu'un
+job est en cours. Le job s'exécute dans le processus qui l'a créé, mais son
+état est en base (tables RefreshJob / RefreshJobFeed) : n'importe quel
+worker uvicorn ou réplica de l'API peut le servir. Un job sans nouvelles
+depuis LEASE_SECONDS (processus arrêté) est considéré comme terminé.
+
+Un flux ajouté (création, import OPML) est téléchargé tout de suite par un
+job, qui renseigne aussi son titre et sa description.
+
+L'ouverture d'un flux dont les articles sont anciens déclenche aussi un job
+(stale-while-revalidate) : les articles en base sont servis tout de suite
+et le client reprend les nouveautés à la fin du job.
+"""
+import os
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlmodel import Session, select, update, delete
+
+from database import engine
+from models import Feed, RefreshJob, RefreshJobFeed
+from feed_scheduling import QUARANTINE_AFTER
+from ingestion import FETCH_TIMEOUT, MIN_REFRESH_INTERVAL, claim_feeds, feed_flights, push_active
+from ingestion_pipeline import LEASE_SECONDS, WORKER_ID, PipelineItem, priority_lane, run_pipeline
+
+JOB_WORKERS = int(os.getenv("FEED_REFRESH_JOB_WORKERS", "2"))  # jobs utilisateurs simultanés
+JOB_TTL = int(os.getenv("FEED_REFRESH_JOB_TTL", "3600"))  # conservation d'un job terminé (secondes)
+IMPORT_CONCURRENCY = int(os.getenv("FEED_IMPORT_CONCURRENCY", "10"))  # premiers téléchargements simultanés d'un import
+STALE_AFTER = int(os.getenv("FEED_STALE_AFTER", "900"))  # âge des données au-delà duquel l'ouverture d'un flux le revalide
+
+# États d'un flux dans un job
+PENDING = "pending"
+DONE = "done"  # téléchargé et traité (articles insérés éventuels)
+NOT_MODIFIED = "not_modified"  # 304
+UNCHANGED = "unchanged"  # document identique au précédent
+RECENT = "recent"  # rafraîchi il y a moins de MIN_REFRESH_INTERVAL secondes
+BUSY = "busy"  # déjà en cours de rafraîchissement par un autre processus
+ERROR = "error"
+
+
+@dataclass
+class _Run:
+    """Exécution d'un job dans le processus qui l'a créé"""
+    job_id: str
+    sources: Dict[int, List[int]]  # source -> flux demandés (cf. feed_sources.py)
+    concurrency: Optional[int] = None  # téléchargements simultanés (défaut : FETCH_CONCURRENCY)
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(JOB_WORKERS, 1), thread_name_prefix="refresh-job")
+        return _executor
+
+
+# ========= État des jobs (en base) =========
+def _touch(session: Session, job_id: str, **values) -> None:
+    now = datetime.utcnow()
+    session.exec(
+        update(RefreshJob).where(RefreshJob.id == job_id)
+        .values(version=RefreshJob.version + 1, updated_at=now, **values)
+    )
+
+
+def _set_status(job_id: str, status: str) -> None:
+    with Session(engine) as session:
+        extra = {"finished_at": datetime.utcnow()} if status == "done" else {}
+        _touch(session, job_id, status=status, **extra)
+        session.commit()
+
+
+def _update_feeds(job_id: str, feed_ids: List[int], state: str, inserted: int = 0, error: Optional[str] = None) -> None:
+    with Session(engine) as session:
+        session.exec(
+            update(RefreshJobFeed)
+            .where(RefreshJobFeed.job_id == job_id, RefreshJobFeed.feed_id.in_(feed_ids))
+            .values(status=state, inserted=inserted, error=error)
+        )
+        _touch(session, job_id)
+        session.commit()
+
+
+def _prune(session: Session, now: datetime) -> None:
+    expired = select(RefreshJob.id).where(RefreshJob.updated_at < now - timedelta(seconds=JOB_TTL))
+    session.exec(delete(RefreshJobFeed).where(RefreshJobFeed.job_id.in_(expired)))
+    session.exec(delete(RefreshJob).where(RefreshJob.updated_at < now - timedelta(seconds=JOB_TTL)))
+
+
+def _job_status(job: RefreshJob, now: datetime) -> str:
+    # Job sans nouvelles depuis plus longtemps qu'un bail : son processus a disparu
+    if job.status != "done" and job.updated_at < now - timedelta(seconds=LEASE_SECONDS):
+        return "done"
+    return job.status
+
+
+def get_job(job_id: str, user_id: int) -> Optional[RefreshJob]:
+    """Un job n'est visible que par l'utilisateur qui l'a lancé"""
+    with Session(engine) as session:
+        job = session.get(RefreshJob, job_id)
+        return job if job is not None and job.user_id == user_id else None
+
+
+def job_state(job_id: str) -> Dict[str, Any]:
+    """Avancement d'un job, flux par flux"""
+    with Session(engine) as session:
+        job = session.get(RefreshJob, job_id)
+        feeds = session.exec(
+            select(RefreshJobFeed).where(RefreshJobFeed.job_id == job_id).order_by(RefreshJobFeed.id)
+        ).all()
+        status = _job_status(job, datetime.utcnow()) if job is not None else "done"
+    states = []
+    for f in feeds:
+        state = {"feed_id": f.feed_id, "status": f.status, "inserted": f.inserted}
+        if f.error:
+            state["error"] = f.error
+        states.append(state)
+    return {
+        "job_id": job_id,
+        "status": status,
+        "total": len(states),
+        "completed": sum(1 for s in states if s["status"] != PENDING),
+        "inserted": sum(s["inserted"] for s in states),
+        "feeds": states,
+    }
+
+
+# ========= Création =========
+def submit_refresh(user_id: int, feed_ids: List[int], concurrency: Optional[int] = None) -> str:
+    """Crée un job pour `feed_ids`, le place dans la voie prioritaire et retourne son id"""
+    feed_ids = list(dict.fromkeys(feed_ids))
+    job_id = uuid.uuid4().hex
+    sources: Dict[int, List[int]] = {}
+    with Session(engine) as session:
+        _prune(session, datetime.utcnow())
+        if feed_ids:
+            # Les abonnements d'une même source ne la téléchargent qu'une fois
+            rows = session.exec(select(Feed.id, Feed.source_id).where(Feed.id.in_(feed_ids))).all()
+            source_ids = {row.id: row.source_id or row.id for row in rows}
+            for feed_id in feed_ids:
+                sources.setdefault(source_ids.get(feed_id, feed_id), []).append(feed_id)
+        session.add(RefreshJob(id=job_id, user_id=user_id, status="queued" if feed_ids else "done"))
+        session.flush()
+        session.add_all([RefreshJobFeed(job_id=job_id, feed_id=feed_id) for feed_id in feed_ids])
+        session.commit()
+    if feed_ids:
+        _get_executor().submit(_run_job, _Run(job_id, sources, concurrency))
+    return job_id
+
+
+def fetch_new_feeds(user_id: int, feed_ids: List[int]) -> str:
+    """Premier téléchargement de flux tout juste ajoutés, IMPORT_CONCURRENCY à la fois"""
+    return submit_refresh(user_id, feed_ids, concurrency=IMPORT_CONCURRENCY)
+
+
+def needs_revalidation(feed: Feed, now: Optional[datetime] = None) -> bool:
+    """
+    Données du flux plus anciennes que STALE_AFTER, sans rafraîchissement en
+    cours (bail), ni échec récent, ni quarantaine, ni abonnement WebSub actif
+    (les nouveautés arrivent alors d'elles-mêmes).
+    """
+    now = now or datetime.utcnow()
+    stale = now - timedelta(seconds=STALE_AFTER)
+    if feed.last_success_at is not None and feed.last_success_at >= stale:
+        return False
+    if feed.lease_expires_at is not None and feed.lease_expires_at > now:
+        return False
+    if feed.last_error_at is not None and feed.last_error_at >= stale:
+        return False
+    return feed.consecutive_failures < QUARANTINE_AFTER and not push_active(feed, now)
+
+
+def revalidate(user_id: int, feed: Feed, source: Optional[Feed] = None) -> Optional[str]:
+    """
+    Lance en tâche de fond le rafraîchissement (conditionnel) d'un flux
+    ancien et retourne l'id du job à suivre ; None si le flux est assez
+    frais. `source` porte l'état de téléchargement quand `feed` est un
+    abonnement à une source partagée. Un job encore en cours pour ce flux
+    et cet utilisateur, lancé par n'importe quel processus, est réutilisé.
+    """
+    source = source or feed
+    now = datetime.utcnow()
+    with Session(engine) as session:
+        running = session.exec(
+            select(RefreshJob.id)
+            .join(RefreshJobFeed, RefreshJobFeed.job_id == RefreshJob.id)
+            .where(
+                RefreshJob.user_id == user_id,
+                RefreshJob.status != "done",
+                RefreshJob.updated_at >= now - timedelta(seconds=LEASE_SECONDS),
+                RefreshJobFeed.feed_id == feed.id,
+            )
+            .order_by(RefreshJob.created_at.desc())
+        ).first()
+    if running is not None:
+        return running
+    if not needs_revalidation(source, now):
+        return None
+    return submit_refresh(user_id, [feed.id])
+
+
+def _item_state(item: PipelineItem) -> str:
+    if item.result.error:
+        return ERROR
+    if item.result.not_modified:
+        return NOT_MODIFIED
+    return UNCHANGED if item.unchanged else DONE
+
+
+def _run_job(run: _Run) -> None:
+    try:
+        with priority_lane():
+            _set_status(run.job_id, "running")
+            _refresh(run)
+    except Exception as e:
+        print(f"[Refresh] job {run.job_id} en erreur: {e}")
+        with Session(engine) as session:
+            pending = session.exec(
+                select(RefreshJobFeed.feed_id)
+                .where(RefreshJobFeed.job_id == run.job_id, RefreshJobFeed.status == PENDING)
+            ).all()
+        if pending:
+            _update_feeds(run.job_id, list(pending), ERROR, error=str(e))
+    finally:
+        _set_status(run.job_id, "done")
+
+
+def _update_source(run: _Run, source_id: int, state: str, inserted: int = 0, error: Optional[str] = None) -> None:
+    """Même résultat pour tous les flux du job abonnés à la source"""
+    feed_ids = run.sources.get(source_id)
+    if feed_ids:
+        _update_feeds(run.job_id, feed_ids, state, inserted, error)
+
+
+def _refresh(run: _Run) -> None:
+    # Flux déjà en cours dans ce processus (cycle de fond ou autre job) : on attend leur résultat
+    leaders, followers = [], {}
+    for source_id in run.sources:
+        call, leader = feed_flights.claim(source_id)
+        if leader:
+            leaders.append(source_id)
+        else:
+            followers[source_id] = call
+
+    claimed = []
+    try:
+        if leaders:
+            with Session(engine) as session:
+                claimed = claim_feeds(session, WORKER_ID, leaders, LEASE_SECONDS)
+        claimed_ids = {row.id for row in claimed}
+        skipped = [source_id for source_id in leaders if source_id not in claimed_ids]
+        for source_id in skipped:
+            feed_flights.release(source_id, result={"inserted": 0})
+        _mark_skipped(run, skipped)
+
+        def done(item: PipelineItem) -> None:
+            _update_source(run, item.feed.id, _item_state(item), item.inserted, item.result.error)
+            feed_flights.release(item.feed.id, result={"inserted": item.inserted})
+
+        if claimed:
+            run_pipeline(claimed, on_done=done, concurrency=run.concurrency)
+    finally:
+        for row in claimed:
+            feed_flights.release(row.id, result={"inserted": 0})
+
+    for source_id, call in followers.items():
+        if not call.done.wait(FETCH_TIMEOUT * 3):
+            _update_source(run, source_id, BUSY)
+        elif call.error is not None:
+            _update_source(run, source_id, ERROR, error=str(call.error))
+        else:
+            _update_source(run, source_id, DONE, (call.result or {}).get("inserted", 0))
+
+
+def _mark_skipped(run: _Run, source_ids: List[int]) -> None:
+    """Sources non réservées : supprimées, rafraîchies récemment ou réservées par un autre processus"""
+    if not source_ids:
+        return
+    recent = datetime.utcnow() - timedelta(seconds=MIN_REFRESH_INTERVAL)
+    with Session(engine) as session:
+        rows = session.exec(select(Feed.id, Feed.last_success_at).where(Feed.id.in_(source_ids))).all()
+    last_success = {row.id: row.last_success_at for row in rows}
+    for source_id in source_ids:
+        if source_id not in last_success:
+            _update_source(run, source_id, ERROR, error="Flux introuvable")
+        elif last_success[source_id] is not None and last_success[source_id] >= recent:
+            _update_source(run, source_id, RECENT)
+        else:
+            _update_source(run, source_id, BUSY)
+
+
+def shutdown_jobs() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
@@ -0,0 +1,169 @@
+# retention.py
+"""
+Rétention des articles : suppression en tâche de fond des articles trop
+anciens (âge maximal) ou en surnombre (nombre maximal par flux), selon la
+politique de l'instance ou celle de la collection. Une source suivie par
+plusieurs collections (cf. feed_sources.py) garde ses articles selon la
+plus permissive de leurs politiques.
+
+Les articles mis en favori, archivés ou commentés sont toujours conservés.
+La clé de dédoublonnage d'un article supprimé est gardée (ArticleTombstone)
+tant que sa source existe : encore présent dans le flux, il serait sinon
+réinséré au rafraîchissement suivant, comme nouveau et non lu.
+Le même passage supprime les vues lecture en cache depuis plus de
+READER_CACHE_TTL.
+Les suppressions se font par petits lots, chacun dans sa propre
+transaction, pour ne pas verrouiller longtemps les tables consultées par
+l'API.
+"""
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from sqlmodel import Session, select, update, delete, insert
+
+from database import engine
+from models import (
+    Article, ArticleArchive, ArticleReadFlag, ArticleStar, ArticleTombstone, Collection, CollectionMessage, Feed,
+    ReaderCache,
+)
+from feed_sources import SOURCE_ID
+
+MAX_AGE_DAYS = int(os.getenv("ARTICLE_RETENTION_DAYS", "0"))  # 0 : pas de limite d'âge
+MAX_PER_FEED = int(os.getenv("ARTICLE_RETENTION_MAX_PER_FEED", "0"))  # 0 : pas de limite de nombre
+PRUNE_INTERVAL = int(os.getenv("ARTICLE_PRUNE_INTERVAL", "3600"))  # secondes entre deux passages
+PRUNE_BATCH = int(os.getenv("ARTICLE_PRUNE_BATCH", "500"))  # articles supprimés par transaction
+PRUNE_PAUSE = float(os.getenv("ARTICLE_PRUNE_PAUSE", "0.05"))  # pause entre deux lots (secondes)
+READER_CACHE_TTL = int(os.getenv("READER_CACHE_TTL", "86400"))  # durée de vie d'une vue lecture en cache (secondes)
+
+
+@dataclass
+class RetentionPolicy:
+    max_age_days: int = 0
+    max_per_feed: int = 0
+
+    @property
+    def unlimited(self) -> bool:
+        return self.max_age_days <= 0 and self.max_per_feed <= 0
+
+    def merge(self, other: "RetentionPolicy") -> "RetentionPolicy":
+        """La plus permissive des deux, limite par limite (0 : pas de limite)"""
+        def loosest(a: int, b: int) -> int:
+            return 0 if a <= 0 or b <= 0 else max(a, b)
+        return RetentionPolicy(
+            max_age_days=loosest(self.max_age_days, other.max_age_days),
+            max_per_feed=loosest(self.max_per_feed, other.max_per_feed),
+        )
+
+
+def policy_for(collection: Collection) -> RetentionPolicy:
+    """Politique effective d'une collection : ses propres valeurs, sinon celles de l'instance"""
+    return RetentionPolicy(
+        max_age_days=MAX_AGE_DAYS if collection.retention_days is None else collection.retention_days,
+        max_per_feed=MAX_PER_FEED if collection.retention_max_per_feed is None else collection.retention_max_per_feed,
+    )
+
+
+def _prunable():
+    # Articles sans favori, archive ni commentaire
+    return (
+        ~Article.id.in_(select(ArticleStar.article_id)),
+        ~Article.id.in_(select(ArticleArchive.article_id).where(ArticleArchive.article_id.is_not(None))),
+        ~Article.id.in_(select(CollectionMessage.article_id).where(CollectionMessage.article_id.is_not(None))),
+    )
+
+
+def _delete_batch(session: Session, ids: List[int]) -> int:
+    now = datetime.utcnow()
+    keys = session.exec(
+        select(Article.feed_id, Article.link_hash).where(Article.id.in_(ids), Article.link_hash.is_not(None))
+    ).all()
+    if keys:
+        session.exec(
+            insert(ArticleTombstone),
+            params=[{"feed_id": feed_id, "link_hash": key, "pruned_at": now} for feed_id, key in keys],
+        )
+    session.exec(delete(ArticleReadFlag).where(ArticleReadFlag.article_id.in_(ids)))
+    session.exec(delete(Article).where(Article.id.in_(ids)))
+    session.commit()
+    if PRUNE_PAUSE:
+        time.sleep(PRUNE_PAUSE)  # laisse passer les requêtes de l'API entre deux lots
+    return len(ids)
+
+
+def _prune_expired(session: Session, feed_ids: List[int], cutoff: datetime) -> int:
+    deleted = 0
+    while True:
+        ids = session.exec(
+            select(Article.id)
+            .where(Article.feed_id.in_(feed_ids), Article.fetched_at < cutoff, *_prunable())
+            .limit(PRUNE_BATCH)
+        ).all()
+        if not ids:
+            return deleted
+        deleted += _delete_batch(session, list(ids))
+
+
+def _prune_excess(session: Session, feed_id: int, keep: int) -> int:
+    # id croissant = ordre d'ingestion : on garde les `keep` plus récents
+    boundary = session.exec(
+        select(Article.id).where(Article.feed_id == feed_id).order_by(Article.id.desc()).offset(keep - 1).limit(1)
+    ).first()
+    if boundary is None:
+        return 0
+    deleted = 0
+    while True:
+        ids = session.exec(
+            select(Article.id)
+            .where(Article.feed_id == feed_id, Article.id < boundary, *_prunable())
+            .limit(PRUNE_BATCH)
+        ).all()
+        if not ids:
+            return deleted
+        deleted += _delete_batch(session, list(ids))
+
+
+def backfill_fetched_at(batch_size: int = 1000) -> int:
+    """Date d'ingestion des articles antérieurs à la colonne : la date du premier passage"""
+    now = datetime.utcnow()
+    filled = 0
+    with Session(engine) as session:
+        while True:
+            ids = session.exec(select(Article.id).where(Article.fetched_at.is_(None)).limit(batch_size)).all()
+            if not ids:
+                return filled
+            session.exec(update(Article).where(Article.id.in_(list(ids))).values(fetched_at=now))
+            session.commit()
+            filled += len(ids)
+
+
+def prune_reader_cache(session: Session, now: datetime) -> None:
+    session.exec(delete(ReaderCache).where(ReaderCache.fetched_at < now - timedelta(seconds=READER_CACHE_TTL)))
+    session.commit()
+
+
+def prune_articles(now: Optional[datetime] = None) -> int:
+    """Un passage complet du pruner ; retourne le nombre d'articles supprimés"""
+    now = now or datetime.utcnow()
+    deleted = 0
+    with Session(engine) as session:
+        prune_reader_cache(session, now)
+        # Politique de chaque source : la plus permissive des collections qui la suivent
+        policies: Dict[int, RetentionPolicy] = {}
+        for collection in session.exec(select(Collection)).all():
+            policy = policy_for(collection)
+            for source_id in session.exec(select(SOURCE_ID).where(Feed.collection_id == collection.id)).all():
+                policies[source_id] = policies[source_id].merge(policy) if source_id in policies else policy
+        by_age: Dict[int, List[int]] = defaultdict(list)
+        for source_id, policy in policies.items():
+            if policy.max_age_days > 0:
+                by_age[policy.max_age_days].append(source_id)
+        for max_age_days, source_ids in by_age.items():
+            deleted += _prune_expired(session, source_ids, now - timedelta(days=max_age_days))
+        for source_id, policy in policies.items():
+            if policy.max_per_feed > 0:
+                deleted += _prune_excess(session, source_id, policy.max_per_feed)
+    return deleted
@@ -6,6 +6,24 @@ const token = localStorage.getItem("token");
 function authHeaders(extra = {}) {
   return { Authorization: `Bearer ${token}`, ...extra };
 }
+// Les rafraîchissements tournent en tâche de fond : on suit le job jusqu'à sa fin
+async function waitForRefresh(res) {
+  if (!res || !res.ok) return null;
+  const job = await res.json();
+  return job.status === "done" ? job : waitForJob(job.job_id);
+}
+
+async function waitForJob(jobId) {
+  while (true) {
+    await new Promise((resolve) => setTimeout(resolve, 1000));
+    const r = await fetch(`${API}/refresh-jobs/${encodeURIComponent(jobId)}`, {
+      headers: authHeaders(),
+    }).catch(() => null);
+    if (!r || !r.ok) return null;
+    const job = await r.json();
+    if (job.status === "done") return job;
+  }
+}
 function el(tag, className = "", text = "") {
   const n = document.createElement(tag);
   if (className) n.className = className;
@@ -481,7 +499,7 @@ const refreshAllBtn = document.getElementById("refresh-collection-btn");
 
 [feedTitle, feedUrl].forEach((i) =>
   i.addEventListener("input", () => {
-    addBtn.disabled = !(feedTitle.value.trim() && feedUrl.value.trim());
+    addBtn.disabled = !feedUrl.value.trim();
   })
 );
 
@@ -495,13 +513,13 @@ feedForm.addEventListener("submit", async (e) => {
   const title = feedTitle.value.trim();
   const url = feedUrl.value.trim();
   
-  if (!title || !url) {
-    showToast("❌ Titre et URL sont requis", "error");
+  if (!url) {
+    showToast("❌ L'URL est requise", "error");
     return;
   }
   
   const body = {
-    title: title,
+    title: title || null,  // sinon : titre du flux, au premier téléchargement
     url: url,
     description: feedDesc.value.trim() || null,
     collection_id: activeCollectionId,
@@ -525,6 +543,9 @@ feedForm.addEventListener("submit", async (e) => {
       addBtn.disabled = true;
       await loadFeeds();
       showToast("✅ Flux ajouté avec succès!", "success");
+      // Premier téléchargement en tâche de fond : titre, description et articles
+      const jobId = res.headers.get("X-Refresh-Job");
+      if (jobId) waitForJob(jobId).then((job) => job && loadFeeds());
     } else {
       const errorText = await res.text();
       console.error("❌ Erreur serveur:", errorText); // Debug
@@ -598,6 +619,13 @@ async function loadFeeds() {
       unreadIcon.title = "Cette collection a des messages non lus";
       h.appendChild(titleText);
       h.appendChild(unreadIcon);
+      // Flux en erreur : visible pour pouvoir le corriger ou le supprimer
+      if (f.health && f.health.status !== "ok") {
+        const quarantined = f.health.status === "quarantined";
+        const healthIcon = el("span", quarantined ? "text-red-600" : "text-amber-600", quarantined ? "⛔" : "⚠️");
+        healthIcon.title = `${quarantined ? "Flux en quarantaine" : "Flux en erreur"} (${f.health.consecutive_failures} échecs) : ${f.health.last_error || "erreur inconnue"}`;
+        h.appendChild(healthIcon);
+      }
       card.appendChild(h);
 
       if (f.description) {
@@ -618,10 +646,12 @@ async function loadFeeds() {
       );
       refreshBtn.onclick = async () => {
         refreshBtn.disabled = true;
-        await fetch(`${API}/feeds/${encodeURIComponent(f.id)}/refresh`, {
-          method: "POST",
-          headers: authHeaders(),
-        }).catch(() => {});
+        await waitForRefresh(
+          await fetch(`${API}/feeds/${encodeURIComponent(f.id)}/refresh`, {
+            method: "POST",
+            headers: authHeaders(),
+          }).catch(() => null)
+        );
         refreshBtn.disabled = false;
         // recalcul du compteur
         const n = await computeUnreadCount(f.id);
@@ -659,15 +689,15 @@ async function loadFeeds() {
 
 // “Tout rafraîchir” pour la collection active
 refreshAllBtn?.addEventListener("click", async () => {
-  if (!feedsCache.length) return;
+  if (!feedsCache.length || !activeCollectionId) return;
   refreshAllBtn.disabled = true;
-  const jobs = feedsCache.map((f) =>
-    fetch(`${API}/feeds/${encodeURIComponent(f.id)}/refresh`, {
+  // Un seul job pour toute la collection (téléchargements en parallèle côté serveur)
+  await waitForRefresh(
+    await fetch(`${API}/collections/${encodeURIComponent(activeCollectionId)}/refresh-all`, {
       method: "POST",
       headers: authHeaders(),
-    }).catch(() => {})
+    }).catch(() => null)
   );
-  await Promise.all(jobs);
   await loadFeeds();
   refreshAllBtn.disabled = false;
 });
@@ -714,11 +744,12 @@ function updateBadgeDisplay(badge, unreadCount) {
   }
 }
 
-// Compte les non lus en appelant /articles (page 1 suffit pour badge)
+// Compte les non lus en appelant /articles (page 1 suffit pour badge),
+// sans déclencher de rafraîchissement de chaque flux
 async function computeUnreadCount(feedId) {
   try {
     const res = await fetch(
-      `${API}/articles/?feed_id=${encodeURIComponent(feedId)}&limit=100`,
+      `${API}/articles/?feed_id=${encodeURIComponent(feedId)}&limit=100&revalidate=false`,
       { headers: authHeaders() }
     );
     if (!res.ok) return 0;
@@ -1091,6 +1122,8 @@ async function addSuggestedFeed(title, url, description) {
     if (res.ok) {
       showToast(`✅ Flux "${title}" ajouté avec succès !`, "success");
       await loadFeeds(); // Recharger les flux
+      const jobId = res.headers.get("X-Refresh-Job");
+      if (jobId) waitForJob(jobId).then((job) => job && loadFeeds());
     } else {
       const error = await res.text();
       showToast(`❌ Erreur lors de l'ajout du flux`, "error");
@@ -2,6 +2,35 @@ const API = "http://localhost:8000";
 const token = localStorage.getItem("token");
 function authHeaders(extra = {}) { return { Authorization: `Bearer ${token}`, ...extra }; }
 
+// Les rafraîchissements tournent en tâche de fond : on suit le job jusqu'à sa fin
+async function waitForRefresh(res) {
+  if (!res || !res.ok) return null;
+  const job = await res.json();
+  return job.status === "done" ? job : waitForJob(job.job_id);
+}
+
+async function waitForJob(jobId) {
+  while (true) {
+    await new Promise((resolve) => setTimeout(resolve, 1000));
+    const r = await fetch(`${API}/refresh-jobs/${encodeURIComponent(jobId)}`, {
+      headers: authHeaders(),
+    }).catch(() => null);
+    if (!r || !r.ok) return null;
+    const job = await r.json();
+    if (job.status === "done") return job;
+  }
+}
+
+// Articles servis depuis la base pendant que le serveur revalide le flux :
+// on recharge la liste si le rafraîchissement a apporté des nouveautés
+async function pickUpRevalidation(jobId) {
+  const job = await waitForJob(jobId);
+  if (!job || !job.inserted) return;
+  offset = 0;
+  await fetchPage({ append: false });
+  showToast(`${job.inserted} nouvel(s) article(s)`);
+}
+
 // Ajouter le bouton de thème
 document.addEventListener('DOMContentLoaded', function() {
   const themeContainer = document.getElementById('theme-button-container');
@@ -103,6 +132,8 @@ async function fetchPage({ append = false } = {}) {
   if (!res.ok) return;
   const data = await res.json();
   if (!append) list.innerHTML = "";
+  const revalidation = res.headers.get("X-Refresh-Job");
+  if (revalidation) pickUpRevalidation(revalidation);
 
   for (const a of data) {
     const isRead = !!a.read;
@@ -168,6 +199,13 @@ async function fetchPage({ append = false } = {}) {
 
     body.appendChild(title);
 
+    if (a.published_at) {
+      const date = document.createElement("div");
+      date.className = "text-xs text-gray-500 dark:text-gray-400";
+      date.textContent = formatMessageDate(a.published_at);
+      body.appendChild(date);
+    }
+
     if (a.content) {
       const p = document.createElement("p");
       p.className = "text-gray-600 dark:text-gray-300 mt-1";
@@ -331,10 +369,12 @@ btnAllUnread.addEventListener("click", async () => {
   showToast("Tous les articles remis en non lu");
 });
 btnRefresh.addEventListener("click", async () => {
-  await fetch(`${API}/feeds/${feedId}/refresh`, {
-    method: "POST",
-    headers: authHeaders(),
-  });
+  await waitForRefresh(
+    await fetch(`${API}/feeds/${feedId}/refresh`, {
+      method: "POST",
+      headers: authHeaders(),
+    }).catch(() => null)
+  );
   offset = 0;
   // on met aussi à jour la liste des articles déjà archivés
   await loadArchivedIdsForFeed(feedId);
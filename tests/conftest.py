@@ -0,0 +1,47 @@
+# tests/conftest.py
+"""
+Base SQLite temporaire pour les tests : DATABASE_URL doit être posée avant
+le premier import de database.py (le moteur est créé à l'import).
+"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="suprss-tests-"), "test.db")
+os.environ.setdefault("SECRET_KEY", "tests")
+
+import pytest
+from sqlmodel import Session, SQLModel
+
+import database
+from database import create_db_and_tables, engine
+from models import Collection, Feed, User
+
+database.engine.echo = False
+create_db_and_tables()
+
+
+@pytest.fixture
+def session():
+    with Session(engine) as session:
+        yield session
+    # Chaque test repart d'une base vide
+    with engine.begin() as conn:
+        for table in reversed(SQLModel.metadata.sorted_tables):
+            conn.execute(table.delete())
+
+
+@pytest.fixture
+def feed(session) -> Feed:
+    user = User(username="lecteur", email="lecteur@example.com", password="x")
+    session.add(user)
+    session.commit()
+    collection = Collection(name="Collection", user_id=user.id)
+    session.add(collection)
+    session.commit()
+    feed = Feed(url="https://example.com/feed.xml", collection_id=collection.id)
+    session.add(feed)
+    session.commit()
+    return feed
@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta
+
+from feed_activity import MEMBER_WEIGHT, READ_WEIGHT, STAR_WEIGHT, compute_scores
+from models import Article, ArticleReadFlag, ArticleStar, Collection, CollectionMember, Feed, User
+
+
+def test_compute_scores(session, feed):
+    now = datetime.utcnow()
+    owner = session.get(Collection, feed.collection_id).user_id
+    quiet = Feed(url="https://example.com/quiet.xml", collection_id=feed.collection_id)
+    session.add(quiet)
+    recent = Article(title="Récent", content="", link="https://example.com/r", feed_id=feed.id, fetched_at=now)
+    old = Article(title="Ancien", content="", link="https://example.com/o", feed_id=feed.id,
+                  fetched_at=now - timedelta(days=365))
+    session.add_all([recent, old])
+    session.commit()
+    session.add_all([
+        ArticleReadFlag(user_id=owner, article_id=recent.id),
+        ArticleStar(user_id=owner, article_id=recent.id),
+        # Hors de la fenêtre d'activité : ignorée
+        ArticleReadFlag(user_id=owner, article_id=old.id),
+    ])
+    session.commit()
+
+    scores = compute_scores(session, now)
+    assert scores[feed.id] == READ_WEIGHT + STAR_WEIGHT + MEMBER_WEIGHT
+    assert scores[quiet.id] == MEMBER_WEIGHT
+
+
+def test_shared_source_counts_every_subscriber(session, feed):
+    other = User(username="membre", email="membre@example.com", password="x")
+    session.add(other)
+    session.commit()
+    collection = Collection(name="Partagée", user_id=other.id)
+    session.add(collection)
+    session.commit()
+    session.add(CollectionMember(collection_id=collection.id, user_id=other.id))
+    session.add(Feed(url=feed.url, collection_id=collection.id, source_id=feed.id))
+    session.commit()
+
+    # Propriétaire de chaque collection, plus un membre de la seconde
+    assert compute_scores(session) == {feed.id: 3 * MEMBER_WEIGHT}
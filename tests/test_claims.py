@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+
+from sqlmodel import update
+
+from ingestion import claim_due_feeds, claim_feeds, count_due_feeds
+from models import Feed
+
+
+def add_feeds(session, feed, count: int) -> list:
+    feeds = [Feed(url=f"https://example.com/{i}.xml", collection_id=feed.collection_id) for i in range(count)]
+    session.add_all(feeds)
+    session.commit()
+    return [feed.id] + [f.id for f in feeds]
+
+
+def test_workers_claim_disjoint_batches(session, feed):
+    ids = add_feeds(session, feed, 4)
+    first = claim_due_feeds(session, "a", 3, 600)
+    second = claim_due_feeds(session, "b", 3, 600)
+    assert len(first) == 3 and len(second) == 2
+    assert {r.id for r in first} | {r.id for r in second} == set(ids)
+    assert claim_due_feeds(session, "c", 3, 600) == []
+    assert count_due_feeds(session) == 0
+
+
+def test_expired_lease_is_reclaimed(session, feed):
+    assert [r.id for r in claim_due_feeds(session, "a", 10, 600)] == [feed.id]
+    # Worker arrêté en cours de route : le bail finit par expirer
+    session.exec(update(Feed).values(lease_expires_at=datetime.utcnow() - timedelta(seconds=1)))
+    session.commit()
+    assert count_due_feeds(session) == 1
+    assert [r.id for r in claim_due_feeds(session, "b", 10, 600)] == [feed.id]
+    session.refresh(feed)
+    assert feed.lease_owner.startswith("b:")
+
+
+def test_only_due_sources_are_claimed(session, feed):
+    ids = add_feeds(session, feed, 2)
+    now = datetime.utcnow()
+    session.exec(update(Feed).where(Feed.id == ids[1]).values(next_fetch_at=now + timedelta(hours=1)))
+    session.exec(update(Feed).where(Feed.id == ids[2]).values(source_id=feed.id))
+    session.commit()
+    assert [r.id for r in claim_due_feeds(session, "a", 10, 600)] == [feed.id]
+
+
+def test_manual_claim_skips_leased_and_recent(session, feed):
+    ids = add_feeds(session, feed, 2)
+    session.exec(update(Feed).where(Feed.id == ids[1]).values(last_success_at=datetime.utcnow()))
+    session.commit()
+    assert [r.id for r in claim_due_feeds(session, "a", 10, 600, feed_ids=[feed.id])] == [feed.id]
+    # Déjà réservé ailleurs, ou rafraîchi à l'instant : exclus
+    assert [r.id for r in claim_feeds(session, "b", ids, 600)] == [ids[2]]
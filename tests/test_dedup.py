@@ -0,0 +1,75 @@
+import pytest
+
+import database
+from feed_parsing import ParsedEntry
+from ingestion import backfill_url_hashes, bulk_insert_articles, ingest_entries, link_hash, new_entries
+from models import Article
+
+
+def entry(link: str, title: str = "Titre", published: float = None) -> ParsedEntry:
+    return ParsedEntry(title=title, link=link, summary="", guid=None, published=published)
+
+
+def test_link_hash_ignores_tracking_variants():
+    assert link_hash("https://example.com/a?utm_source=rss") == link_hash("http://Example.com/a/")
+    assert link_hash("https://example.com/a") != link_hash("https://example.com/b")
+
+
+def test_link_hash_falls_back_to_title():
+    assert link_hash("", "Titre") == link_hash("", "Titre")
+    assert link_hash("", "Titre") != link_hash("", "Autre")
+
+
+def test_known_entries_are_skipped(session, feed):
+    entries = [entry(f"https://example.com/{i}") for i in range(5)]
+    assert ingest_entries(session, feed.id, entries) == 5
+    session.commit()
+    assert ingest_entries(session, feed.id, entries) == 0
+
+
+def test_new_entries_after_known_ones_oldest_first(session, feed):
+    # Flux listant les entrées du plus ancien au plus récent : les nouvelles sont à la fin
+    entries = [entry(f"https://example.com/{i}", published=1_700_000_000 + i) for i in range(5)]
+    assert ingest_entries(session, feed.id, entries) == 5
+    session.commit()
+    more = entries + [entry("https://example.com/5"), entry("https://example.com/6")]
+    assert ingest_entries(session, feed.id, more) == 2
+
+
+def test_anchors_on_one_page_are_distinct(session, feed):
+    entries = [entry(f"https://example.com/changelog#v1.{i}", title=f"v1.{i}") for i in range(3)]
+    assert ingest_entries(session, feed.id, entries) == 3
+
+
+def test_duplicates_within_one_document(session, feed):
+    rows = new_entries(session, feed.id, [
+        entry("https://example.com/a?utm_medium=email"),
+        entry("https://example.com/a"),
+        entry("https://example.com/b"),
+    ])
+    assert [r["link"] for r in rows] == ["https://example.com/a?utm_medium=email", "https://example.com/b"]
+
+
+def test_backfill_rekeys_links_with_fragment(session, feed):
+    # Articles hashés quand le fragment était retiré de la clé
+    old_key = link_hash("https://example.com/changelog")
+    session.add(Article(title="v1.0", content="", link="https://example.com/changelog#v1.0",
+                        feed_id=feed.id, link_hash=old_key, url_hash=old_key))
+    session.commit()
+    assert backfill_url_hashes() == 1
+    assert backfill_url_hashes() == 0
+    entries = [entry(f"https://example.com/changelog#v1.{i}", title=f"v1.{i}") for i in range(2)]
+    assert ingest_entries(session, feed.id, entries) == 1
+
+
+@pytest.mark.parametrize("returning", [True, False], ids=["returning", "reselect"])
+def test_bulk_insert_returns_only_inserted_ids(session, feed, monkeypatch, returning):
+    monkeypatch.setattr(database.engine.dialect, "insert_executemany_returning", returning)
+    known = new_entries(session, feed.id, [entry("https://example.com/a")])
+    assert len(bulk_insert_articles(session, known)) == 1
+    session.commit()
+    # Course avec un autre worker : la ligne déjà insérée perd le conflit
+    rows = known + new_entries(session, feed.id, [entry("https://example.com/b")])
+    ids = bulk_insert_articles(session, rows)
+    session.commit()
+    assert [session.get(Article, i).link for i in ids] == ["https://example.com/b"]
@@ -0,0 +1,84 @@
+import pytest
+
+from feed_parsing import InvalidFeed, UnsupportedFeed, parse_document, parse_fast, parse_with_feedparser
+
+BASE = "https://example.com/feed.xml"
+
+RSS = """<?xml version="1.0" encoding="utf-8"?>
+<rss version="2.0" xmlns:atom="http://www.w3.org/2005/Atom"
+     xmlns:sy="http://purl.org/rss/1.0/modules/syndication/"
+     xmlns:content="http://purl.org/rss/1.0/modules/content/">
+<channel>
+  <title>Blog</title>
+  <description>Les nouvelles</description>
+  <ttl>60</ttl>
+  <sy:updatePeriod>hourly</sy:updatePeriod>
+  <atom:link rel="hub" href="https://hub.example.com/"/>
+  <atom:link rel="self" href="https://example.com/feed.xml"/>
+  <item>
+    <title>Premier &amp; dernier</title>
+    <link>https://example.com/1</link>
+    <guid isPermaLink="false">tag:example.com,2024:1</guid>
+    <pubDate>Tue, 02 Jan 2024 10:00:00 +0100</pubDate>
+    <description>&lt;p&gt;Voir &lt;a href="/2"&gt;la suite&lt;/a&gt;&lt;script&gt;x()&lt;/script&gt;&lt;/p&gt;</description>
+  </item>
+  <item>
+    <title>Sans lien</title>
+    <guid>https://example.com/2</guid>
+    <pubDate>2024-01-03T08:00:00Z</pubDate>
+    <content:encoded><![CDATA[<b>gras</b>]]></content:encoded>
+  </item>
+  <item>
+    <link>https://example.com/3</link>
+    <description>Texte brut</description>
+  </item>
+</channel>
+</rss>""".encode("utf-8")
+
+ATOM = """<?xml version="1.0" encoding="utf-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+  <title>Carnet</title>
+  <subtitle>Notes</subtitle>
+  <link rel="self" href="https://example.com/atom.xml"/>
+  <link rel="hub" href="https://hub.example.com/"/>
+  <entry>
+    <title>Entrée</title>
+    <id>urn:uuid:1</id>
+    <link rel="alternate" href="https://example.com/e1"/>
+    <link rel="enclosure" href="https://example.com/e1.mp3"/>
+    <published>2024-01-02T10:00:00+02:00</published>
+    <updated>2024-01-05T10:00:00Z</updated>
+    <summary type="html">&lt;em&gt;court&lt;/em&gt;</summary>
+  </entry>
+  <entry>
+    <title>Mise à jour</title>
+    <id>urn:uuid:2</id>
+    <link href="https://example.com/e2"/>
+    <updated>2024-01-04T10:00:00Z</updated>
+    <content type="text">Contenu texte</content>
+  </entry>
+</feed>""".encode("utf-8")
+
+
+@pytest.mark.parametrize("document", [RSS, ATOM], ids=["rss", "atom"])
+def test_fast_parser_matches_feedparser(document):
+    assert parse_fast(document, BASE) == parse_with_feedparser(document, {"content-location": BASE})
+
+
+@pytest.mark.parametrize("document", [
+    # RSS 1.0 (RDF), liens relatifs, contenu xhtml : hors du chemin rapide
+    b'<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#" xmlns="http://purl.org/rss/1.0/">'
+    b'<channel><title>T</title></channel><item><title>A</title><link>https://example.com/a</link></item></rdf:RDF>',
+    b'<rss version="2.0"><channel><title>T</title><item><title>A</title><link>/a</link></item></channel></rss>',
+    b'<feed xmlns="http://www.w3.org/2005/Atom"><title>T</title><entry><title>A</title>'
+    b'<content type="xhtml"><div xmlns="http://www.w3.org/1999/xhtml"><p>x</p></div></content></entry></feed>',
+], ids=["rss1", "relative", "xhtml"])
+def test_unsupported_documents_fall_back(document):
+    with pytest.raises(UnsupportedFeed):
+        parse_fast(document, BASE)
+    assert parse_document(document, {"content-location": BASE}) == parse_with_feedparser(document, {"content-location": BASE})
+
+
+def test_invalid_document():
+    with pytest.raises(InvalidFeed):
+        parse_document(b"<html><body>Erreur 500</body></html>")
@@ -0,0 +1,148 @@
+from sqlmodel import select
+
+from feed_parsing import ParsedFeed
+import feed_sources
+from feed_sources import add_feed, add_feed_in_savepoint, backfill_sources, remove_feeds
+from ingestion import FetchResult, claim_feeds, link_hash
+from ingestion_pipeline import PipelineItem, _write
+from models import (
+    Article, ArticleReadFlag, ArticleStar, ArticleTombstone, Collection, CollectionMessage, Feed, User,
+)
+
+
+def collection(session, name: str) -> Collection:
+    user = User(username=name, email=f"{name}@example.com", password="x")
+    session.add(user)
+    session.commit()
+    col = Collection(name=name, user_id=user.id)
+    session.add(col)
+    session.commit()
+    return col
+
+
+def article(session, feed_id: int, path: str) -> Article:
+    link = f"https://example.com/{path}"
+    row = Article(title=path, content="", link=link, feed_id=feed_id, link_hash=link_hash(link))
+    session.add(row)
+    session.commit()
+    return row
+
+
+def test_backfill_merges_duplicate_sources(session):
+    first, second = collection(session, "alice"), collection(session, "bob")
+    # Flux antérieurs au partage : même URL à la casse près, chacun avec ses articles
+    keeper = Feed(url="https://example.com/feed.xml", collection_id=first.id)
+    duplicate = Feed(url="https://EXAMPLE.com/feed.xml", collection_id=second.id)
+    session.add_all([keeper, duplicate])
+    session.commit()
+    article(session, keeper.id, "a")
+    shared = article(session, keeper.id, "b")
+    copy = article(session, duplicate.id, "b")
+    article(session, duplicate.id, "c")
+    bob = second.user_id
+    session.add_all([
+        ArticleReadFlag(user_id=bob, article_id=copy.id),
+        ArticleStar(user_id=bob, article_id=copy.id),
+        CollectionMessage(collection_id=second.id, user_id=bob, message="!", message_type="comment", article_id=copy.id),
+        ArticleTombstone(feed_id=duplicate.id, link_hash=link_hash("https://example.com/old")),
+    ])
+    session.commit()
+
+    keeper_id, duplicate_id, shared_id, copy_id = keeper.id, duplicate.id, shared.id, copy.id
+    assert backfill_sources() == 1
+    session.expire_all()
+    assert session.get(Feed, keeper_id).source_url == "https://example.com/feed.xml"
+    assert session.get(Feed, duplicate_id).source_id == keeper_id
+    assert sorted(session.exec(select(Article.title).where(Article.feed_id == keeper_id)).all()) == ["a", "b", "c"]
+    assert session.get(Article, copy_id) is None
+    # Lu, favori et commentaire reportés sur l'exemplaire conservé
+    assert session.exec(select(ArticleReadFlag.article_id)).all() == [shared_id]
+    assert session.exec(select(ArticleStar.article_id)).all() == [shared_id]
+    assert session.exec(select(CollectionMessage.article_id)).all() == [shared_id]
+    assert session.exec(select(ArticleTombstone.feed_id)).all() == [keeper_id]
+
+    # Deuxième passage (chaque démarrage) : rien à faire
+    assert backfill_sources() == 0
+    assert len(session.exec(select(Article)).all()) == 3
+
+
+def test_unsubscribing_owner_promotes_next_subscription(session):
+    first, second, third = collection(session, "alice"), collection(session, "bob"), collection(session, "carol")
+    source = add_feed(session, "https://example.com/feed.xml", first.id, title="Flux")
+    source.etag = '"v1"'
+    session.commit()
+    bob = add_feed(session, "https://example.com/feed.xml", second.id)
+    carol = add_feed(session, "https://example.com/feed.xml", third.id)
+    session.commit()
+    assert (bob.source_id, bob.title) == (source.id, "Flux")
+    kept = article(session, source.id, "a")
+    session.add(ArticleTombstone(feed_id=source.id, link_hash=link_hash("https://example.com/old")))
+    session.commit()
+
+    remove_feeds(session, [source])
+    session.commit()
+    session.expire_all()
+    assert session.get(Feed, source.id) is None
+    promoted = session.get(Feed, bob.id)
+    assert promoted.source_id is None
+    assert promoted.source_url == "https://example.com/feed.xml"
+    assert promoted.etag == '"v1"'
+    assert session.get(Feed, carol.id).source_id == bob.id
+    assert session.get(Article, kept.id).feed_id == bob.id
+    assert session.exec(select(ArticleTombstone.feed_id)).all() == [bob.id]
+
+
+def test_removing_last_subscription_deletes_articles(session):
+    col = collection(session, "alice")
+    source = add_feed(session, "https://example.com/feed.xml", col.id)
+    session.commit()
+    article(session, source.id, "a")
+    session.add(ArticleTombstone(feed_id=source.id, link_hash=link_hash("https://example.com/old")))
+    session.commit()
+
+    remove_feeds(session, [source])
+    session.commit()
+    assert session.exec(select(Article)).all() == []
+    assert session.exec(select(ArticleTombstone)).all() == []
+
+
+def test_first_fetch_titles_waiting_subscriptions(session):
+    first, second = collection(session, "alice"), collection(session, "bob")
+    source = add_feed(session, "https://example.com/feed.xml", first.id)
+    untitled = add_feed(session, "https://example.com/feed.xml", second.id)
+    named = add_feed(session, "https://example.com/feed.xml", second.id, title="Le mien")
+    session.commit()
+    ids = (source.id, untitled.id, named.id)
+
+    row = claim_feeds(session, "test", [source.id], 600)[0]
+    item = PipelineItem(feed=row, result=FetchResult(feed_id=row.id, url=row.url, status=200))
+    item.parsed = ParsedFeed(title="Blog", description="Les nouvelles", meta={}, entries=[])
+    _write(item, session)
+    session.commit()
+    session.expire_all()
+    assert [session.get(Feed, i).title for i in ids] == ["Blog", "Blog", "Le mien"]
+    assert session.get(Feed, ids[1]).description == "Les nouvelles"
+
+
+def test_savepoint_add_attaches_to_concurrent_source(session, monkeypatch):
+    first, second = collection(session, "alice"), collection(session, "bob")
+    source = add_feed(session, "https://example.com/feed.xml", first.id)
+    session.commit()
+    earlier = add_feed_in_savepoint(session, "https://example.com/other.xml", second.id)
+
+    # Source créée par une autre requête, pas encore visible lors de la recherche
+    real_find = feed_sources.find_source
+    calls = []
+
+    def find_source(s, url):
+        calls.append(url)
+        return None if len(calls) == 1 else real_find(s, url)
+
+    monkeypatch.setattr(feed_sources, "find_source", find_source)
+    imported = add_feed_in_savepoint(session, "https://example.com/feed.xml", second.id)
+    session.commit()
+
+    assert len(calls) == 2
+    assert imported.source_id == source.id
+    # Les ajouts précédents de la même transaction sont conservés
+    assert session.get(Feed, earlier.id).source_url == "https://example.com/other.xml"
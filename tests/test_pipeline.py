@@ -0,0 +1,82 @@
+import queue
+from types import SimpleNamespace
+
+from sqlalchemy import text
+from sqlmodel import select
+
+import ingestion_pipeline
+from feed_parsing import ParsedEntry, ParsedFeed
+from ingestion import FetchResult, claim_feeds, new_entries
+from ingestion_pipeline import PipelineItem, StageMetrics, _Stage, _WriteStage
+from models import Article, Feed
+
+
+def item(feed_id: int) -> PipelineItem:
+    return PipelineItem(feed=SimpleNamespace(id=feed_id), result=FetchResult(feed_id=feed_id, url=f"https://example.com/{feed_id}.xml"))
+
+
+def test_stage_rolls_back_after_error(session):
+    seen = []
+
+    def fn(it: PipelineItem, db) -> PipelineItem:
+        seen.append(db.in_transaction())
+        db.exec(text("SELECT 1"))
+        if it.feed.id == 1:
+            raise RuntimeError("boum")
+        db.rollback()
+        return it
+
+    inbox, outbox = queue.Queue(), queue.Queue()
+    stage = _Stage(fn, 1, inbox, outbox, StageMetrics("test", 1), uses_db=True)
+    stage.start()
+    for feed_id in (1, 2):
+        inbox.put(item(feed_id))
+    stage.close()
+
+    # Le flux suivant repart d'une session sans transaction en cours
+    assert seen == [False, False]
+    assert stage.metrics.errors == 1
+    results = [outbox.get() for _ in range(2)]
+    assert results[0].result.error == "RuntimeError: boum"
+    assert results[1].result.error is None
+
+
+def test_failed_write_replays_rest_of_chunk(session, feed, monkeypatch):
+    others = [Feed(url=f"https://example.com/{i}.xml", collection_id=feed.collection_id) for i in range(2)]
+    session.add_all(others)
+    session.commit()
+    ids = [feed.id] + [f.id for f in others]
+    rows = claim_feeds(session, "test", ids, 600)
+    items = []
+    for row in rows:
+        entries = [ParsedEntry(title="t", link=f"https://example.com/{row.id}/a", summary="", guid=None, published=None)]
+        it = PipelineItem(feed=row, result=FetchResult(feed_id=row.id, url=row.url, status=200))
+        it.parsed = ParsedFeed(title=None, description=None, meta={}, entries=entries)
+        it.rows = new_entries(session, row.id, entries)
+        items.append(it)
+    session.rollback()
+
+    real_write = ingestion_pipeline._write
+
+    def write(it: PipelineItem, db) -> PipelineItem:
+        real_write(it, db)  # articles écrits dans la transaction du lot...
+        if it.feed.id == ids[1]:
+            raise RuntimeError("boum")  # ... puis échec : tout le lot est annulé
+        return it
+
+    monkeypatch.setattr(ingestion_pipeline, "_write", write)
+    done = []
+    inbox = queue.Queue()
+    stage = _WriteStage(None, 1, inbox, None, StageMetrics("write", 1), on_item=lambda it, err: done.append((it, err)))
+    stage.start()
+    for it in items:
+        inbox.put(it)
+    stage.close()
+
+    assert len(done) == 3
+    assert {it.feed.id: it.inserted for it, _ in done} == {ids[0]: 1, ids[1]: 0, ids[2]: 1}
+    assert [it.feed.id for it, err in done if err is not None] == [ids[1]]
+    # Le flux en échec n'a rien écrit ; les autres flux du lot ont été rejoués
+    assert sorted(session.exec(select(Article.feed_id)).all()) == [ids[0], ids[2]]
+    leased = session.exec(select(Feed.id).where(Feed.lease_owner.is_not(None))).all()
+    assert leased == [ids[1]]
@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta
+
+from sqlmodel import select
+
+import retention
+from feed_parsing import ParsedEntry
+from ingestion import ingest_entries
+from models import Article, Collection, Feed
+from retention import RetentionPolicy, prune_articles
+
+
+def test_merge_keeps_loosest_limit():
+    merged = RetentionPolicy(max_age_days=30, max_per_feed=100).merge(RetentionPolicy(max_age_days=90, max_per_feed=50))
+    assert merged == RetentionPolicy(max_age_days=90, max_per_feed=100)
+
+
+def test_merge_without_limit_wins():
+    merged = RetentionPolicy(max_age_days=30, max_per_feed=100).merge(RetentionPolicy(max_age_days=0, max_per_feed=200))
+    assert merged == RetentionPolicy(max_age_days=0, max_per_feed=200)
+    assert RetentionPolicy(max_per_feed=10).merge(RetentionPolicy()).unlimited
+
+
+def test_shared_source_follows_loosest_collection(session, feed, monkeypatch):
+    monkeypatch.setattr(retention, "PRUNE_PAUSE", 0)
+    strict = session.get(Collection, feed.collection_id)
+    strict.retention_days = 7
+    loose = Collection(name="Autre", user_id=strict.user_id, retention_days=30)
+    session.add_all([strict, loose])
+    session.commit()
+    # Abonnement de la seconde collection à la même source
+    session.add(Feed(url=feed.url, collection_id=loose.id, source_id=feed.id))
+    now = datetime.utcnow()
+    for days in (1, 10, 60):
+        session.add(Article(title=f"{days} j", content="", link=f"https://example.com/{days}",
+                            feed_id=feed.id, fetched_at=now - timedelta(days=days)))
+    session.commit()
+
+    assert prune_articles(now) == 1
+    assert set(session.exec(select(Article.title)).all()) == {"1 j", "10 j"}
+
+
+def test_pruned_entries_are_not_reinserted(session, feed, monkeypatch):
+    monkeypatch.setattr(retention, "PRUNE_PAUSE", 0)
+    collection = session.get(Collection, feed.collection_id)
+    collection.retention_max_per_feed = 2
+    session.add(collection)
+    session.commit()
+    entries = [ParsedEntry(title=str(i), link=f"https://example.com/{i}", summary="", guid=None, published=None)
+               for i in range(5)]
+    assert ingest_entries(session, feed.id, entries) == 5
+    session.commit()
+
+    assert prune_articles() == 3
+    # Même document au rafraîchissement suivant : rien de nouveau
+    assert ingest_entries(session, feed.id, entries) == 0
+    more = entries + [ParsedEntry(title="5", link="https://example.com/5", summary="", guid=None, published=None)]
+    assert ingest_entries(session, feed.id, more) == 1
@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import feed_scheduling
+from feed_scheduling import (
+    MAX_BACKOFF, QUARANTINE_AFTER, QUARANTINE_INTERVAL, health_status, schedule_failure,
+)
+
+NOW = datetime(2026, 1, 1)
+
+
+@pytest.fixture(autouse=True)
+def no_jitter(monkeypatch):
+    monkeypatch.setattr(feed_scheduling, "jittered", lambda seconds: seconds)
+
+
+def delay(schedule) -> float:
+    return (schedule["next_fetch_at"] - NOW).total_seconds()
+
+
+def test_backoff_doubles_until_cap():
+    first = schedule_failure(600, 0, {}, NOW)
+    assert first["consecutive_failures"] == 1
+    assert delay(first) == 1200
+    assert delay(schedule_failure(600, 1, {}, NOW)) == 2400
+    assert delay(schedule_failure(600, QUARANTINE_AFTER - 2, {}, NOW)) == MAX_BACKOFF
+
+
+def test_quarantine_after_consecutive_failures():
+    assert health_status(QUARANTINE_AFTER - 1) == "failing"
+    schedule = schedule_failure(600, QUARANTINE_AFTER - 1, {}, NOW)
+    assert schedule["consecutive_failures"] == QUARANTINE_AFTER
+    assert health_status(schedule["consecutive_failures"]) == "quarantined"
+    assert delay(schedule) == QUARANTINE_INTERVAL
+
+
+def test_retry_after_pushes_next_fetch():
+    schedule = schedule_failure(600, 0, {"retry-after": "7200"}, NOW)
+    assert schedule["next_fetch_at"] == NOW + timedelta(seconds=7200)
+    # Retry-After plus court que le backoff : ignoré
+    assert delay(schedule_failure(600, 0, {"retry-after": "60"}, NOW)) == 1200
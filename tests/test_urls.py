@@ -0,0 +1,47 @@
+from urls import canonical_url, normalize_feed_url, url_hash
+
+
+def test_canonical_url_variants():
+    canonical = "https://example.com/post"
+    for url in (
+        "http://example.com/post",
+        "https://EXAMPLE.com:443/post/",
+        "https://example.com/post#",
+        "https://example.com/post?utm_source=rss&utm_medium=feed",
+        " https://example.com/post?fbclid=abc ",
+    ):
+        assert canonical_url(url) == canonical, url
+
+
+def test_canonical_url_keeps_fragment():
+    # Entrées pointant vers des ancres d'une même page : articles distincts
+    assert canonical_url("http://example.com/changelog/?utm_source=rss#v1.0") == "https://example.com/changelog#v1.0"
+    assert url_hash("https://example.com/changelog#v1.0") != url_hash("https://example.com/changelog#v1.1")
+
+
+def test_canonical_url_keeps_other_params():
+    assert canonical_url("https://example.com/p?id=2&utm_campaign=x&page=1") == "https://example.com/p?id=2&page=1"
+    assert canonical_url("https://example.com/p?id=2") != canonical_url("https://example.com/p?id=3")
+
+
+def test_canonical_url_unwraps_redirects():
+    wrapped = "https://www.google.com/url?q=https%3A%2F%2Fexample.com%2Fpost%3Futm_source%3Dg&sa=t"
+    assert canonical_url(wrapped) == "https://example.com/post"
+    # Redirection dans une redirection
+    nested = "https://l.facebook.com/l.php?u=" + "https%3A%2F%2Fout.reddit.com%2F%3Furl%3Dhttps%253A%252F%252Fexample.com%252Fpost"
+    assert canonical_url(nested) == "https://example.com/post"
+
+
+def test_canonical_url_leaves_other_schemes():
+    assert canonical_url("mailto:someone@example.com") == "mailto:someone@example.com"
+    assert canonical_url("/relative/path") == "/relative/path"
+
+
+def test_url_hash():
+    assert url_hash("http://example.com/post/") == url_hash("https://example.com/post?utm_source=x")
+    assert len(url_hash("https://example.com/post")) == 40
+
+
+def test_normalize_feed_url_keeps_path_and_query():
+    assert normalize_feed_url("HTTP://Example.com:80") == "http://example.com/"
+    assert normalize_feed_url("https://example.com/feed/?format=rss#x") == "https://example.com/feed/?format=rss"
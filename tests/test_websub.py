@@ -0,0 +1,75 @@
+import hashlib
+import hmac
+from datetime import datetime, timedelta
+
+from sqlmodel import select
+
+from models import Article
+from websub import MAX_LEASE_SECONDS, _valid_signature, receive, verify_intent
+
+BODY = b"""<?xml version="1.0"?>
+<rss version="2.0"><channel><title>T</title>
+<item><title>Pousse</title><link>https://example.com/push</link></item>
+</channel></rss>"""
+
+
+def sign(secret: str, body: bytes, method: str = "sha256") -> str:
+    return f"{method}={hmac.new(secret.encode(), body, getattr(hashlib, method)).hexdigest()}"
+
+
+def test_valid_signature():
+    assert _valid_signature("secret", BODY, sign("secret", BODY))
+    assert _valid_signature("secret", BODY, sign("secret", BODY, "sha1"))
+
+
+def test_invalid_signature():
+    assert not _valid_signature("secret", BODY, sign("autre", BODY))
+    assert not _valid_signature("secret", BODY + b" ", sign("secret", BODY))
+    assert not _valid_signature("secret", BODY, "")
+    assert not _valid_signature("secret", BODY, sign("secret", BODY, "md5"))
+    # Abonnement sans secret : aucun contenu accepté
+    assert not _valid_signature(None, BODY, "sha256=")
+
+
+def test_receive_checks_signature(session, feed):
+    feed.websub_state = "active"
+    feed.websub_secret = "secret"
+    feed.websub_token = "jeton"
+    session.add(feed)
+    session.commit()
+
+    assert receive(feed.id, "jeton", BODY, {"x-hub-signature": sign("autre", BODY)}) == 0
+    assert receive(feed.id, "autre", BODY, {"x-hub-signature": sign("secret", BODY)}) == 0
+    assert session.exec(select(Article)).all() == []
+    assert receive(feed.id, "jeton", BODY, {"x-hub-signature": sign("secret", BODY)}) == 1
+    assert session.exec(select(Article.link)).all() == ["https://example.com/push"]
+
+
+def test_receive_ignores_invalid_document(session, feed):
+    feed.websub_state = "active"
+    feed.websub_secret = "secret"
+    feed.websub_token = "jeton"
+    session.add(feed)
+    session.commit()
+    garbage = b"<html><body>Erreur</body></html>"
+    assert receive(feed.id, "jeton", garbage, {"x-hub-signature": sign("secret", garbage)}) == 0
+
+
+def verification(topic: str, lease: str = "3600") -> dict:
+    return {"hub.mode": "subscribe", "hub.topic": topic, "hub.challenge": "défi", "hub.lease_seconds": lease}
+
+
+def test_verify_intent_requires_token_and_request(session, feed):
+    feed.websub_state = "pending"
+    feed.websub_token = "jeton"
+    session.add(feed)
+    session.commit()
+
+    assert verify_intent(feed.id, "autre", verification(feed.url)) is None
+    assert verify_intent(feed.id, "jeton", verification("https://example.com/autre.xml")) is None
+    assert verify_intent(feed.id, "jeton", verification(feed.url, "999999999")) == "défi"
+    session.refresh(feed)
+    assert feed.websub_state == "active"
+    assert feed.websub_expires_at <= datetime.utcnow() + timedelta(seconds=MAX_LEASE_SECONDS)
+    # Aucune demande en cours : une nouvelle vérification est refusée
+    assert verify_intent(feed.id, "jeton", verification(feed.url)) is None
@@ -0,0 +1,110 @@
+# urls.py
+"""
+Normalisation des URL :
+- normalize_feed_url : clé des sources de flux partagées (cf. feed_sources.py) ;
+- canonical_url / url_hash : identité d'un article, quelles que soient les
+  variantes de son lien (paramètres de suivi, http/https, slash final,
+  redirections connues). Sert au dédoublonnage à l'ingestion et au cache de
+  la vue lecture. Le fragment est gardé : des entrées peuvent pointer vers
+  des ancres d'une même page (changelog#v1.0, changelog#v1.1...).
+"""
+import hashlib
+from typing import Optional
+from urllib.parse import SplitResult, parse_qs, urlsplit, urlunsplit
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+# Paramètres de suivi (campagnes, clics, newsletters) : retirés de l'URL canonique
+_TRACKING_PREFIXES = ("utm_",)
+_TRACKING_PARAMS = {
+    "ref", "ref_src", "ref_url", "fbclid", "gclid", "dclid", "msclkid", "yclid", "twclid",
+    "igshid", "mc_cid", "mc_eid", "_hsenc", "_hsmi",
+}
+
+# Redirections connues : l'URL de destination est dans la requête, pas besoin de la suivre.
+# (hôte, chemin ou None pour tout chemin) -> paramètres candidats
+_REDIRECTS = {
+    ("www.google.com", "/url"): ("q", "url"),
+    ("google.com", "/url"): ("q", "url"),
+    ("l.facebook.com", "/l.php"): ("u",),
+    ("lm.facebook.com", "/l.php"): ("u",),
+    ("www.youtube.com", "/redirect"): ("q",),
+    ("t.umblr.com", "/redirect"): ("z",),
+    ("out.reddit.com", None): ("url",),
+    ("slack-redir.net", "/link"): ("url",),
+}
+_MAX_REDIRECTS = 3  # redirections imbriquées déroulées au plus
+
+
+def _netloc(parts: SplitResult, scheme: str) -> str:
+    """Hôte en minuscules, sans port par défaut (identifiants conservés)"""
+    userinfo, _, hostport = parts.netloc.rpartition("@")
+    netloc = hostport.lower()
+    try:
+        if parts.port is not None and _DEFAULT_PORTS.get(scheme) == parts.port:
+            netloc = netloc.rsplit(":", 1)[0]
+    except ValueError:  # port invalide : laissé tel quel
+        pass
+    return f"{userinfo}@{netloc}" if userinfo else netloc
+
+
+def normalize_feed_url(url: str) -> str:
+    """
+    Forme canonique d'une URL de flux : schéma et hôte en minuscules, sans
+    port par défaut ni fragment, chemin vide remplacé par "/". Le chemin et
+    la requête sont gardés tels quels : ils peuvent désigner des flux
+    différents.
+    """
+    url = url.strip()
+    parts = urlsplit(url)
+    if not parts.scheme or not parts.netloc:
+        return url
+    scheme = parts.scheme.lower()
+    return urlunsplit((scheme, _netloc(parts, scheme), parts.path or "/", parts.query, ""))
+
+
+def _redirect_target(parts: SplitResult) -> Optional[str]:
+    host = parts.hostname or ""
+    params = _REDIRECTS.get((host, parts.path)) or _REDIRECTS.get((host, None))
+    if not params:
+        return None
+    query = parse_qs(parts.query)
+    for name in params:
+        target = (query.get(name) or [""])[0].strip()
+        if target.lower().startswith(("http://", "https://")):
+            return target
+    return None
+
+
+def _is_tracking(param: str) -> bool:
+    key = param.split("=", 1)[0].lower()
+    return key in _TRACKING_PARAMS or key.startswith(_TRACKING_PREFIXES)
+
+
+def canonical_url(url: str) -> str:
+    """
+    Forme canonique d'un lien d'article : redirections connues déroulées,
+    https, hôte en minuscules sans port par défaut, sans slash final ni
+    paramètres de suivi. Les autres paramètres et le fragment restent dans
+    leur ordre et leur encodage d'origine. Sert de clé, pas d'adresse à
+    visiter.
+    """
+    url = url.strip()
+    for _ in range(_MAX_REDIRECTS):
+        target = _redirect_target(urlsplit(url))
+        if target is None:
+            break
+        url = target
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    if scheme not in _DEFAULT_PORTS or not parts.netloc:
+        return url
+    netloc = _netloc(parts, scheme)
+    path = parts.path.rstrip("/") or "/"
+    query = "&".join(p for p in parts.query.split("&") if p and not _is_tracking(p))
+    return urlunsplit(("https", netloc, path, query, parts.fragment))
+
+
+def url_hash(url: str) -> str:
+    """sha1 de l'URL canonique : colonne indexée Article.url_hash"""
+    return hashlib.sha1(canonical_url(url).encode("utf-8")).hexdigest()
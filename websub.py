@@ -0,0 +1,220 @@
+# websub.py
+"""
+Ingestion en push (WebSub / PubSubHubbub) pour les flux qui annoncent un
+hub : abonnement auprès du hub, vérification d'intention, réception des
+nouveautés. Les contenus poussés passent par le même dédoublonnage et la
+même insertion que le scheduler ; le polling de ces flux tombe alors à
+FEED_WEBSUB_POLL_INTERVAL (filet de sécurité).
+
+Désactivé tant que WEBSUB_CALLBACK_BASE (URL publique de l'API, joignable
+par les hubs) n'est pas renseigné.
+"""
+import os
+import hmac
+import hashlib
+import secrets
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+import httpx
+from sqlalchemy import or_
+from sqlmodel import Session, select
+
+from database import engine
+from models import Feed
+from ingestion import FETCH_TIMEOUT, USER_AGENT, ingest_entries
+from feed_parsing import InvalidFeed, parse_documents
+
+CALLBACK_BASE = os.getenv("WEBSUB_CALLBACK_BASE", "").rstrip("/")  # ex. https://suprss.example.com
+LEASE_SECONDS = int(os.getenv("WEBSUB_LEASE_SECONDS", str(10 * 86400)))  # durée demandée au hub
+MIN_LEASE_SECONDS = 60
+MAX_LEASE_SECONDS = 90 * 86400  # bail accordé par le hub ramené dans [MIN, MAX]
+RENEW_BEFORE = timedelta(days=1)  # renouvellement avant expiration
+RETRY_AFTER = timedelta(hours=6)  # nouvel essai après un abonnement refusé ou jamais confirmé
+RENEW_BATCH = 50  # abonnements (re)demandés par cycle
+ACTIVE_STATES = ("active", "renewing")  # renewing : renouvellement demandé, abonnement toujours valide
+
+
+def enabled() -> bool:
+    return bool(CALLBACK_BASE)
+
+
+def callback_url(feed: Feed) -> str:
+    """Callback public : le jeton (propre à l'abonnement) n'est connu que du hub"""
+    return f"{CALLBACK_BASE}/websub/callback/{feed.id}/{feed.websub_token}"
+
+
+# ========= Abonnement =========
+def _hub_request(feed: Feed, mode: str) -> None:
+    data = {
+        "hub.mode": mode,
+        "hub.topic": feed.websub_topic or feed.url,
+        "hub.callback": callback_url(feed),
+    }
+    if mode == "subscribe":
+        data["hub.lease_seconds"] = str(LEASE_SECONDS)
+        data["hub.secret"] = feed.websub_secret
+    r = httpx.post(feed.websub_hub, data=data, timeout=FETCH_TIMEOUT, headers={"User-Agent": USER_AGENT})
+    if r.status_code >= 400:
+        raise httpx.HTTPStatusError(f"Hub: HTTP {r.status_code}", request=r.request, response=r)
+
+
+def subscribe(session: Session, feed: Feed) -> str:
+    """
+    Demande l'abonnement au hub du flux. Le hub confirme ensuite de façon
+    asynchrone (GET sur le callback), d'où l'état intermédiaire "pending".
+    """
+    if not enabled():
+        raise RuntimeError("WebSub désactivé (WEBSUB_CALLBACK_BASE non défini)")
+    if not feed.websub_hub:
+        raise ValueError("Ce flux n'annonce pas de hub WebSub")
+    if feed.websub_state in ACTIVE_STATES and feed.websub_token:
+        # Renouvellement : l'abonnement en cours (secret, callback) reste valable d'ici la confirmation
+        feed.websub_state = "renewing"
+    else:
+        feed.websub_secret = secrets.token_hex(20)
+        feed.websub_token = secrets.token_urlsafe(24)
+        feed.websub_state = "pending"
+        # Sert de date de relance si le hub ne confirme jamais
+        feed.websub_expires_at = datetime.utcnow() + RETRY_AFTER
+    session.add(feed)
+    session.commit()
+    try:
+        _hub_request(feed, "subscribe")
+    except Exception as e:
+        if feed.websub_state == "pending":
+            feed.websub_state = "denied"
+        session.add(feed)
+        session.commit()
+        print(f"[WebSub] Abonnement refusé pour le flux {feed.id}: {e}")
+    return feed.websub_state
+
+
+def unsubscribe(feed: Feed) -> None:
+    """Désabonnement au mieux (suppression du flux) : une erreur du hub n'est pas bloquante"""
+    if not enabled() or not feed.websub_hub or feed.websub_state not in ("pending", *ACTIVE_STATES):
+        return
+    try:
+        _hub_request(feed, "unsubscribe")
+    except Exception as e:
+        print(f"[WebSub] Désabonnement impossible pour le flux {feed.id}: {e}")
+
+
+def renew_subscriptions() -> int:
+    """
+    Abonne les flux dont un hub a été découvert et renouvelle les abonnements
+    proches de l'expiration. Appelé à chaque cycle du scheduler.
+    """
+    if not enabled():
+        return 0
+    now = datetime.utcnow()
+    count = 0
+    with Session(engine) as session:
+        feeds = session.exec(
+            select(Feed)
+            .where(
+                Feed.websub_hub.is_not(None),
+                or_(
+                    Feed.websub_state.is_(None),
+                    Feed.websub_expires_at.is_(None),
+                    Feed.websub_expires_at < now + RENEW_BEFORE,
+                ),
+            )
+            .limit(RENEW_BATCH)
+        ).all()
+        for feed in feeds:
+            if feed.websub_state in ("pending", "denied", "renewing") and feed.websub_expires_at and feed.websub_expires_at > now:
+                continue  # en attente de confirmation ou refus récent
+            if feed.websub_state in ACTIVE_STATES and feed.websub_expires_at and feed.websub_expires_at <= now:
+                feed.websub_state = None  # expiré : nouvel abonnement complet
+            subscribe(session, feed)
+            count += 1
+    return count
+
+
+# ========= Callback =========
+def _lease_seconds(params: Dict[str, str]) -> int:
+    """Durée accordée par le hub, bornée (une valeur énorme ferait déborder timedelta)"""
+    try:
+        lease = int(params.get("hub.lease_seconds") or LEASE_SECONDS)
+    except (ValueError, OverflowError):
+        lease = LEASE_SECONDS
+    return min(max(lease, MIN_LEASE_SECONDS), MAX_LEASE_SECONDS)
+
+
+def _valid_token(feed: Feed, token: str) -> bool:
+    return bool(feed.websub_token) and hmac.compare_digest(feed.websub_token, token)
+
+
+def verify_intent(feed_id: int, token: str, params: Dict[str, str]) -> Optional[str]:
+    """
+    Vérification d'intention envoyée par le hub (GET sur le callback).
+    Retourne le challenge à renvoyer, ou None pour refuser.
+
+    Le callback est public : seules sont prises en compte les vérifications
+    qui présentent le jeton de l'abonnement et portent sur le bon topic, et
+    (abonnement, refus) sur une demande effectivement envoyée au hub.
+    """
+    mode = params.get("hub.mode")
+    topic = params.get("hub.topic")
+    with Session(engine) as session:
+        feed = session.get(Feed, feed_id)
+        if mode == "unsubscribe" and feed is None:
+            return params.get("hub.challenge")  # flux supprimé : on confirme
+        if feed is None or not _valid_token(feed, token) or topic != (feed.websub_topic or feed.url):
+            return None
+        if mode == "denied":
+            if feed.websub_state not in ("pending", "renewing"):
+                return None
+            feed.websub_state = "denied"
+            feed.websub_expires_at = datetime.utcnow() + RETRY_AFTER
+            session.add(feed)
+            session.commit()
+            return ""
+        if mode == "unsubscribe":
+            # Abonnement abandonné : on confirme
+            if feed.websub_state not in ("pending", *ACTIVE_STATES):
+                return params.get("hub.challenge")
+            return None
+        if mode != "subscribe" or feed.websub_state not in ("pending", "renewing"):
+            return None
+        feed.websub_state = "active"
+        feed.websub_expires_at = datetime.utcnow() + timedelta(seconds=_lease_seconds(params))
+        session.add(feed)
+        session.commit()
+    return params.get("hub.challenge")
+
+
+def _valid_signature(secret: Optional[str], body: bytes, signature: str) -> bool:
+    # X-Hub-Signature: sha1=..., sha256=... (HMAC du corps avec le secret de l'abonnement)
+    method, _, digest = signature.partition("=")
+    if not secret or method not in ("sha1", "sha256", "sha384", "sha512"):
+        return False
+    expected = hmac.new(secret.encode(), body, getattr(hashlib, method)).hexdigest()
+    return hmac.compare_digest(expected, digest.strip())
+
+
+def receive(feed_id: int, token: str, body: bytes, headers: Dict[str, str]) -> int:
+    """
+    Contenu poussé par le hub : parsé puis dédoublonné/inséré comme un
+    téléchargement. Retourne le nombre d'articles insérés (0 si la signature
+    est absente ou invalide : le hub ne doit pas le savoir, cf. spécification).
+    """
+    with Session(engine) as session:
+        feed = session.get(Feed, feed_id)
+        if feed is None or feed.websub_state not in ACTIVE_STATES or not _valid_token(feed, token):
+            return 0
+        if not _valid_signature(feed.websub_secret, body, headers.get("x-hub-signature", "")):
+            print(f"[WebSub] Signature invalide pour le flux {feed_id}")
+            return 0
+        try:
+            parsed = parse_documents([(body, {**headers, "content-location": feed.websub_topic or feed.url})])[0]
+        except InvalidFeed as e:
+            # Accusé de réception quand même : le hub réessaierait indéfiniment
+            print(f"[WebSub] Contenu invalide pour le flux {feed_id}: {e}")
+            return 0
+        inserted = ingest_entries(session, feed_id, parsed.entries)
+        feed.last_success_at = datetime.utcnow()
+        session.add(feed)
+        session.commit()
+    return inserted
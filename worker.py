@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Worker d'ingestion SUPRSS : rafraîchit les flux échus en boucle, sans
+servir l'API. On peut en lancer autant que nécessaire (conteneurs,
+machines) : les flux sont répartis par baux en base.
+
+    python worker.py
+
+Avec des workers dédiés, FEED_SCHEDULER_ENABLED=0 désactive le scheduler
+intégré aux processus de l'API.
+"""
+import os
+import sys
+import time
+
+from env_loader import load_env_smart
+
+try:
+    load_env_smart()
+except Exception as e:
+    print(f"Avertissement: Impossible de charger l'environnement: {e}")
+
+from database import create_db_and_tables
+from ingestion import backfill_link_hashes, backfill_published_at, backfill_url_hashes
+from ingestion_pipeline import WORKER_ID, refresh_due_feeds
+from feed_parsing import shutdown_pool
+import websub
+from feed_activity import ACTIVITY_INTERVAL, update_activity_scores
+from retention import PRUNE_INTERVAL, backfill_fetched_at, prune_articles
+from feed_sources import backfill_sources
+
+TICK = int(os.getenv("FEED_SCHEDULER_TICK", "60"))
+
+
+def main() -> int:
+    create_db_and_tables()
+    backfill_link_hashes()
+    backfill_url_hashes()
+    backfill_fetched_at()
+    backfill_published_at()
+    backfill_sources()
+    last_prune = 0.0
+    last_activity = 0.0
+    print(f"[Worker {WORKER_ID}] démarré (recherche des flux échus toutes les {TICK}s)")
+    try:
+        while True:
+            started = time.time()
+            if started - last_activity >= ACTIVITY_INTERVAL:
+                last_activity = started
+                try:
+                    update_activity_scores()
+                except Exception as e:
+                    print(f"[Worker {WORKER_ID}] Erreur pendant le calcul des priorités: {e}")
+            try:
+                metrics = refresh_due_feeds()
+                websub.renew_subscriptions()
+                if metrics.feeds:
+                    print(f"[Worker {WORKER_ID}] Flux traités: {metrics.feeds} "
+                          f"(304: {metrics.not_modified}, inchangés: {metrics.unchanged}), "
+                          f"articles insérés: {metrics.inserted}, durée: {metrics.wall_seconds:.1f}s")
+                if metrics.deferred:
+                    print(f"[Worker {WORKER_ID}] Budget du cycle dépassé : {metrics.deferred} flux reportés au cycle suivant")
+            except Exception as e:
+                print(f"[Worker {WORKER_ID}] Erreur pendant le cycle: {e}")
+            if time.time() - last_prune >= PRUNE_INTERVAL:
+                last_prune = time.time()
+                try:
+                    deleted = prune_articles()
+                    if deleted:
+                        print(f"[Worker {WORKER_ID}] Rétention : {deleted} articles supprimés")
+                except Exception as e:
+                    print(f"[Worker {WORKER_ID}] Erreur pendant la rétention: {e}")
+            time.sleep(max(TICK - (time.time() - started), 1))
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        shutdown_pool()
+
+
+if __name__ == "__main__":
+    sys.exit(main())